@@ -0,0 +1,149 @@
+import argparse
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from models.account import Account
+from schedule_image import execute, get_fan_out_platforms, has_failed
+from utils.account_loader import copy_account_for_run, get_account_names, load_accounts, parse_account, project_root
+from utils.cli_args import positive_int
+from utils.concurrency import ConcurrencyLimits, KeyedLocks
+from utils.rate_limit_ledger import RateLimitedError
+
+DEFAULT_WORKERS = 8
+# Parallel posts per platform, on top of the rate limits the apis report
+DEFAULT_PLATFORM_LIMITS = {"Twitter": 4, "Deviant": 4}
+
+SUCCEEDED = "ok"
+FAILED = "failed"
+RATE_LIMITED = "rate limited"
+
+
+class BatchJob(NamedTuple):
+    account_name: str
+    mode: str
+
+
+class BatchResult(NamedTuple):
+    job: BatchJob
+    status: str
+    message: str
+    seconds: float
+
+
+def parse_job(value: str) -> BatchJob:
+    account_name, separator, mode = value.partition(":")
+    if not separator or not account_name or not mode:
+        raise argparse.ArgumentTypeError(f"Expected account:mode, got '{value}'")
+    return BatchJob(account_name, mode)
+
+
+def parse_platform_limit(value: str) -> tuple:
+    platform, separator, limit = value.partition("=")
+    if not separator or not limit.isdigit() or int(limit) < 1:
+        raise argparse.ArgumentTypeError(f"Expected Platform=N, got '{value}'")
+    return platform, int(limit)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Posts for many accounts in a single process, accounts.yml is parsed once")
+    parser.add_argument("jobs", nargs="*", type=parse_job, help="account:mode pairs, eg: my_account:Twitter other_account:All")
+    parser.add_argument("--all-due", action="store_true", help="Run every platform whose schedule in accounts.yml is due")
+    parser.add_argument("--due-window", type=int, default=1, help="Minutes a schedule counts as due, match the interval of the timer (default: 1)")
+    parser.add_argument("--workers", type=positive_int, default=DEFAULT_WORKERS, help=f"Number of posts running at the same time (default: {DEFAULT_WORKERS})")
+    parser.add_argument(
+        "--platform-limit",
+        action="append",
+        type=parse_platform_limit,
+        default=[],
+        help="Maximum parallel posts for a platform, eg: Twitter=2. Can be repeated",
+    )
+    parser.add_argument("--accounts-path", default=project_root, help="Directory containing the accounts.yml file")
+    args = parser.parse_args()
+    if not args.jobs and not args.all_due:
+        parser.error("Provide account:mode pairs or --all-due")
+    return args
+
+
+def get_due_jobs(accounts: Dict[str, Account], now: datetime, window_minutes: int = 1) -> List[BatchJob]:
+    """One job per account and platform with a schedule matching a minute in the window ending at now"""
+    current_minute = now.replace(second=0, microsecond=0)
+    window_start = current_minute - timedelta(minutes=window_minutes)
+    return [
+        BatchJob(name, platform)
+        for name, account in accounts.items()
+        for platform, schedules in account.schedules.items()
+        if any(schedule.next_after(window_start) <= current_minute for schedule in schedules)
+    ]
+
+
+def load_batch_accounts(file_path: str, account_names: Optional[List[str]] = None) -> Dict[str, Account]:
+    known_names = get_account_names(file_path)
+    unknown = [name for name in account_names or [] if name not in known_names]
+    if unknown:
+        raise ValueError(f"Accounts {unknown} not known in list. Should be one of: {known_names}")
+
+    names = list(dict.fromkeys(account_names)) if account_names is not None else None
+    return {name: parse_account(config, []) for name, config in load_accounts(file_path, names).items()}
+
+
+def run_batch(
+    accounts: Dict[str, Account], jobs: List[BatchJob], workers: int = DEFAULT_WORKERS, platform_limits: Dict[str, int] = DEFAULT_PLATFORM_LIMITS
+) -> List[BatchResult]:
+    """
+    Runs execute for every job in a bounded thread pool and returns the results in the order of the jobs.
+    Posts of the same account run one after the other, they pick from and rename files in the same folders.
+    """
+    unknown = sorted({job.account_name for job in jobs if job.account_name not in accounts})
+    if unknown:
+        raise ValueError(f"Accounts {unknown} not known in list. Should be one of: {list(accounts.keys())}")
+
+    limits = ConcurrencyLimits(platform_limits)
+    account_locks = KeyedLocks()
+
+    def run(job: BatchJob) -> BatchResult:
+        account = accounts[job.account_name]
+        platforms = get_fan_out_platforms(account, job.mode) or [job.mode]
+        with account_locks.get(job.account_name), limits.acquire(platforms):
+            started = time.monotonic()
+            try:
+                result = execute(copy_account_for_run(account), job.mode)
+                status, message = (FAILED, "upload failed") if has_failed(result) else (SUCCEEDED, "")
+            except RateLimitedError as e:
+                status, message = RATE_LIMITED, str(e)
+            except Exception as e:
+                print(f"{job.mode} for {job.account_name} failed: {e}")
+                traceback.print_exc()
+                status, message = FAILED, str(e)
+            return BatchResult(job, status, message, time.monotonic() - started)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, jobs))
+
+
+def format_summary(results: List[BatchResult]) -> str:
+    lines = [
+        f"{result.job.account_name:<20} {result.job.mode:<10} {result.status:<12} {result.seconds:6.1f}s {result.message}".rstrip()
+        for result in results
+    ]
+    counts = {status: sum(1 for result in results if result.status == status) for status in [SUCCEEDED, FAILED, RATE_LIMITED]}
+    lines.append(f"{counts[SUCCEEDED]} succeeded, {counts[FAILED]} failed, {counts[RATE_LIMITED]} rate limited")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.all_due:
+        accounts = load_batch_accounts(args.accounts_path)
+        jobs = args.jobs + get_due_jobs(accounts, datetime.now(), args.due_window)
+    else:
+        accounts = load_batch_accounts(args.accounts_path, [job.account_name for job in args.jobs])
+        jobs = args.jobs
+
+    results = run_batch(accounts, jobs, args.workers, {**DEFAULT_PLATFORM_LIMITS, **dict(args.platform_limit)})
+    print(format_summary(results))
+    if any(result.status == FAILED for result in results):
+        sys.exit(1)
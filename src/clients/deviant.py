@@ -1,16 +1,18 @@
-import requests
-import tempfile
-from PIL import Image
-import os
+from typing import Optional
 
+from clients.http_session import get_session
+from deviant_utils.access_token_cache import cache_access_token, get_cached_access_token, invalidate_access_token
 from deviant_utils.deviant_refresh_token import write_token_to_file
-from deviant_utils.pick_resolution import get_optimal_resolution
+from utils.multipart import MultipartEncoder, MultipartFile
+from utils.prepared_upload import PreparedUpload, prepare_upload
+from utils.rate_limit_ledger import PLATFORM_WIDE, RateLimitedError, get_rate_limit_ledger
 from utils.text_utils import remove_duplicates
 from models.account import Account
 
 TOKEN_URL = "https://www.deviantart.com/oauth2/token"
 UPLOAD_URL = "https://www.deviantart.com/api/v1/oauth2/stash/submit"
 SUBMIT_URL = "https://www.deviantart.com/api/v1/oauth2/stash/publish"
+STASH_DELETE_URL = "https://www.deviantart.com/api/v1/oauth2/stash/delete"
 FOLDERS_URL = "https://www.deviantart.com/api/v1/oauth2/gallery/folders"
 GALLERY_ALL_URL = "https://www.deviantart.com/api/v1/oauth2/gallery/all"
 DEVIATION_EDIT_URL = "https://www.deviantart.com/api/v1/oauth2/deviation/edit/{deviationid}"
@@ -26,16 +28,25 @@ def truncate_caption(caption: str):
 
 class DeviantClient:
     account: Account
+    # The token of the last authorized request, replaced when the api rejects it so the next requests use the new one
+    access_token: Optional[str]
 
     def __init__(self, account: Account):
         if not account.deviant_config:
             raise RuntimeError("No Deviant config found")
 
         self.account = account
+        self.session = get_session(account)
+        self.access_token = None
 
-    def _obtain_access_token(self):
-        # Token endpoint URL
+    def _obtain_access_token(self, force_refresh=False):
+        # Reuses the cached access token while it is valid, otherwise does the refresh round trip
         config = self.account.deviant_config
+        if not force_refresh:
+            cached_access_token = get_cached_access_token(self.account.id, config.persist_access_token)
+            if cached_access_token:
+                self.access_token = cached_access_token
+                return cached_access_token
 
         data = {
             "grant_type": "refresh_token",
@@ -45,7 +56,7 @@ class DeviantClient:
         }
         print(data)
 
-        response = requests.post(TOKEN_URL, data=data)
+        response = self.session.post(TOKEN_URL, data=data)
 
         # Parse response JSON
         tokens = response.json()
@@ -58,29 +69,34 @@ class DeviantClient:
         print("Access token", new_access_token)
         print("Refresh token", new_refresh_token)
         write_token_to_file(self.account.id, new_refresh_token)
+        config.refresh_token = new_refresh_token
 
-        return new_access_token
+        if "expires_in" in tokens:
+            cache_access_token(self.account.id, new_access_token, tokens["expires_in"], config.persist_access_token)
 
-    def _strip_exif(self, image_path):
-        with Image.open(image_path) as img:
-            # Create a new image without EXIF data
-            data = list(img.getdata())
-            image_without_exif = Image.new(img.mode, img.size)
-            image_without_exif.putdata(data)
+        self.access_token = new_access_token
+        return new_access_token
 
-            # Create a temporary file to save the stripped image
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-                temp_filename = temp_file.name
-                image_without_exif.save(temp_filename, "JPEG")
+    def _request(self, method, url, access_token=None, **kwargs):
+        # Sends an authorized request, refreshing the access token once when the api no longer accepts it.
+        # A token passed in by the caller is superseded by the one this client refreshed since
+        access_token = self.access_token or access_token
+        if access_token is None:
+            access_token = self._obtain_access_token()
+            print(f"Authenticated {access_token}")
 
-        return temp_filename
+        headers = kwargs.pop("headers", {})
+        response = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {access_token}"}, **kwargs)
+        if response.status_code == 401:
+            print("Access token was rejected, refreshing")
+            invalidate_access_token(self.account.id, self.account.deviant_config.persist_access_token)
+            access_token = self._obtain_access_token(force_refresh=True)
+            response = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {access_token}"}, **kwargs)
+        return response
 
     def list_folders(self, username):
-        access_token = self._obtain_access_token()
-        print(f"Authenticated {access_token}")
         payload = {"username": username, "limit": 50}
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(FOLDERS_URL, params=payload, headers=headers)
+        response = self._request("get", FOLDERS_URL, params=payload)
         return response.json()
 
     def get_all_deviations(self, username, offset=0, limit=24, mature_content=True):
@@ -104,8 +120,7 @@ class DeviantClient:
             "limit": min(limit, 24),  # API max is 24
             "mature_content": "true" if mature_content else "false"
         }
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(GALLERY_ALL_URL, params=payload, headers=headers)
+        response = self._request("get", GALLERY_ALL_URL, access_token=access_token, params=payload)
         return response.json(), access_token
 
     def edit_deviation_resolution(self, deviationid, display_resolution=8, access_token=None):
@@ -115,22 +130,20 @@ class DeviantClient:
         Args:
             deviationid: The deviation ID to edit
             display_resolution: Resolution code (8=1920px, default: 8)
-            access_token: Optional access token to reuse (default: None, will obtain new one)
+            access_token: Optional access token to reuse (default: None, uses the cached one or obtains a new one)
 
         Returns:
             JSON response from the API
         """
-        if access_token is None:
-            access_token = self._obtain_access_token()
-            print(f"Authenticated {access_token}")
+        return self.send_deviation_resolution_edit(deviationid, display_resolution, access_token).json()
 
+    def send_deviation_resolution_edit(self, deviationid, display_resolution=8, access_token=None):
+        # Same as edit_deviation_resolution, but hands back the response so callers can act on 429s and Retry-After
         url = DEVIATION_EDIT_URL.format(deviationid=deviationid)
         payload = {
             "display_resolution": display_resolution
         }
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.post(url, data=payload, headers=headers)
-        return response.json()
+        return self._request("post", url, access_token=access_token, data=payload)
 
     def _get_gallery_ids(self):
         config = self.account.deviant_config
@@ -138,71 +151,111 @@ class DeviantClient:
             return remove_duplicates(config.premium_gallery_ids)
         return remove_duplicates(config.gallery_ids)
 
-    def schedule(self, image_path, caption, content_tags):
-        mature_content = "false" if self.account.nsfw is False else "true"
-        stripped_image_path = None
-        file_handle = None
+    def _mature_content(self):
+        return "false" if self.account.nsfw is False else "true"
+
+    def _submit_to_stash(self, caption, content_tags, upload: PreparedUpload):
+        upload_url = UPLOAD_URL
+        filename = upload.filename
+        all_tags = [tag.strip() for tag in content_tags.split(",")]
+        all_tags.extend(self.account.deviant_config.tags)
+        unique_tags = remove_duplicates(all_tags)
+        data = {
+            "title": truncate_caption(caption),
+            "artist_comments": "",
+            "mature_content": self._mature_content(),
+            "is_ai_generated": "true",
+            "tags[]": unique_tags,
+        }
+        # Strip EXIF data, the stripped bytes are sent as is. Large files are streamed instead of being read into memory
+        if upload.streamed:
+            body = MultipartEncoder(data, {"file": MultipartFile(filename, upload.stripped_size, upload.iter_stripped)})
+            print(f"streaming to {upload_url}, file: {filename} ({upload.stripped_size} bytes), data: {data}")
+            response = self._request("post", upload_url, data=body, headers={"Content-Type": body.content_type})
+        else:
+            stripped_image = upload.stripped_data
+            files = {"file": (filename, stripped_image)}
+            print(f"posting to {upload_url}, file: {filename} ({len(stripped_image)} bytes), data: {data}")
+            response = self._request("post", upload_url, files=files, data=data)
+        json = response.json()
+        print("Upload response", json)
+        # {'status': 'success', 'itemid': ---, 'stack': 'Sta.sh Uploads 90', 'stackid': ---}
+        return json
+
+    def _publish(self, itemid, caption, display_resolution):
         config = self.account.deviant_config
+        can_be_featured = config.featured and len(config.premium_gallery_ids) == 0
+
+        publish_data = {
+            "itemid": itemid,
+            "title": truncate_caption(caption),
+            "artist_comments": "",
+            "is_mature": self._mature_content(),
+            "is_ai_generated": "true",
+            "noai": "false",
+            "allow_free_download": "false",
+            "display_resolution": display_resolution,
+            "feature": "true" if can_be_featured else "false",
+            "galleryids[]": self._get_gallery_ids(),
+            # "mature_classification": DEVI_MATURE_CLASSIFICATION,
+        }
+        print("publish_data:", publish_data)
+        response = self._request("post", SUBMIT_URL, data=publish_data)
+        submit_response = response.json()
+        print("Submit response", submit_response)
+        return submit_response
+
+    def schedule(self, image_path, caption, content_tags, upload: Optional[PreparedUpload] = None):
+        # fail fast instead of uploading when deviantart is known to reject the publish
+        get_rate_limit_ledger().check(self.account.id, "Deviant", PLATFORM_WIDE)
+        try:
+            access_token = self._obtain_access_token()
+            print(f"Authenticated {access_token}")
+
+            if upload is None:
+                upload = prepare_upload(image_path, self.account)
 
+            json = self._submit_to_stash(caption, content_tags, upload)
+            return self._publish(json["itemid"], caption, upload.display_resolution)
+        except RateLimitedError:
+            raise
+        except Exception as e:
+            print(f"Error while attempting to upload to Deviant: {e}")
+            return False
+
+    def stage(self, image_path, caption, content_tags, upload: Optional[PreparedUpload] = None):
+        """Uploads the image to Sta.sh without publishing it, returns the itemid to publish later or False"""
         try:
             access_token = self._obtain_access_token()
             print(f"Authenticated {access_token}")
-            upload_url = UPLOAD_URL
-            headers = {"Authorization": f"Bearer {access_token}"}
-
-            # Strip EXIF data and get the path to the temporary file
-            stripped_image_path = self._strip_exif(image_path)
-
-            file_handle = open(stripped_image_path, "rb")
-            files = {"file": file_handle}
-            all_tags = [tag.strip() for tag in content_tags.split(",")]
-            all_tags.extend(self.account.deviant_config.tags)
-            unique_tags = remove_duplicates(all_tags)
-            data = {
-                "title": truncate_caption(caption),
-                "artist_comments": "",
-                "mature_content": mature_content,
-                "is_ai_generated": "true",
-                "tags[]": unique_tags,
-            }
-            print(f"posting to {upload_url}, headers: {headers}, files: {files}, data: {data}")
-            response = requests.post(upload_url, headers=headers, files=files, data=data)
+
+            if upload is None:
+                upload = prepare_upload(image_path, self.account)
+
+            return self._submit_to_stash(caption, content_tags, upload)["itemid"]
+        except RateLimitedError:
+            raise
+        except Exception as e:
+            print(f"Error while attempting to stage {image_path} on Deviant: {e}")
+            return False
+
+    def publish_staged(self, itemid, caption, display_resolution):
+        """Publishes an item staged earlier, the only call left at the scheduled time"""
+        try:
+            return self._publish(itemid, caption, display_resolution)
+        except RateLimitedError:
+            raise
+        except Exception as e:
+            print(f"Error while attempting to publish {itemid} to Deviant: {e}")
+            return False
+
+    def delete_staged(self, itemid) -> bool:
+        """Deletes an item staged earlier that will not be published, returns whether it was deleted"""
+        try:
+            response = self._request("post", STASH_DELETE_URL, data={"itemid": itemid})
             json = response.json()
-            print("Upload response", json)
-            # {'status': 'success', 'itemid': ---, 'stack': 'Sta.sh Uploads 90', 'stackid': ---}
-            can_be_featured = self.account.deviant_config.featured and len(config.premium_gallery_ids) == 0
-
-            publish_data = {
-                "itemid": json["itemid"],
-                "title": truncate_caption(caption),
-                "artist_comments": "",
-                "is_mature": mature_content,
-                "is_ai_generated": "true",
-                "noai": "false",
-                "allow_free_download": "false",
-                "display_resolution": get_optimal_resolution(image_path),
-                "feature": "true" if can_be_featured else "false",
-                "galleryids[]": self._get_gallery_ids(),
-                # "mature_classification": DEVI_MATURE_CLASSIFICATION,
-            }
-            print("publish_data:", publish_data)
-            response = requests.post(SUBMIT_URL, headers=headers, data=publish_data)
-            submit_response = response.json()
-            print("Submit response", submit_response)
-            return submit_response
+            print("Delete response", json)
+            return json.get("success") is True
         except Exception as e:
-            print(f"Error while attempting to upload to Deviant: {e}")
+            print(f"Error while attempting to delete {itemid} from Sta.sh: {e}")
             return False
-        finally:
-            # Close the file handle if it's open
-            if file_handle:
-                file_handle.close()
-
-            # Clean up the temporary file
-            if stripped_image_path and os.path.exists(stripped_image_path):
-                try:
-                    os.unlink(stripped_image_path)
-                    print(f"Removed temporary file: {stripped_image_path}")
-                except PermissionError:
-                    print(f"Unable to delete temporary file: {stripped_image_path}")
-                    print("You may need to delete this file manually.")
@@ -0,0 +1,106 @@
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from models.account import Account, HttpConfig
+from utils.rate_limit_ledger import get_rate_limit_ledger
+
+# A 429 is never retried by the adapter, the rate limit ledger records it and the caller defers the request
+TOO_MANY_REQUESTS = 429
+# Longer Retry-After waits (eg: of a 503) are left to the caller, a request never blocks its thread for minutes
+MAX_RETRY_AFTER_SECONDS = 30
+
+
+class PlatformRetry(Retry):
+    """
+    Retries idempotent requests on the configured statuses with exponential backoff (honouring Retry-After).
+    Uploads and publishes are POSTs, retrying those on a 5xx could post the same image twice, so they are not retried.
+    A 429 is not retried either: sleeping on it would hold the worker, while the rate limit ledger lets the caller defer the post.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if status_code == TOO_MANY_REQUESTS:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        return min(retry_after, MAX_RETRY_AFTER_SECONDS) if retry_after is not None else None
+
+
+class PooledSession(requests.Session):
+    """
+    Keep-alive session with a connection pool, the retry policy and a default timeout for every request.
+    Requests to a platform without rate limit budget fail fast, and the budget of every response is recorded in the ledger.
+    A 429 of a platform raises RateLimitedError as soon as it is recorded.
+    """
+
+    http_config: HttpConfig
+    account_id: Optional[str]
+
+    def __init__(self, http_config: HttpConfig, account_id: Optional[str] = None):
+        super().__init__()
+        self.http_config = http_config
+        self.account_id = account_id
+        if account_id is not None:
+            self.hooks["response"].append(self._record_rate_limit)
+
+        retry = PlatformRetry(
+            total=http_config.retries,
+            backoff_factor=http_config.backoff_factor,
+            status_forcelist=http_config.retry_statuses,
+            respect_retry_after_header=True,
+            # hand the last response back to the caller instead of raising, the clients inspect the json themselves
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=http_config.pool_maxsize, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def _record_rate_limit(self, response, *args, **kwargs):
+        get_rate_limit_ledger().record_response(self.account_id, response)
+
+    def request(self, method, url, **kwargs):
+        if self.account_id is not None:
+            get_rate_limit_ledger().check_url(self.account_id, url)
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.http_config.timeout
+        response = super().request(method, url, **kwargs)
+        if self.account_id is not None and response.status_code == TOO_MANY_REQUESTS:
+            rejection = get_rate_limit_ledger().get_rejection(self.account_id, response)
+            if rejection is not None:
+                raise rejection
+        return response
+
+    def close(self):
+        # tweepy.API closes its session after every call, which would drop the pooled connections of every other user
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+_sessions: Dict[str, PooledSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(account: Account) -> PooledSession:
+    """Returns the session shared by all clients of the account, it is recreated when the http config changed"""
+    with _sessions_lock:
+        session = _sessions.get(account.id)
+        if session is None or vars(session.http_config) != vars(account.http_config):
+            if session is not None:
+                session.shutdown()
+            session = PooledSession(account.http_config, account.id)
+            _sessions[account.id] = session
+        return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.shutdown()
+        _sessions.clear()
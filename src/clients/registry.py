@@ -0,0 +1,17 @@
+import importlib
+
+# Platform clients by mode, as (module, class name). Modules are only imported once a post for that platform is made,
+# so eg: a Deviant post does not pay for importing tweepy
+PLATFORM_CLIENTS = {
+    "Twitter": ("clients.twitter", "TwitterClient"),
+    "Deviant": ("clients.deviant", "DeviantClient"),
+    "Debug": ("clients.test", "TestClient"),
+}
+
+
+def get_client_class(mode: str):
+    if mode not in PLATFORM_CLIENTS:
+        raise ValueError(f"Mode {mode} not recognized")
+
+    module_name, class_name = PLATFORM_CLIENTS[mode]
+    return getattr(importlib.import_module(module_name), class_name)
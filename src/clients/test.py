@@ -7,7 +7,7 @@ class TestClient:
     def __init__(self, account: Account):
         self.account = account
 
-    def schedule(self, image_path, caption):
+    def schedule(self, image_path, caption, upload=None):
         print(f"Received in schedule args: {image_path}, {caption}")
         print(f"Provided account_id\n")
         print(self.account.id)
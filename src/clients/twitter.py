@@ -1,7 +1,11 @@
 import tweepy
 import random
+from typing import Optional
 
+from clients.http_session import get_session
 from models.account import Account, TwitterPlatformConfig
+from utils.prepared_upload import PreparedUpload
+from utils.rate_limit_ledger import RateLimitedError, get_rate_limit_ledger
 from utils.text_utils import to_cursive
 
 
@@ -22,25 +26,37 @@ def add_tags(caption: str, config: TwitterPlatformConfig):
 
 class TwitterClient:
     account: Account
+    _api_client: Optional[tweepy.Client]
+    _media_api_client: Optional[tweepy.API]
 
     def __init__(self, account: Account):
         if not account.twitter_config:
             raise RuntimeError("No Twitter config found")
         self.account = account
+        self._api_client = None
+        self._media_api_client = None
 
     def decorate_caption(self, caption):
         twitter_config = self.account.twitter_config
         return add_tags(caption=decorate_caption(caption, twitter_config), config=twitter_config)
 
-    def schedule(self, image_path, caption):
-        client = self.authenticate_api_client()
-        media_client = self.authenticate_media_api_client()
+    def schedule(self, image_path, caption, upload: Optional[PreparedUpload] = None):
+        # fail fast instead of uploading media for a tweet that would be rejected
+        ledger = get_rate_limit_ledger()
+        ledger.check(self.account.id, "Twitter")
+
+        if self._api_client is None:
+            self._api_client = self.authenticate_api_client()
+        if self._media_api_client is None:
+            self._media_api_client = self.authenticate_media_api_client()
+        client = self._api_client
+        media_client = self._media_api_client
 
         try:
             tweet_text = self.decorate_caption(caption)
             print(f"uploading: {image_path}")
             print(f"tweeting: {tweet_text}")
-            media_id = media_client.media_upload(filename=image_path).media_id_string
+            media_id = self._upload_media(media_client, image_path, upload)
             print(f"uploaded: {media_id}")
 
             print(f"tweeting: {tweet_text}")
@@ -50,25 +66,50 @@ class TwitterClient:
             print(f'https://twitter.com/user/status/{response.data["id"]}')
             return response
 
+        except tweepy.errors.TooManyRequests as e:
+            # the session recorded the exhausted budget, so the ledger knows when it resets
+            next_available_at = ledger.next_available_at(self.account.id, "Twitter")
+            if next_available_at is None:
+                print(f"Failed to tweet: {e}")
+                return False
+            raise RateLimitedError("Twitter", next_available_at) from e
+
         except tweepy.errors.TweepyException as e:
             print(f"Failed to tweet: {e}")
             return False
 
+    def _upload_media(self, media_client: tweepy.API, image_path, upload: Optional[PreparedUpload]) -> str:
+        if upload is None:
+            return media_client.media_upload(filename=image_path).media_id_string
+
+        # the prepared bytes are uploaded as is, so small files are not read from disk a second time,
+        # large ones go through the chunked upload which reads them one chunk at a time
+        with upload.open() as file:
+            if upload.streamed:
+                return media_client.media_upload(filename=image_path, file=file, chunked=True, media_category="tweet_image").media_id_string
+            return media_client.media_upload(filename=image_path, file=file).media_id_string
+
     def authenticate_media_api_client(self):
         twitter_config = self.account.twitter_config
 
         auth = tweepy.OAuthHandler(twitter_config.consumer_key, twitter_config.consumer_secret)
         auth.set_access_token(twitter_config.access_token, twitter_config.access_token_secret)
-        return tweepy.API(auth, wait_on_rate_limit=True)
+        # tweepy would sleep until the limit resets, the rate limit ledger lets the caller defer the post instead
+        media_client = tweepy.API(auth, wait_on_rate_limit=False)
+        # reuse the pooled connections of the account instead of a fresh session per client
+        media_client.session = get_session(self.account)
+        return media_client
 
     def authenticate_api_client(self):
         twitter_config = self.account.twitter_config
 
-        return tweepy.Client(
+        client = tweepy.Client(
             twitter_config.bearer_token,
             twitter_config.consumer_key,
             twitter_config.consumer_secret,
             twitter_config.access_token,
             twitter_config.access_token_secret,
-            wait_on_rate_limit=True,
+            wait_on_rate_limit=False,
         )
+        client.session = get_session(self.account)
+        return client
@@ -1,118 +1,311 @@
 import argparse
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional, Tuple
+
 from clients.deviant import DeviantClient
+from deviant_utils.gallery_checkpoint import clear_checkpoint, get_checkpoint_path, load_checkpoint, save_checkpoint
+from deviant_utils.gallery_mirror import GalleryMirror, get_mirror_path
 from utils.account_loader import select_account
+from utils.cli_args import non_negative_float, positive_float, positive_int
+from utils.rate_limit_ledger import RateLimitedError
+from utils.rate_limiter import TokenBucket
 from colorama import init, Fore
 
 init(autoreset=True)
 
-parser = argparse.ArgumentParser(
-    description="Fetch deviations from a DeviantArt user's gallery",
-    formatter_class=argparse.RawDescriptionHelpFormatter
-)
-parser.add_argument("account_id", help="Account ID to use for authentication")
-parser.add_argument("username", help="DeviantArt username to fetch deviations from")
-parser.add_argument("--offset", type=int, default=0, help="Starting position for pagination (default: 0)")
-parser.add_argument("--limit", type=int, default=24, help="Number of deviations to retrieve (max 24, default: 24)")
-parser.add_argument("--fix-resolution", action="store_true", help="Fix display resolution to 1920px for images wider than 1920px")
-parser.add_argument("--delay", type=float, default=1.0, help="Delay in seconds between edit requests (default: 1.0)")
-parser.add_argument("--num-iterations", type=int, default=1, help="Number of iterations to fetch and process (default: 1)")
-parser.add_argument("--iterations-delay", type=float, default=0.0, help="Delay in seconds between iterations (default: 0.0)")
-
-args = parser.parse_args()
-
-account = select_account(args.account_id)
-deviant_account_name = args.username
-offset = args.offset
-limit = args.limit
-
-print(f"Fetching deviations for account {deviant_account_name}")
-print(f"Offset: {offset}, Limit: {limit}, Iterations: {args.num_iterations}")
-print("\n")
-
-client = DeviantClient(account)
-
-# Track if we should exit early due to failure
-should_exit = False
-
-for iteration in range(args.num_iterations):
-    if should_exit:
-        break
-
-    if iteration > 0:
-        print(f"\n{'='*80}")
-        print(f"Iteration {iteration + 1}/{args.num_iterations}")
-        print(f"{'='*80}\n")
-
-    response, access_token = client.get_all_deviations(deviant_account_name, offset=offset, limit=limit)
-
-    if "results" in response:
-        print(f"Found {len(response['results'])} deviations:")
-
-        for idx, deviation in enumerate(response["results"], start=offset + 1):
-            title = deviation['title']
-            deviationid = deviation['deviationid']
-            url = deviation['url']
-            mature = deviation.get('is_mature', False)
-            published_date = "N/A"
-            published_time = deviation.get('published_time')
-            if published_time:
-                published_date = datetime.fromtimestamp(int(published_time)).strftime('%Y-%m-%d %H:%M:%S')
-            width = "N/A"
-            height = "N/A"
-            if 'content' in deviation:
-                content = deviation['content']
-                width = content.get('width', 'N/A')
-                height = content.get('height', 'N/A')
-            favs = 0
-            comments = 0
-            if 'stats' in deviation:
-                stats = deviation['stats']
-                favs = stats.get('favourites', 0)
-                comments = stats.get('comments', 0)
-
-            # Highlight width in red if greater than 1920
-            dimensions = f"{width}x{height}"
-            needs_fix = width != "N/A" and int(width) > 1920
-
-            if needs_fix:
-                dimensions = Fore.RED + dimensions + Fore.RESET
-
-            print(f"#{idx}: {deviationid}, {dimensions}, {published_date}, '{title}', {url}, {favs} favs, {comments} comments, Mature: {mature}")
-
-            if needs_fix:
-                # Fix resolution if flag is enabled
-                if args.fix_resolution:
-                    print(f"  Fixing resolution for {deviationid}...")
-                    result = client.edit_deviation_resolution(deviationid, display_resolution=8, access_token=access_token)
-                    if result.get('status') == 'success':
-                        print(Fore.GREEN + f"  ✓ Successfully set resolution to 1920px" + Fore.RESET)
-                    else:
-                        print(Fore.RED + f"  ✗ Failed to update: {result}" + Fore.RESET)
-                        print(Fore.RED + "Exiting early due to failure." + Fore.RESET)
-                        should_exit = True
-                        break
-
-                    # Add delay between requests to avoid rate limiting
-                    time.sleep(args.delay)
+MAX_DISPLAY_WIDTH = 1920
+# display_resolution code for 1920px
+DISPLAY_RESOLUTION_1920 = 8
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Fetch deviations from a DeviantArt user's gallery",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("account_id", help="Account ID to use for authentication")
+    parser.add_argument("username", help="DeviantArt username to fetch deviations from")
+    parser.add_argument("--offset", type=int, default=0, help="Starting position for pagination (default: 0)")
+    parser.add_argument("--limit", type=int, default=24, help="Number of deviations to retrieve (max 24, default: 24)")
+    parser.add_argument("--fix-resolution", action="store_true", help="Fix display resolution to 1920px for images wider than 1920px")
+    parser.add_argument("--delay", type=non_negative_float, default=1.0, help="Delay in seconds between edit requests (default: 1.0)")
+    parser.add_argument(
+        "--num-iterations",
+        type=int,
+        default=None,
+        help="Number of iterations to fetch and process (default: 1, with --pipelined: the whole gallery)",
+    )
+    parser.add_argument("--iterations-delay", type=non_negative_float, default=0.0, help="Delay in seconds between iterations (default: 0.0)")
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Prefetch the next page while the edits of the current page run concurrently, paced by an adaptive rate limit",
+    )
+    parser.add_argument("--workers", type=positive_int, default=4, help="Concurrent edit requests in pipelined mode (default: 4)")
+    parser.add_argument("--rate", type=positive_float, default=None, help="Edits per second in pipelined mode, slows down on 429 responses (default: 1 / delay)")
+    parser.add_argument("--resume", action="store_true", help="Continue a pipelined run from the offset of its last checkpoint")
+    args = parser.parse_args()
+    if args.pipelined and args.rate is None and args.delay == 0:
+        parser.error("--pipelined needs a --rate, or a positive --delay to derive it from")
+    return args
+
+
+def describe_deviation(deviation, idx) -> Tuple[str, bool]:
+    """Returns the line printed for the deviation, and whether its display resolution needs fixing"""
+    title = deviation['title']
+    deviationid = deviation['deviationid']
+    url = deviation['url']
+    mature = deviation.get('is_mature', False)
+    published_date = "N/A"
+    published_time = deviation.get('published_time')
+    if published_time:
+        published_date = datetime.fromtimestamp(int(published_time)).strftime('%Y-%m-%d %H:%M:%S')
+    width = "N/A"
+    height = "N/A"
+    if 'content' in deviation:
+        content = deviation['content']
+        width = content.get('width', 'N/A')
+        height = content.get('height', 'N/A')
+    favs = 0
+    comments = 0
+    if 'stats' in deviation:
+        stats = deviation['stats']
+        favs = stats.get('favourites', 0)
+        comments = stats.get('comments', 0)
+
+    # Highlight width in red if greater than 1920
+    dimensions = f"{width}x{height}"
+    needs_fix = width != "N/A" and int(width) > MAX_DISPLAY_WIDTH
+
+    if needs_fix:
+        dimensions = Fore.RED + dimensions + Fore.RESET
+
+    return f"#{idx}: {deviationid}, {dimensions}, {published_date}, '{title}', {url}, {favs} favs, {comments} comments, Mature: {mature}", needs_fix
+
+
+def edit_when_available(client: DeviantClient, deviationid, access_token):
+    # A 429 without Retry-After blocks the platform in the rate limit ledger for a while, wait for it instead of failing the edit
+    while True:
+        try:
+            return client.edit_deviation_resolution(deviationid, display_resolution=DISPLAY_RESOLUTION_1920, access_token=access_token)
+        except RateLimitedError as e:
+            print(Fore.YELLOW + f"  {e}, waiting" + Fore.RESET)
+            time.sleep(max(e.next_available_at.timestamp() - time.time(), 0))
+
+
+def run_serial(args, client: DeviantClient, mirror: Optional[GalleryMirror] = None):
+    deviant_account_name = args.username
+    offset = args.offset
+    limit = args.limit
+    num_iterations = args.num_iterations or 1
 
+    # Track if we should exit early due to failure
+    should_exit = False
+
+    for iteration in range(num_iterations):
         if should_exit:
             break
 
-        # Update offset for next iteration
-        if response.get('has_more'):
-            next_offset = response.get('next_offset', offset + limit)
-            print(f"\nMore deviations available. Next offset: {next_offset}")
-            offset = next_offset
+        if iteration > 0:
+            print(f"\n{'='*80}")
+            print(f"Iteration {iteration + 1}/{num_iterations}")
+            print(f"{'='*80}\n")
+
+        response, access_token = client.get_all_deviations(deviant_account_name, offset=offset, limit=limit)
+
+        if "results" in response:
+            print(f"Found {len(response['results'])} deviations:")
+
+            for idx, deviation in enumerate(response["results"], start=offset + 1):
+                deviationid = deviation['deviationid']
+                line, needs_fix = describe_deviation(deviation, idx)
+                print(line)
 
-            # Add delay between iterations if configured and not the last iteration
-            if args.iterations_delay > 0 and iteration < args.num_iterations - 1:
-                print(f"Waiting {args.iterations_delay} seconds before next iteration...")
-                time.sleep(args.iterations_delay)
+                if needs_fix:
+                    # Fix resolution if flag is enabled
+                    if args.fix_resolution:
+                        print(f"  Fixing resolution for {deviationid}...")
+                        result = edit_when_available(client, deviationid, access_token)
+                        if result.get('status') == 'success':
+                            print(Fore.GREEN + f"  ✓ Successfully set resolution to 1920px" + Fore.RESET)
+                            if mirror is not None:
+                                mirror.record_display_resolution(deviant_account_name, deviation, DISPLAY_RESOLUTION_1920)
+                        else:
+                            print(Fore.RED + f"  ✗ Failed to update: {result}" + Fore.RESET)
+                            print(Fore.RED + "Exiting early due to failure." + Fore.RESET)
+                            should_exit = True
+                            break
+
+                        # Add delay between requests to avoid rate limiting
+                        time.sleep(args.delay)
+
+            if should_exit:
+                break
+
+            # Update offset for next iteration
+            if response.get('has_more'):
+                next_offset = response.get('next_offset', offset + limit)
+                print(f"\nMore deviations available. Next offset: {next_offset}")
+                offset = next_offset
+
+                # Add delay between iterations if configured and not the last iteration
+                if args.iterations_delay > 0 and iteration < num_iterations - 1:
+                    print(f"Waiting {args.iterations_delay} seconds before next iteration...")
+                    time.sleep(args.iterations_delay)
+            else:
+                print("\nNo more deviations.")
+                break
         else:
-            print("\nNo more deviations.")
+            print(f"Error fetching deviations: {response}")
             break
+
+
+def fix_deviation(client: DeviantClient, deviationid, access_token, limiter: TokenBucket, max_attempts=5):
+    """
+    Edits the display resolution of a single deviation, backing off whenever the api responds with a 429.
+    While the rate limit ledger knows the budget is used up (eg: after a 429 of another worker), the edit waits for it to reset
+    """
+    result = None
+    attempts = 0
+    while attempts < max_attempts:
+        limiter.acquire()
+        try:
+            response = client.send_deviation_resolution_edit(deviationid, display_resolution=DISPLAY_RESOLUTION_1920, access_token=access_token)
+        except RateLimitedError as e:
+            wait = max(e.next_available_at.timestamp() - time.time(), 0)
+            if not e.rejected:
+                limiter.pause(wait)
+                print(Fore.YELLOW + f"  {e}, waiting before fixing {deviationid}" + Fore.RESET)
+                continue
+            attempts += 1
+            limiter.on_rate_limited(wait)
+            print(Fore.YELLOW + f"  Rate limited while fixing {deviationid}, slowing down to {limiter.rate:.2f} edits/s" + Fore.RESET)
+            result = {"status": "error", "error_description": str(e)}
+            continue
+
+        attempts += 1
+        limiter.on_success()
+        result = response.json()
+        return result.get('status') == 'success', result
+    return False, result
+
+
+def fix_resolutions_pipelined(
+    client: DeviantClient,
+    username: str,
+    offset: int,
+    limit: int,
+    limiter: TokenBucket,
+    workers: int,
+    checkpoint_path: str,
+    max_pages: Optional[int] = None,
+    mirror: Optional[GalleryMirror] = None,
+) -> bool:
+    """
+    Fixes the display resolution of the gallery page by page. The next page is fetched while the edits of the current
+    one run on a bounded pool, and the offset is checkpointed once every edit of a page has completed.
+    Fixed deviations are recorded in the mirror, so deviant_mirror.py does not edit them again.
+    Returns False when an edit failed.
+    """
+
+    def fetch_page(page_offset):
+        return client.get_all_deviations(username, offset=page_offset, limit=limit)
+
+    with ThreadPoolExecutor(max_workers=1) as page_pool, ThreadPoolExecutor(max_workers=workers) as edit_pool:
+        next_page = page_pool.submit(fetch_page, offset)
+        pages = 0
+
+        while next_page is not None:
+            response, access_token = next_page.result()
+            if "results" not in response:
+                print(f"Error fetching deviations: {response}")
+                return False
+
+            pages += 1
+            next_offset = response.get('next_offset', offset + limit)
+            has_more = response.get('has_more', False)
+            next_page = page_pool.submit(fetch_page, next_offset) if has_more and (max_pages is None or pages < max_pages) else None
+
+            print(f"Found {len(response['results'])} deviations at offset {offset}:")
+            edits = []
+            for idx, deviation in enumerate(response["results"], start=offset + 1):
+                line, needs_fix = describe_deviation(deviation, idx)
+                print(line)
+                if needs_fix:
+                    edits.append((deviation, edit_pool.submit(fix_deviation, client, deviation['deviationid'], access_token, limiter)))
+
+            failed = False
+            for deviation, edit in edits:
+                deviationid = deviation['deviationid']
+                try:
+                    success, result = edit.result()
+                except Exception as e:
+                    success, result = False, e
+                if success:
+                    print(Fore.GREEN + f"  ✓ {deviationid}: successfully set resolution to 1920px" + Fore.RESET)
+                    if mirror is not None:
+                        mirror.record_display_resolution(username, deviation, DISPLAY_RESOLUTION_1920)
+                else:
+                    print(Fore.RED + f"  ✗ {deviationid}: failed to update: {result}" + Fore.RESET)
+                    failed = True
+
+            if failed:
+                print(Fore.RED + f"Exiting early due to failure, resume from offset {offset}." + Fore.RESET)
+                if next_page is not None:
+                    next_page.cancel()
+                return False
+
+            if not has_more:
+                print("\nNo more deviations.")
+                clear_checkpoint(checkpoint_path)
+                return True
+
+            save_checkpoint(checkpoint_path, next_offset)
+            offset = next_offset
+
+    print(f"\nMore deviations available. Next offset: {offset}")
+    return True
+
+
+def run_pipelined(args, client: DeviantClient, mirror: Optional[GalleryMirror] = None):
+    checkpoint_path = get_checkpoint_path(client.account.id, args.username)
+    offset = args.offset
+    if args.resume:
+        checkpoint_offset = load_checkpoint(checkpoint_path)
+        if checkpoint_offset is not None:
+            print(f"Resuming from checkpoint at offset {checkpoint_offset}")
+            offset = checkpoint_offset
+
+    limiter = TokenBucket(args.rate or 1 / args.delay, capacity=args.workers)
+    fix_resolutions_pipelined(
+        client,
+        args.username,
+        offset=offset,
+        limit=args.limit,
+        limiter=limiter,
+        workers=args.workers,
+        checkpoint_path=checkpoint_path,
+        max_pages=args.num_iterations,
+        mirror=mirror,
+    )
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+
+    account = select_account(args.account_id)
+
+    print(f"Fetching deviations for account {args.username}")
+    print(f"Offset: {args.offset}, Limit: {args.limit}, Iterations: {args.num_iterations or ('all' if args.pipelined else 1)}")
+    print("\n")
+
+    client = DeviantClient(account)
+    mirror = GalleryMirror(get_mirror_path(account.id))
+
+    if args.pipelined and args.fix_resolution:
+        run_pipelined(args, client, mirror)
     else:
-        print(f"Error fetching deviations: {response}")
-        break
+        run_serial(args, client, mirror)
+    mirror.close()
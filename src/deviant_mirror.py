@@ -0,0 +1,92 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from clients.deviant import DeviantClient
+from deviant_gallery import DISPLAY_RESOLUTION_1920, MAX_DISPLAY_WIDTH, fix_deviation
+from deviant_utils.gallery_mirror import DEFAULT_STATS_MAX_AGE_SECONDS, GalleryMirror, MirroredDeviation, get_mirror_path
+from utils.account_loader import select_account
+from utils.cli_args import positive_float, positive_int
+from utils.rate_limiter import TokenBucket
+from colorama import init, Fore
+
+init(autoreset=True)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Keeps a local mirror of a DeviantArt gallery, and queries or fixes it without paging the api")
+    parser.add_argument("account_id", help="Account ID to use for authentication")
+    parser.add_argument("username", help="DeviantArt username of the gallery")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = subparsers.add_parser("sync", help="Fetch the deviations published since the last sync")
+    sync_parser.add_argument(
+        "--stats-max-age",
+        type=float,
+        default=DEFAULT_STATS_MAX_AGE_SECONDS / 3600,
+        help="Hours after which favourites and comments are refreshed with a full pass (default: 24)",
+    )
+    sync_parser.add_argument("--full", action="store_true", help="Page through the whole gallery, refreshing all stats")
+
+    subparsers.add_parser("needs-fix", help="List the deviations wider than 1920px that still need a resolution fix")
+
+    top_parser = subparsers.add_parser("top", help="List the most favourited deviations")
+    top_parser.add_argument("--limit", type=int, default=10, help="Number of deviations to list (default: 10)")
+
+    fix_parser = subparsers.add_parser("fix", help="Fix the display resolution of the deviations that need it")
+    fix_parser.add_argument("--workers", type=positive_int, default=4, help="Concurrent edit requests (default: 4)")
+    fix_parser.add_argument("--rate", type=positive_float, default=1.0, help="Edits per second, slows down on 429 responses (default: 1.0)")
+    return parser.parse_args()
+
+
+def describe(deviation: MirroredDeviation) -> str:
+    published_date = datetime.fromtimestamp(deviation.published_time).strftime("%Y-%m-%d %H:%M:%S") if deviation.published_time else "N/A"
+    return (
+        f"{deviation.deviationid}, {deviation.width}x{deviation.height}, {published_date}, '{deviation.title}', {deviation.url}, "
+        f"{deviation.favourites} favs, {deviation.comments} comments, Mature: {deviation.is_mature}"
+    )
+
+
+def fix_from_mirror(client: DeviantClient, mirror: GalleryMirror, username: str, limiter: TokenBucket, workers: int) -> int:
+    """Only calls the api for the deviations the mirror knows need fixing, returns the number of fixed deviations"""
+    deviations = mirror.needs_resolution_fix(username, max_width=MAX_DISPLAY_WIDTH, display_resolution=DISPLAY_RESOLUTION_1920)
+    print(f"{len(deviations)} deviations need a resolution fix")
+
+    fixed = 0
+    with ThreadPoolExecutor(max_workers=workers) as edit_pool:
+        edits = [(deviation, edit_pool.submit(fix_deviation, client, deviation.deviationid, None, limiter)) for deviation in deviations]
+        for deviation, edit in edits:
+            try:
+                success, result = edit.result()
+            except Exception as e:
+                success, result = False, e
+            if success:
+                mirror.set_display_resolution(deviation.deviationid, DISPLAY_RESOLUTION_1920)
+                fixed += 1
+                print(Fore.GREEN + f"  ✓ {deviation.deviationid}: successfully set resolution to 1920px" + Fore.RESET)
+            else:
+                print(Fore.RED + f"  ✗ {deviation.deviationid}: failed to update: {result}" + Fore.RESET)
+    return fixed
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    account = select_account(args.account_id)
+    mirror = GalleryMirror(get_mirror_path(account.id))
+
+    if args.command == "sync":
+        stats_max_age_seconds = 0 if args.full else args.stats_max_age * 3600
+        result = mirror.sync(DeviantClient(account), args.username, stats_max_age_seconds=stats_max_age_seconds)
+        print(f"Synced {result.fetched} deviations in {result.pages} pages ({'full' if result.full else 'incremental'})")
+    elif args.command == "needs-fix":
+        for deviation in mirror.needs_resolution_fix(args.username, max_width=MAX_DISPLAY_WIDTH, display_resolution=DISPLAY_RESOLUTION_1920):
+            print(describe(deviation))
+    elif args.command == "top":
+        for deviation in mirror.top_by_favourites(args.username, args.limit):
+            print(describe(deviation))
+    elif args.command == "fix":
+        limiter = TokenBucket(args.rate, capacity=args.workers)
+        fixed = fix_from_mirror(DeviantClient(account), mirror, args.username, limiter, args.workers)
+        print(f"Fixed {fixed} deviations")
+
+    mirror.close()
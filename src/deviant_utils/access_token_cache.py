@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+parent_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(parent_path, "..", ".."))
+ACCESS_TOKEN_CACHE_PATH = os.path.join(project_root, "access_token_cache")
+
+# Tokens this close to their expiry are refreshed rather than reused
+EXPIRY_MARGIN_SECONDS = 60
+
+
+class CachedAccessToken(NamedTuple):
+    access_token: str
+    expires_at: float
+
+
+_tokens: Dict[str, CachedAccessToken] = {}
+_lock = threading.Lock()
+
+
+def _get_cache_file_path(name):
+    return os.path.join(ACCESS_TOKEN_CACHE_PATH, f"{name}.json")
+
+
+def _read_from_file(name) -> Optional[CachedAccessToken]:
+    file_path = _get_cache_file_path(name)
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, "r") as file:
+            content = json.load(file)
+        return CachedAccessToken(content["access_token"], content["expires_at"])
+    except (ValueError, KeyError, OSError):
+        return None
+
+
+def _write_to_file(name, token: CachedAccessToken):
+    file_path = _get_cache_file_path(name)
+    # the access token grants full api access, keep it private to the user
+    file_descriptor = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(file_descriptor, "w") as file:
+        json.dump(token._asdict(), file)
+
+
+def get_cached_access_token(name, persist=False) -> Optional[str]:
+    """Returns the cached access token of the account, if it is still valid for a while"""
+    with _lock:
+        token = _tokens.get(name)
+        if token is None and persist:
+            token = _read_from_file(name)
+            if token is not None:
+                _tokens[name] = token
+
+    if token is not None and token.expires_at - EXPIRY_MARGIN_SECONDS > time.time():
+        return token.access_token
+    return None
+
+
+def cache_access_token(name, access_token, expires_in, persist=False):
+    token = CachedAccessToken(access_token, time.time() + float(expires_in))
+    with _lock:
+        _tokens[name] = token
+    if persist:
+        _write_to_file(name, token)
+
+
+def invalidate_access_token(name, persist=False):
+    with _lock:
+        _tokens.pop(name, None)
+    file_path = _get_cache_file_path(name)
+    if persist and os.path.exists(file_path):
+        os.unlink(file_path)
@@ -1,13 +1,12 @@
 import os
 
+parent_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(parent_path, "..", ".."))
+REFRESH_TOKEN_CACHE_PATH = os.path.join(project_root, "refresh_token_cache")
+
 
 def get_refresh_token(name):
-    current_script_path = os.path.abspath(__file__)
-    current_script_dir = os.path.dirname(current_script_path)
-    parent_path = os.path.abspath(os.path.join(current_script_dir, os.pardir))
-    project_root = os.path.join(parent_path, "..")
-    cache_path = os.path.join(project_root, "refresh_token_cache")
-    file_path = os.path.join(cache_path, name)
+    file_path = os.path.join(REFRESH_TOKEN_CACHE_PATH, name)
 
     if os.path.exists(file_path):
         return open(file_path, "r").read().replace("\n", "")  # in case of manual interference
@@ -15,12 +14,7 @@ def get_refresh_token(name):
 
 
 def write_token_to_file(name, refresh_token):
-    current_script_path = os.path.abspath(__file__)
-    current_script_dir = os.path.dirname(current_script_path)
-    parent_path = os.path.abspath(os.path.join(current_script_dir, os.pardir))
-    project_root = os.path.join(parent_path, "..")
-    cache_path = os.path.join(project_root, "refresh_token_cache")
-    file_path = os.path.join(cache_path, name)
+    file_path = os.path.join(REFRESH_TOKEN_CACHE_PATH, name)
 
     with open(file_path, "w") as file:
         file.write(refresh_token)
@@ -0,0 +1,33 @@
+import json
+import os
+from typing import Optional
+
+parent_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(parent_path, "..", ".."))
+CHECKPOINT_PATH = os.path.join(project_root, "gallery_checkpoints")
+
+
+def get_checkpoint_path(account_id: str, username: str) -> str:
+    return os.path.join(CHECKPOINT_PATH, f"{account_id}_{username}.json")
+
+
+def load_checkpoint(path: str) -> Optional[int]:
+    """Returns the offset up to which every deviation was processed, if a previous run was interrupted"""
+    try:
+        with open(path, "r") as file:
+            return json.load(file)["offset"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def save_checkpoint(path: str, offset: int):
+    # written to a temporary file first, so an interrupted write never leaves a corrupt checkpoint behind
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump({"offset": offset}, file)
+    os.replace(temporary_path, path)
+
+
+def clear_checkpoint(path: str):
+    if os.path.exists(path):
+        os.remove(path)
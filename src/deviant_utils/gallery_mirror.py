@@ -0,0 +1,193 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+parent_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(parent_path, "..", ".."))
+MIRROR_CACHE_PATH = os.path.join(project_root, "gallery_mirror_cache")
+
+PAGE_SIZE = 24
+# Favourites and comments change after publishing, they are refreshed with a full pass once this old
+DEFAULT_STATS_MAX_AGE_SECONDS = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deviations (
+    deviationid TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    title TEXT,
+    url TEXT,
+    width INTEGER,
+    height INTEGER,
+    published_time INTEGER,
+    is_mature INTEGER,
+    favourites INTEGER,
+    comments INTEGER,
+    display_resolution INTEGER,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deviations_published ON deviations (username, published_time);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    username TEXT PRIMARY KEY,
+    stats_synced_at REAL
+);
+"""
+
+COLUMNS = "deviationid, title, url, width, height, published_time, is_mature, favourites, comments, display_resolution"
+
+
+class MirroredDeviation(NamedTuple):
+    deviationid: str
+    title: str
+    url: str
+    width: Optional[int]
+    height: Optional[int]
+    published_time: Optional[int]
+    is_mature: bool
+    favourites: int
+    comments: int
+    # only known for deviations edited through the mirror or deviant_gallery.py, the gallery api does not return it
+    display_resolution: Optional[int]
+
+
+class SyncResult(NamedTuple):
+    fetched: int
+    pages: int
+    full: bool
+
+
+def _to_row(username: str, deviation, synced_at: float) -> tuple:
+    content = deviation.get("content", {})
+    stats = deviation.get("stats", {})
+    published_time = deviation.get("published_time")
+    return (
+        deviation["deviationid"],
+        username,
+        deviation.get("title"),
+        deviation.get("url"),
+        content.get("width"),
+        content.get("height"),
+        int(published_time) if published_time else None,
+        int(bool(deviation.get("is_mature", False))),
+        stats.get("favourites", 0),
+        stats.get("comments", 0),
+        synced_at,
+    )
+
+
+class GalleryMirror:
+    """
+    Local copy of the deviation metadata of DeviantArt galleries.
+    Syncing only pages through the gallery until it reaches deviations it already knows, unless the stats are due for a refresh.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def latest_published_time(self, username: str) -> Optional[int]:
+        with self._lock:
+            return self._connection.execute("SELECT MAX(published_time) FROM deviations WHERE username = ?", (username,)).fetchone()[0]
+
+    def _stats_synced_at(self, username: str) -> Optional[float]:
+        row = self._connection.execute("SELECT stats_synced_at FROM sync_state WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, client, username: str, stats_max_age_seconds: float = DEFAULT_STATS_MAX_AGE_SECONDS, now: Optional[float] = None) -> SyncResult:
+        """
+        Fetches the gallery newest first. An incremental sync stops at the first page reaching the last synced published_time,
+        a full sync (first run, or stats older than stats_max_age_seconds) pages through everything and drops deleted deviations.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            latest = self.latest_published_time(username)
+            stats_synced_at = self._stats_synced_at(username)
+            full = latest is None or stats_synced_at is None or now - stats_synced_at >= stats_max_age_seconds
+
+            offset = 0
+            fetched = 0
+            pages = 0
+            while True:
+                response, _ = client.get_all_deviations(username, offset=offset, limit=PAGE_SIZE)
+                if "results" not in response:
+                    raise RuntimeError(f"Error fetching deviations: {response}")
+
+                results = response["results"]
+                pages += 1
+                fetched += len(results)
+                self._upsert(username, results, now)
+
+                reached_synced = not full and any(int(deviation.get("published_time") or 0) <= latest for deviation in results)
+                if reached_synced or not response.get("has_more"):
+                    break
+                offset = response.get("next_offset", offset + len(results))
+
+            if full:
+                self._connection.execute("DELETE FROM deviations WHERE username = ? AND synced_at < ?", (username, now))
+                self._connection.execute(
+                    "INSERT INTO sync_state (username, stats_synced_at) VALUES (?, ?) "
+                    "ON CONFLICT (username) DO UPDATE SET stats_synced_at = excluded.stats_synced_at",
+                    (username, now),
+                )
+            self._connection.commit()
+            return SyncResult(fetched=fetched, pages=pages, full=full)
+
+    def _upsert(self, username: str, deviations, synced_at: float):
+        # display_resolution is left untouched, the api does not report it
+        self._connection.executemany(
+            """
+            INSERT INTO deviations (deviationid, username, title, url, width, height, published_time, is_mature, favourites, comments, synced_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (deviationid) DO UPDATE SET
+                title = excluded.title,
+                url = excluded.url,
+                width = excluded.width,
+                height = excluded.height,
+                published_time = excluded.published_time,
+                is_mature = excluded.is_mature,
+                favourites = excluded.favourites,
+                comments = excluded.comments,
+                synced_at = excluded.synced_at
+            """,
+            [_to_row(username, deviation, synced_at) for deviation in deviations],
+        )
+
+    def _query(self, sql: str, params: tuple) -> List[MirroredDeviation]:
+        with self._lock:
+            return [
+                MirroredDeviation(*row[:6], bool(row[6]), *row[7:])
+                for row in self._connection.execute(f"SELECT {COLUMNS} FROM deviations WHERE {sql}", params).fetchall()
+            ]
+
+    def needs_resolution_fix(self, username: str, max_width: int = 1920, display_resolution: int = 8) -> List[MirroredDeviation]:
+        """Deviations wider than max_width that were not yet set to the given display resolution"""
+        return self._query(
+            "username = ? AND width > ? AND (display_resolution IS NULL OR display_resolution != ?) ORDER BY published_time DESC",
+            (username, max_width, display_resolution),
+        )
+
+    def top_by_favourites(self, username: str, limit: int = 10) -> List[MirroredDeviation]:
+        return self._query("username = ? ORDER BY favourites DESC, published_time DESC LIMIT ?", (username, limit))
+
+    def set_display_resolution(self, deviationid: str, display_resolution: int):
+        with self._lock:
+            self._connection.execute("UPDATE deviations SET display_resolution = ? WHERE deviationid = ?", (display_resolution, deviationid))
+            self._connection.commit()
+
+    def record_display_resolution(self, username: str, deviation, display_resolution: int, now: Optional[float] = None):
+        """Records an edit made outside of the mirror, the deviation (as returned by the gallery api) is mirrored if it was not yet"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._upsert(username, [deviation], now)
+            self.set_display_resolution(deviation["deviationid"], display_resolution)
+
+
+def get_mirror_path(account_id: str) -> str:
+    return os.path.join(MIRROR_CACHE_PATH, f"{account_id}.sqlite3")
@@ -1,5 +1,3 @@
-from PIL import Image
-
 # https://www.deviantart.com/developers/console/stash/stash_publish/a799a5c0967dca14e854286df9746793
 # Display resolution mapping: 0=original, 1=400px, 2=600px, 3=800px, 4=900px, 5=1024px, 6=1280px, 7=1600px, 8=1920px
 
@@ -17,9 +15,13 @@ DISPLAY_RESOLUTIONS = [
 
 
 def get_optimal_resolution(image_path: str) -> int:
+    from PIL import Image
+
     with Image.open(image_path) as img:
-        width = img.width
+        return resolution_for_width(img.width)
+
 
+def resolution_for_width(width: int) -> int:
     if width >= 1920:
         return 8
 
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from models.account import Account
+from utils.constants import DEVI_POSTED, DEVI_QUEUED
+from utils.file_lock import file_lock, write_json_atomic
+from utils.metadata_backend import get_metadata_adjuster
+from utils.random_utils import pick_random
+
+parent_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(parent_path, "..", ".."))
+STASH_STATE_PATH = os.path.join(project_root, "stash_state")
+# A claim of a run that died before publishing the item expires, so a later run can publish it
+CLAIM_EXPIRY_SECONDS = 30 * 60
+
+
+class StagedItem(NamedTuple):
+    itemid: str
+    caption: str
+    display_resolution: int
+    # the file as it was staged, a staged item is discarded when the file changed since
+    size: int
+    mtime_ns: int
+    staged_at: float
+    # caption and content tags as they were staged, a sidecar edit does not change the file itself
+    metadata_hash: Optional[str] = None
+    # set while a run publishes (or deletes) the item, so no other run picks it
+    claimed_at: Optional[float] = None
+
+
+def get_metadata_hash(caption: str, content_tags: str) -> str:
+    return hashlib.sha256(json.dumps([caption, content_tags]).encode("utf-8")).hexdigest()
+
+
+class StashState:
+    """
+    Sta.sh items uploaded ahead of their publish time, by file path. Kept in a JSON file that is replaced atomically on
+    every change, under a lock file, so the staging command and scheduled runs can use it side by side.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, file_lock(f"{self.path}.lock"):
+            yield
+
+    def items(self) -> Dict[str, StagedItem]:
+        try:
+            with open(self.path, "r") as file:
+                return {path: StagedItem(**item) for path, item in json.load(file).items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, TypeError) as e:
+            print(f"Ignoring unreadable stash state {self.path}: {e}")
+            return {}
+
+    def _write(self, items: Dict[str, StagedItem]):
+        write_json_atomic(self.path, {path: item._asdict() for path, item in items.items()}, indent=2)
+
+    def add(self, file_path: str, itemid: str, caption: str, content_tags: str, display_resolution: int):
+        stat = os.stat(file_path)
+        metadata_hash = get_metadata_hash(caption, content_tags)
+        with self._locked():
+            items = self.items()
+            items[file_path] = StagedItem(itemid, caption, display_resolution, stat.st_size, stat.st_mtime_ns, time.time(), metadata_hash)
+            self._write(items)
+
+    def remove(self, file_path: str):
+        with self._locked():
+            items = self.items()
+            if items.pop(file_path, None) is not None:
+                self._write(items)
+
+    def claim(self, file_path: str) -> Optional[StagedItem]:
+        """Marks the item as taken by this run, returns None when it is gone or claimed by another run"""
+        now = time.time()
+        with self._locked():
+            items = self.items()
+            item = items.get(file_path)
+            if item is None or is_claimed(item, now):
+                return None
+            items[file_path] = item._replace(claimed_at=now)
+            self._write(items)
+            return items[file_path]
+
+    def release(self, file_path: str):
+        """Hands a claimed item back, eg: when its publish was deferred, so a later run can publish it"""
+        with self._locked():
+            items = self.items()
+            item = items.get(file_path)
+            if item is not None and item.claimed_at is not None:
+                items[file_path] = item._replace(claimed_at=None)
+                self._write(items)
+
+
+def get_stash_state_path(account_id: str) -> str:
+    return os.path.join(STASH_STATE_PATH, f"{account_id}.json")
+
+
+def is_claimed(item: StagedItem, now: float) -> bool:
+    return item.claimed_at is not None and now - item.claimed_at < CLAIM_EXPIRY_SECONDS
+
+
+def is_current(account: Account, file_path: str, item: StagedItem) -> bool:
+    # The file should still be queued, and unchanged since it was uploaded
+    filename = os.path.basename(file_path)
+    if DEVI_QUEUED not in filename or DEVI_POSTED in filename:
+        return False
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size != item.size or stat.st_mtime_ns != item.mtime_ns:
+        return False
+    # the caption and tags may be kept in a metadata sidecar, which is edited without touching the file
+    metadata = get_metadata_adjuster(account, file_path)
+    return item.metadata_hash == get_metadata_hash(metadata.get_caption(), metadata.get_content_tags())
+
+
+def pick_staged_item(
+    account: Account, state: StashState, discard: Callable[[str, StagedItem], None]
+) -> Optional[Tuple[str, StagedItem]]:
+    """
+    Claims a random staged file within the scheduler profiles of the account, items claimed by other runs are skipped.
+    Staged items that went stale are claimed and handed to discard, which deletes them from Sta.sh
+    """
+    now = time.time()
+    candidates = []
+    for file_path, item in state.items().items():
+        if is_claimed(item, now):
+            continue
+        if not is_current(account, file_path, item):
+            stale_item = state.claim(file_path)
+            if stale_item is not None:
+                print(f"Dropping stale staged item {item.itemid} for {file_path}")
+                discard(file_path, stale_item)
+        elif account.path_matcher.classify(file_path).included:
+            candidates.append(file_path)
+
+    # another run may claim the picked item first
+    while candidates:
+        file_path = pick_random(candidates)
+        item = state.claim(file_path)
+        if item is not None:
+            return file_path, item
+        candidates.remove(file_path)
+    return None
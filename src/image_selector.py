@@ -3,7 +3,7 @@ import random
 import os
 import subprocess
 import sys
-from typing import List
+from typing import Dict, List
 
 from PyQt5.QtCore import Qt, QSize, QTimer
 from PyQt5.QtWidgets import (
@@ -29,7 +29,7 @@ from clients.deviant import DeviantClient
 from clients.twitter import TwitterClient
 from utils.constants import DEVI_POSTED, DEVI_QUEUED, TWIT_POSTED, TWIT_QUEUED, POSTED_TAG_MAPPING, QUEUE_TAG_MAPPING
 from utils.file_utils import find_images_in_folders, rename_file_with_tags, replace_file_tag
-from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.metadata_backend import get_metadata_adjuster, save_posted_metadata
 from utils.account_loader import load_accounts, parse_account
 from models.account import Account
 
@@ -37,8 +37,9 @@ from models.account import Account
 def post_now(filename: str, mode: str, account: Account) -> str | bool:
     """Post an image immediately to the specified platform"""
     account.set_config_for(filename)
-    caption = ImageMetadataAdjuster(filename).get_caption() or ""
-    content_tags = ImageMetadataAdjuster(filename).get_content_tags() or ""
+    metadata = get_metadata_adjuster(account, filename)
+    caption = metadata.get_caption() or ""
+    content_tags = metadata.get_content_tags() or ""
 
     response = False
     if mode == "Twitter":
@@ -53,9 +54,9 @@ def post_now(filename: str, mode: str, account: Account) -> str | bool:
         new_filepath = replace_file_tag(filename, queue_tag, post_tag)
 
         # image adjuster currently hold a file reference which blocks editing the name
-        adjuster = ImageMetadataAdjuster(new_filepath)
+        adjuster = get_metadata_adjuster(account, new_filepath)
         adjuster.add_tags(mode)
-        adjuster.save()
+        save_posted_metadata(account, adjuster)
         return new_filepath
     return False
 
@@ -69,7 +70,8 @@ class SchedulerWidget(QWidget):
         self.main_window = main_window
 
         # load the list of images and save it as full paths
-        self._images: List[str] = find_images_in_folders(account, account.platforms, skip_queued=skip_queued)
+        mtimes: Dict[str, float] = {}
+        self._images: List[str] = find_images_in_folders(account, account.platforms, skip_queued=skip_queued, mtimes=mtimes)
 
         if len(self._images) == 0:
             # Don't raise error, just show empty message
@@ -78,7 +80,7 @@ class SchedulerWidget(QWidget):
         if sort == "random":
             random.shuffle(self._images)
         elif sort == "latest":
-            self._images.sort(key=lambda x: os.path.getmtime(x), reverse=True)
+            self._images.sort(key=lambda x: mtimes[x] if x in mtimes else os.path.getmtime(x), reverse=True)
         else:
             self._images.sort()
 
@@ -313,12 +315,14 @@ class SchedulerWidget(QWidget):
         # Resize the image when changed
         self.resize_image()
 
+        metadata = get_metadata_adjuster(self.account, image)
+
         # change the caption
-        caption = ImageMetadataAdjuster(image).get_caption() or ""
+        caption = metadata.get_caption() or ""
         self._caption.setText(caption)
 
         # change the tags
-        content_tags = ImageMetadataAdjuster(image).get_content_tags() or ""
+        content_tags = metadata.get_content_tags() or ""
         self._content_tags.setText(content_tags)
 
         # todo, can probably be done more elegant with mapping dicts
@@ -376,7 +380,7 @@ class SchedulerWidget(QWidget):
 
         caption = self._caption.text()
         content_tags = self._content_tags.text()
-        adjuster = ImageMetadataAdjuster(self._current_image)
+        adjuster = get_metadata_adjuster(self.account, self._current_image)
         adjuster.add_subject(caption)
         adjuster.set_content_tags(content_tags)
         adjuster.save()
@@ -0,0 +1,173 @@
+import argparse
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from batch_post import DEFAULT_PLATFORM_LIMITS, DEFAULT_WORKERS, get_due_jobs, load_batch_accounts, parse_platform_limit
+from models.account import Account
+from schedule_image import execute, get_fan_out_platforms, has_failed
+from utils.account_loader import copy_account_for_run, project_root
+from utils.cli_args import positive_int
+from utils.job_queue import DEFAULT_MAX_ATTEMPTS, HEARTBEAT_SECONDS, JOB_QUEUE_PATH, Job, JobQueue, get_worker_id, split_platforms
+from utils.rate_limit_ledger import RateLimitedError
+
+# How long an idle worker waits before looking for due jobs again
+POLL_SECONDS = 15
+
+
+def get_job_platforms(accounts: Dict[str, Account], account_name: str, mode: str) -> List[str]:
+    # Expands a fan out job to the platforms it posts to, like schedule_image does, so it counts against their limits
+    account = accounts.get(account_name)
+    platforms = get_fan_out_platforms(account, mode) if account is not None else None
+    return platforms if platforms is not None else split_platforms(account_name, mode)
+
+
+@contextmanager
+def keep_alive(queue: JobQueue, job: Job):
+    # Renews the lease of the job while it runs, a slow upload is not mistaken for a dead worker and posted twice
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            queue.heartbeat(job.id)
+
+    thread = threading.Thread(target=beat, name=f"job-heartbeat-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(queue: JobQueue, accounts: Dict[str, Account], job: Job):
+    print(f"[{datetime.now():%Y-%m-%d %H:%M}] Running job {job.id}: {job.platform} for {job.account_name} (attempt {job.attempts}/{job.max_attempts})")
+    account = accounts.get(job.account_name)
+    if account is None:
+        queue.fail(job.id, f"Account {job.account_name} not known in list", retry=False)
+        return
+
+    try:
+        with keep_alive(queue, job):
+            result = execute(copy_account_for_run(account), job.platform, job.file)
+    except RateLimitedError as e:
+        print(f"Job {job.id} deferred: {e}")
+        queue.defer(job.id, e.next_available_at.timestamp(), str(e))
+        return
+    except Exception as e:
+        print(f"Job {job.id} failed: {e}")
+        traceback.print_exc()
+        result, error = False, str(e)
+    else:
+        error = "upload failed"
+
+    if has_failed(result):
+        retry_at = queue.fail(job.id, error)
+        if retry_at is not None:
+            print(f"Job {job.id} is retried at {datetime.fromtimestamp(retry_at):%Y-%m-%d %H:%M}")
+    else:
+        queue.complete(job.id)
+
+
+def work(
+    queue: JobQueue,
+    accounts: Dict[str, Account],
+    workers: int = DEFAULT_WORKERS,
+    platform_limits: Dict[str, int] = DEFAULT_PLATFORM_LIMITS,
+    drain: bool = False,
+    stop: Optional[threading.Event] = None,
+):
+    """
+    Runs the due jobs of the queue in worker threads, until stopped or (when draining) no job can be claimed anymore.
+    Other worker processes can share the same queue, the account and platform limits are enforced on the queue itself.
+    """
+    stop = stop or threading.Event()
+
+    def loop():
+        worker_id = get_worker_id()
+        while not stop.is_set():
+            job = queue.claim(worker_id, platform_limits, lambda account_name, mode: get_job_platforms(accounts, account_name, mode))
+            if job is not None:
+                run_job(queue, accounts, job)
+            elif drain:
+                return
+            else:
+                stop.wait(POLL_SECONDS)
+
+    threads = [threading.Thread(target=loop, name=f"job-worker-{i}") for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Queues posts in a durable job queue and runs them with a pool of workers")
+    parser.add_argument("--accounts-path", default=project_root, help="Directory containing the accounts.yml file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="Queue a post")
+    enqueue_parser.add_argument("account", help="Account name matching the account(s) in the accounts.yml file")
+    enqueue_parser.add_argument("mode", help="Platform to post to, or a fan out mode like All")
+    enqueue_parser.add_argument("--file", default=None, help="Post this queued file instead of a random one")
+    enqueue_parser.add_argument("--delay", type=float, default=0, help="Minutes until the post is due (default: 0)")
+    enqueue_parser.add_argument("--priority", type=int, default=0, help="Higher priorities are posted first (default: 0)")
+    enqueue_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help=f"(default: {DEFAULT_MAX_ATTEMPTS})")
+
+    due_parser = subparsers.add_parser("enqueue-due", help="Queue a post for every schedule in accounts.yml that is due")
+    due_parser.add_argument("--due-window", type=int, default=1, help="Minutes a schedule counts as due, match the interval of the timer (default: 1)")
+
+    work_parser = subparsers.add_parser("work", help="Run the queued posts")
+    work_parser.add_argument("--workers", type=positive_int, default=DEFAULT_WORKERS, help=f"Number of posts running at the same time (default: {DEFAULT_WORKERS})")
+    work_parser.add_argument(
+        "--platform-limit",
+        action="append",
+        type=parse_platform_limit,
+        default=[],
+        help="Maximum parallel posts for a platform, eg: Twitter=2. Can be repeated",
+    )
+    work_parser.add_argument("--drain", action="store_true", help="Exit once no due job is left, instead of waiting for new ones")
+
+    list_parser = subparsers.add_parser("list", help="List the jobs")
+    list_parser.add_argument("--status", default=None, help="Only list jobs with this status (pending, running, done, failed)")
+
+    priority_parser = subparsers.add_parser("reprioritize", help="Change the priority of a pending job")
+    priority_parser.add_argument("job_id", type=int)
+    priority_parser.add_argument("priority", type=int)
+    return parser.parse_args()
+
+
+def describe(job: Job) -> str:
+    line = f"{job.id:>6} {job.status:<8} {job.account_name:<20} {job.platform:<10} due {datetime.fromtimestamp(job.due_at):%Y-%m-%d %H:%M}"
+    line += f" priority {job.priority} attempts {job.attempts}/{job.max_attempts}"
+    if job.file:
+        line += f" {job.file}"
+    if job.last_error:
+        line += f" ({job.last_error})"
+    return line
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    queue = JobQueue(JOB_QUEUE_PATH)
+
+    if args.command == "enqueue":
+        load_batch_accounts(args.accounts_path, [args.account])
+        job_id = queue.enqueue(args.account, args.mode, args.file, time.time() + args.delay * 60, args.priority, args.max_attempts)
+        print(f"Queued job {job_id}")
+    elif args.command == "enqueue-due":
+        for job in get_due_jobs(load_batch_accounts(args.accounts_path), datetime.now(), args.due_window):
+            print(f"Queued job {queue.enqueue(job.account_name, job.mode)}: {job.mode} for {job.account_name}")
+    elif args.command == "work":
+        work(queue, load_batch_accounts(args.accounts_path), args.workers, {**DEFAULT_PLATFORM_LIMITS, **dict(args.platform_limit)}, args.drain)
+    elif args.command == "list":
+        for job in queue.jobs(args.status):
+            print(describe(job))
+    elif args.command == "reprioritize":
+        if not queue.reprioritize(args.job_id, args.priority):
+            print(f"Job {args.job_id} is not pending")
+
+    queue.close()
@@ -0,0 +1,156 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from models.account import Account
+from utils.account_loader import select_account
+from utils.cli_args import positive_int
+from utils.exif_reader import read_xp_tags
+from utils.file_utils import iter_images_in_folders
+from utils.glob_utils import static_root
+from utils.image_metadata_adjuster import read_file_exif
+from utils.metadata_backend import SidecarMetadataAdjuster, get_sidecar_path
+from utils.metadata_cache import METADATA_STORE_PATH, FileKey, MetadataEntry, MetadataStore, get_file_key
+from utils.process_utils import lower_priority
+
+# Files per transaction, an interrupted run loses at most one batch of work
+DEFAULT_BATCH_SIZE = 500
+# Files handed to a worker process at once, reading a header is too cheap to send the files one by one
+READ_CHUNK_SIZE = 16
+
+
+class IndexResult(NamedTuple):
+    indexed: int
+    unchanged: int
+    failed: int
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Indexes the caption and tags of every image of an account, and queries the index")
+    parser.add_argument("account", help="Account name matching the account(s) in the accounts.yml file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="Index new and changed images, an interrupted run continues where it stopped")
+    index_parser.add_argument("--workers", type=positive_int, default=os.cpu_count(), help="Number of reader processes (default: one per cpu)")
+    index_parser.add_argument("--batch-size", type=positive_int, default=DEFAULT_BATCH_SIZE, help=f"Files per checkpoint (default: {DEFAULT_BATCH_SIZE})")
+
+    search_parser = subparsers.add_parser("search", help="List the images whose caption or content tags contain the text")
+    search_parser.add_argument("text")
+
+    subparsers.add_parser("untagged", help="List the images without content tags")
+
+    stats_parser = subparsers.add_parser("tag-stats", help="Count the images per content tag")
+    stats_parser.add_argument("--limit", type=int, default=50, help="Number of tags to list (default: 50)")
+
+    subparsers.add_parser("prune", help="Drop the entries of images that no longer exist")
+    return parser.parse_args()
+
+
+def get_roots(account: Account) -> List[str]:
+    return [static_root(directory_path) for directory_path in account.directory_paths]
+
+
+def decode_tags(path: str, tags: dict) -> Tuple[str, str, str]:
+    # UNDEFINED typed values come back as bytes, the adjuster expects the tuples piexif returns for the (usual) BYTE type
+    tags = {tag: tuple(value) if isinstance(value, bytes) else value for tag, value in tags.items()}
+    # fields kept in a metadata sidecar take precedence over the EXIF of the image
+    adjuster = SidecarMetadataAdjuster(path, exif={"0th": tags})
+    return adjuster.get_caption(), adjuster.get_keywords(), adjuster.get_content_tags()
+
+
+def extract_metadata(path: str) -> Optional[Tuple[FileKey, str, str, str]]:
+    """Reads the caption, keywords and content tags of one file in a worker process, only the header of a JPEG is read"""
+    try:
+        key = get_file_key(path)
+        if key is None:
+            return None
+        tags = read_xp_tags(path)
+        if tags is None:
+            tags = read_file_exif(path)["0th"]
+        return (key, *decode_tags(path, tags))
+    except (OSError, ValueError) as e:
+        print(f"Unable to read the metadata of {path}: {e}")
+        return None
+
+
+def iter_changed_files(store: MetadataStore, files: Iterable[str]) -> Iterator[str]:
+    # A metadata sidecar is edited without touching the images, files are read again when their directory's sidecar changed since
+    sidecar_mtimes: Dict[str, float] = {}
+
+    def get_sidecar_mtime(path: str) -> float:
+        sidecar_path = get_sidecar_path(path)
+        if sidecar_path not in sidecar_mtimes:
+            try:
+                sidecar_mtimes[sidecar_path] = os.path.getmtime(sidecar_path)
+            except OSError:
+                sidecar_mtimes[sidecar_path] = 0.0
+        return sidecar_mtimes[sidecar_path]
+
+    for file in files:
+        key = get_file_key(file)
+        if key is None:
+            continue
+        version = store.get_version(key.path)
+        if version is None or version[:2] != (key.mtime_ns, key.size) or get_sidecar_mtime(key.path) > version[2]:
+            yield file
+
+
+def iter_batches(items: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def build_index(account: Account, store: MetadataStore, workers: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE) -> IndexResult:
+    """
+    Stores the metadata of every new or changed image of the account, read on a process pool.
+    Every batch is committed on its own and unchanged files are skipped, so a stopped run can simply be started again
+    """
+    files = iter_images_in_folders(account, list(account.platforms), skip_queued=False, skip_posted=False)
+    indexed = failed = total = 0
+
+    def counted(files: Iterable[str]) -> Iterator[str]:
+        nonlocal total
+        for file in files:
+            total += 1
+            yield file
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=lower_priority) as executor:
+        for batch in iter_batches(iter_changed_files(store, counted(files)), batch_size):
+            results = list(executor.map(extract_metadata, batch, chunksize=READ_CHUNK_SIZE))
+            entries = [result for result in results if result is not None]
+            store.put_tags_many(entries)
+            indexed += len(entries)
+            failed += len(batch) - len(entries)
+            print(f"Indexed {indexed} images")
+    return IndexResult(indexed, total - indexed - failed, failed)
+
+
+def describe(entry: MetadataEntry) -> str:
+    return f"{entry.path}: {entry.caption or '(no caption)'} [{entry.content_tags}]"
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    account = select_account(args.account)
+    store = MetadataStore(METADATA_STORE_PATH)
+    roots = get_roots(account)
+
+    if args.command == "index":
+        result = build_index(account, store, args.workers, args.batch_size)
+        print(f"Indexed {result.indexed} images, {result.unchanged} unchanged, {result.failed} failed")
+    elif args.command == "search":
+        for entry in store.search(args.text, roots):
+            print(describe(entry))
+    elif args.command == "untagged":
+        for entry in store.untagged(roots):
+            print(entry.path)
+    elif args.command == "tag-stats":
+        for tag, count in store.tag_stats(roots).most_common(args.limit):
+            print(f"{count:>8} {tag}")
+    elif args.command == "prune":
+        print(f"Removed {store.prune(roots)} entries")
+
+    store.close()
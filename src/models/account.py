@@ -1,8 +1,9 @@
-import fnmatch
 from typing import Dict, List, Optional
 from enum import Enum
 
 from deviant_utils.deviant_refresh_token import get_refresh_token
+from utils.cron import CronSchedule, parse_cron_expressions
+from utils.path_matcher import PathMatcher
 
 
 def get_directory_paths(config):
@@ -16,6 +17,31 @@ class SupportedPlatforms(Enum):
     DEVIANT = "deviant"
 
 
+class RenditionProfile:
+    """How images are resized and re-encoded before they are uploaded to a platform"""
+
+    max_dimension: Optional[int]
+    quality: int
+    progressive: bool
+    # 0 disables the cap, otherwise the quality is lowered until the rendition fits
+    max_bytes: int
+
+    def __init__(self, config):
+        self.max_dimension = config.get("max_dimension")
+        self.quality = config.get("quality", 90)
+        self.progressive = config.get("progressive", True)
+        self.max_bytes = config.get("max_bytes", 0)
+
+    @property
+    def key(self) -> str:
+        # identifies the renditions made with these settings in the rendition cache
+        return f"d{self.max_dimension or 0}-q{self.quality}-p{int(self.progressive)}-s{self.max_bytes}"
+
+
+def get_rendition_profile(config) -> Optional[RenditionProfile]:
+    return RenditionProfile(config["rendition"]) if "rendition" in config else None
+
+
 class PlatformConfig:
     def __init__(self, id, config):
         pass
@@ -34,6 +60,7 @@ class TwitterPlatformConfig(PlatformConfig):
     random_tag_count: int
     random_tags: List[str]
     fixed_tags: List[str]
+    rendition: Optional[RenditionProfile]
 
     DEFAULT_RANDOM_TAGS = [
         "#AIart",
@@ -59,6 +86,7 @@ class TwitterPlatformConfig(PlatformConfig):
         self.random_tag_count = config.get("random_tag_count", 2)
         self.random_tags = config.get("random_tags", self.DEFAULT_RANDOM_TAGS)
         self.fixed_tags = config.get("fixed_tags", [])
+        self.rendition = get_rendition_profile(config)
 
 
 class DeviantPlatformConfig(PlatformConfig):
@@ -66,10 +94,12 @@ class DeviantPlatformConfig(PlatformConfig):
     client_secret: str
     default_mature_classification: str
     refresh_token: str
+    persist_access_token: bool
     featured: bool
     gallery_ids: List[str]
     premium_gallery_ids: List[str]
     tags: List[str]
+    rendition: Optional[RenditionProfile]
 
     def __init__(self, id, config):
         self.id = id
@@ -77,18 +107,50 @@ class DeviantPlatformConfig(PlatformConfig):
         self.client_secret = config["client_secret"]
         self.default_mature_classification = config.get("mature_classification", "")
         self.refresh_token = get_refresh_token(id)
+        self.persist_access_token = config.get("persist_access_token", False)
         self.featured = config.get("featured", True)
         self.gallery_ids = config.get("gallery_ids", [])
         self.premium_gallery_ids = config.get("premium_gallery_ids", [])
         self.tags = config.get("tags", [])
+        self.rendition = get_rendition_profile(config)
 
 
-PLATFORM_CLASS_BY_NAME = {SupportedPlatforms.DEVIANT: DeviantPlatformConfig, SupportedPlatforms.TWITTER: TwitterPlatformConfig}
+class HttpConfig:
+    """Connection settings shared by the platform clients of an account"""
+
+    timeout: float
+    retries: int
+    backoff_factor: float
+    retry_statuses: List[int]
+    pool_maxsize: int
+
+    DEFAULT_RETRY_STATUSES = [500, 502, 503, 504]
 
+    def __init__(self, config):
+        self.timeout = config.get("timeout", 30)
+        self.retries = config.get("retries", 3)
+        self.backoff_factor = config.get("backoff_factor", 0.5)
+        self.retry_statuses = config.get("retry_statuses", self.DEFAULT_RETRY_STATUSES)
+        self.pool_maxsize = config.get("pool_maxsize", 10)
 
-def matches_path(config: Dict[str, any], path: str) -> bool:
-    pattern = f"{config['directory_path']}/*"
-    return fnmatch.fnmatch(path, pattern)
+
+class MetadataConfig:
+    """Where captions, content tags and posted keywords are stored: in the image EXIF, or in a sidecar file per directory"""
+
+    backend: str
+    flush_on_upload: bool
+
+    BACKENDS = ["exif", "sidecar"]
+
+    def __init__(self, config):
+        self.backend = config.get("backend", "exif")
+        if self.backend not in self.BACKENDS:
+            raise ValueError(f"Unknown metadata backend {self.backend}. Should be one of: {self.BACKENDS}")
+        # write the sidecar metadata into the EXIF of the image once it is posted, instead of on every edit
+        self.flush_on_upload = config.get("flush_on_upload", False)
+
+
+PLATFORM_CLASS_BY_NAME = {SupportedPlatforms.DEVIANT: DeviantPlatformConfig, SupportedPlatforms.TWITTER: TwitterPlatformConfig}
 
 
 class SchedulerProfile:
@@ -109,9 +171,15 @@ class Account:
     extensions: List[str]
     platforms: List[str]
     nsfw: bool
+    image_index: bool
+    # cron schedules per platform, used by the scheduler daemon
+    schedules: Dict[str, List[CronSchedule]]
+    http_config: HttpConfig
+    metadata_config: MetadataConfig
     twitter_config: Optional[TwitterPlatformConfig]
     deviant_config: Optional[DeviantPlatformConfig]
     _config: Dict[str, any]
+    _path_matcher: Optional[PathMatcher]
 
     def __init__(self, account_config, scheduler_profile_ids=[]):
         self.id = account_config["id"]
@@ -120,12 +188,18 @@ class Account:
         self.extensions = account_config["extensions"]
         self.platforms = account_config["platforms"]
         self.nsfw = account_config.get("nsfw", False)
+        self.image_index = account_config.get("image_index", False)
+        self.schedules = {platform: parse_cron_expressions(expressions) for platform, expressions in account_config.get("schedules", {}).items()}
+        self.http_config = HttpConfig(account_config.get("http", {}))
+        self.metadata_config = MetadataConfig(account_config.get("metadata", {}))
         self._config = account_config
         self.scheduler_profiles = [
             SchedulerProfile(scheduler_profile_id, account_config["scheduler_profiles"][scheduler_profile_id])
             for scheduler_profile_id in scheduler_profile_ids
         ]
 
+        self._path_matcher = None
+
         self.deviant_config = None
         self.twitter_config = None
 
@@ -135,13 +209,25 @@ class Account:
         if SupportedPlatforms.TWITTER.value in account_config:
             self.twitter_config = TwitterPlatformConfig(self.id, account_config[SupportedPlatforms.TWITTER.value])
 
+    @property
+    def path_matcher(self) -> PathMatcher:
+        # Compiled lazily, once per account, as matching is done for every file in the library
+        if self._path_matcher is None:
+            self._path_matcher = PathMatcher(
+                include_patterns=[profile.directory_path for profile in self.scheduler_profiles],
+                exclude_patterns=[exclude_path for profile in self.scheduler_profiles for exclude_path in profile.exclude_paths],
+                sub_config_patterns=[sub_config["directory_path"] for sub_config in self._config.get("sub_configs", [])],
+            )
+        return self._path_matcher
+
     def set_config_for(self, path: str):
         """
         Merges sub configs and creates an account configuration based on the given file path
         This allows for generating specific configuration for folders, like adding specific tags
         """
 
-        matching_sub_configs = [sub_config for sub_config in self._config.get("sub_configs", []) if matches_path(sub_config, path)]
+        sub_configs = self._config.get("sub_configs", [])
+        matching_sub_configs = [sub_configs[index] for index in self.path_matcher.classify(path).sub_config_ids]
         for sub_config in matching_sub_configs:
             self.nsfw = sub_config.get("nsfw", self.nsfw)
 
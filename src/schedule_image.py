@@ -1,20 +1,143 @@
 import os
-import glob
-import random
-from typing import List
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
 
-import clients.deviant
-import clients.twitter
-import clients.test
+from clients.registry import PLATFORM_CLIENTS, get_client_class
+from deviant_utils.stash_state import StagedItem, StashState, get_stash_state_path, is_current, pick_staged_item
 from models.account import Account
 from utils.cli_args import parse_arguments, get_scheduler_profile_ids
 from utils.constants import POSTED_TAG_MAPPING, QUEUE_TAG_MAPPING, TAG_MAPPING
-from utils.file_utils import replace_file_tag, find_images_in_folders
-from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.file_utils import replace_file_tag, replace_file_tags, iter_images_in_folders
+from utils.metadata_backend import get_metadata_adjuster, save_posted_metadata
+from utils.prepared_upload import PreparedUpload, prepare_upload
 from utils.account_loader import select_account
+from utils.random_utils import pick_random
+from utils.rate_limit_ledger import RateLimitedError
+from utils.renditions import prepare_platform_upload
 
 
-def execute(account: Account, mode: str):
+# Posts the same image to every platform of the account, a comma separated list of platforms does the same for those platforms
+FAN_OUT_MODE = "All"
+
+
+def get_fan_out_platforms(account: Account, mode: Optional[str]) -> Optional[List[str]]:
+    if mode == FAN_OUT_MODE:
+        return list(account.platforms)
+    if mode is not None and "," in mode:
+        return [platform.strip() for platform in mode.split(",") if platform.strip()]
+    return None
+
+
+def has_failed(result) -> bool:
+    # a fan out returns the result per platform, it only failed when no platform was posted to
+    if isinstance(result, dict):
+        return all(platform_result is False for platform_result in result.values())
+    return result is False
+
+
+def upload_to(account: Account, mode: str, upload: PreparedUpload):
+    if mode not in PLATFORM_CLIENTS:
+        print(f"Mode {mode} not recognized")
+        return False
+
+    # renditions are usually pre-generated by warm_renditions.py, otherwise they are rendered (and cached) here
+    upload = prepare_platform_upload(account, mode, upload)
+    client = get_client_class(mode)(account)
+    if mode == "Deviant":
+        return client.schedule(upload.path, upload.caption, upload.content_tags, upload=upload)
+    return client.schedule(upload.path, upload.caption, upload=upload)
+
+
+def publish_staged(account: Account, staged_item: StagedItem):
+    print(f"Publishing staged Sta.sh item {staged_item.itemid}")
+    return get_client_class("Deviant")(account).publish_staged(staged_item.itemid, staged_item.caption, staged_item.display_resolution)
+
+
+def discard_staged(account: Account, stash_state: StashState, file: str, staged_item: StagedItem):
+    # The Sta.sh item is deleted along with its record, it would be left orphaned on the account otherwise.
+    # When the delete fails the record is kept, so a later run can publish or delete the item
+    print(f"Deleting staged Sta.sh item {staged_item.itemid}")
+    if get_client_class("Deviant")(account).delete_staged(staged_item.itemid):
+        stash_state.remove(file)
+    else:
+        stash_state.release(file)
+
+
+def get_requested_file(file: str, queued_tags: List[str]) -> str:
+    # A file picked in advance (eg: by a queued job) may have been posted or renamed in the meantime
+    if not os.path.isfile(file) or any(queued_tag not in os.path.basename(file) for queued_tag in queued_tags):
+        err = f"File {file} does not exist or is not queued with {', '.join(queued_tags)}"
+        raise ValueError(err)
+    return file
+
+
+def execute_fan_out(account: Account, platforms: List[str], file: Optional[str] = None) -> Dict[str, any]:
+    """
+    Picks one image queued for all given platforms (or uses the given file) and uploads it to all of them concurrently.
+    The tags of the successful platforms are applied in one rename once every upload finished.
+    Returns the result per platform, False for the ones that failed. When no platform was posted to and one of them
+    was rate limited, raises RateLimitedError so the caller defers the post instead of counting it as failed
+    """
+    if len(platforms) == 0 or any(platform not in account.platforms for platform in platforms):
+        err = f"Please provide valid platforms to fan out to. Choices are: {list(account.platforms)}"
+        raise ValueError(err)
+
+    queued_tags = [QUEUE_TAG_MAPPING[platform] for platform in platforms]
+    if file is not None:
+        file = get_requested_file(file, queued_tags)
+    else:
+        files = iter_images_in_folders(account, platforms, skip_queued=False, skip_posted=True, required_tags=queued_tags)
+        file = pick_random(files)
+
+    if file is None:
+        err = f"No file queued for all of {platforms} found for glob: {account.directory_paths} and extensions {', '.join(account.extensions)}"
+        raise ValueError(err)
+
+    # read once, every platform uploads from the same bytes
+    prepared_upload = prepare_upload(file, account)
+    account.set_config_for(file)
+
+    def upload(platform: str):
+        try:
+            return upload_to(account, platform, prepared_upload)
+        except RateLimitedError as e:
+            print(f"Upload to {platform} deferred: {e}")
+            return e
+        except Exception as e:
+            print(f"Upload to {platform} failed: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=len(platforms)) as executor:
+        results = dict(zip(platforms, executor.map(upload, platforms)))
+
+    rate_limited = [result for result in results.values() if isinstance(result, RateLimitedError)]
+    posted_platforms = [platform for platform, result in results.items() if result is not False and not isinstance(result, RateLimitedError)]
+    if rate_limited and not posted_platforms:
+        # retried once every rate limited platform has budget again
+        raise max(rate_limited, key=lambda e: e.next_available_at)
+
+    for platform in platforms:
+        if platform not in posted_platforms:
+            print(f"Upload to {platform} failed. Halted on {file}")
+
+    if posted_platforms:
+        new_filepath = replace_file_tags(file, [(QUEUE_TAG_MAPPING[platform], POSTED_TAG_MAPPING[platform]) for platform in posted_platforms])
+
+        adjuster = get_metadata_adjuster(account, new_filepath)
+        adjuster.add_tags(";".join(TAG_MAPPING[platform] for platform in posted_platforms))
+        save_posted_metadata(account, adjuster)
+
+    # the image stays queued for the rate limited platforms, one of their own runs posts it later
+    return {platform: False if isinstance(result, RateLimitedError) else result for platform, result in results.items()}
+
+
+def execute(account: Account, mode: str, file: Optional[str] = None):
+    fan_out_platforms = get_fan_out_platforms(account, mode)
+    if fan_out_platforms is not None:
+        return execute_fan_out(account, fan_out_platforms, file)
+
     debugging = mode == "Debug"
 
     if ((mode is None) or (mode not in account.platforms)) and (not debugging):
@@ -30,39 +153,55 @@ def execute(account: Account, mode: str):
     queued_tag = read_from(QUEUE_TAG_MAPPING, mode, "TWIT_Q")
     posted_tag = read_from(POSTED_TAG_MAPPING, mode, "TWIT_P")
 
-    files = find_images_in_folders(account, [mode], skip_queued=False, skip_posted=True)
-    files = [file for file in files if queued_tag in file]
+    # Images uploaded to Sta.sh in advance only need to be published
+    stash_state = StashState(get_stash_state_path(account.id)) if mode == "Deviant" else None
 
-    if len(files) == 0:
+    if file is not None:
+        file = get_requested_file(file, [queued_tag])
+        staged_item = stash_state.claim(file) if stash_state else None
+        if staged_item is not None and not is_current(account, file, staged_item):
+            discard_staged(account, stash_state, file, staged_item)
+            staged_item = None
+    else:
+        staged = pick_staged_item(account, stash_state, partial(discard_staged, account, stash_state)) if stash_state else None
+        if staged is not None:
+            file, staged_item = staged
+        else:
+            files = iter_images_in_folders(account, [mode], skip_queued=False, skip_posted=True, required_tags=[queued_tag])
+            file = pick_random(files)
+            staged_item = None
+
+    if file is None:
         err = f"No file found for glob: {account.directory_paths} and extensions {', '.join(account.extensions)}"
         raise ValueError(err)
 
-    file = random.sample(files, 1)[0]
-    caption = ImageMetadataAdjuster(file).get_caption()
-    content_tags = ImageMetadataAdjuster(file).get_content_tags()
-
     def run():
         account.set_config_for(file)
-        if mode == "Twitter":
-            return clients.twitter.TwitterClient(account).schedule(file, caption)
-
-        if mode == "Deviant":
-            return clients.deviant.DeviantClient(account).schedule(file, caption, content_tags)
-
-        if mode == "Debug":
-            return clients.test.TestClient(account).schedule(file, caption)
-
-        print(f"Mode {mode} not recognized")
-        return False
+        if staged_item is not None:
+            return publish_staged(account, staged_item)
+        return upload_to(account, mode, prepare_upload(file, account))
+
+    try:
+        result = run()
+    except BaseException:
+        if staged_item is not None:
+            # eg: rate limited, a later run publishes the staged item
+            stash_state.release(file)
+        raise
+    if staged_item is not None:
+        if result is False:
+            # a failed publish falls back to a regular upload on the next run
+            discard_staged(account, stash_state, file, staged_item)
+        else:
+            stash_state.remove(file)
 
-    result = run()
     if result is not False:
         new_filepath = replace_file_tag(file, queued_tag, posted_tag)
 
         # image adjuster currently hold a file reference which blocks editing the name
-        adjuster = ImageMetadataAdjuster(new_filepath)
+        adjuster = get_metadata_adjuster(account, new_filepath)
         adjuster.add_tags(tag)
-        adjuster.save()
+        save_posted_metadata(account, adjuster)
     else:
         print(f"Upload failed. Halted on {file}")
 
@@ -74,4 +213,9 @@ if __name__ == "__main__":
     account_data = args.account
     scheduler_profile_ids = get_scheduler_profile_ids(args)
     account = select_account(account_data, scheduler_profile_ids=scheduler_profile_ids)
-    execute(account, args.mode)
+    try:
+        execute(account, args.mode)
+    except RateLimitedError as e:
+        print(e)
+        # EX_TEMPFAIL, the post can be retried once the rate limit resets
+        sys.exit(75)
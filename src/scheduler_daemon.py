@@ -0,0 +1,135 @@
+import argparse
+import os
+import time
+import traceback
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from models.account import Account
+from schedule_image import execute, get_fan_out_platforms
+from utils.account_loader import copy_account_for_run, load_accounts, parse_account, project_root
+from utils.cron import CronSchedule
+from utils.rate_limit_ledger import RateLimitLedger, RateLimitedError, get_rate_limit_ledger
+
+# Upper bound for a single sleep, so changes to accounts.yml are picked up in time
+MAX_SLEEP_SECONDS = 60
+
+
+class ScheduledJob(NamedTuple):
+    account_name: str
+    platform: str
+    schedule: CronSchedule
+
+
+class SchedulerDaemon:
+    """
+    Long running replacement for one systemd timer per account and platform.
+    accounts.yml is loaded once (and again when it changes), the parsed accounts stay in memory
+    and execute is fired whenever one of the configured cron schedules is due.
+    """
+
+    def __init__(self, file_path: str = project_root, clock: Callable[[], datetime] = datetime.now, ledger: Optional[RateLimitLedger] = None):
+        self.file_path = file_path
+        self.clock = clock
+        self._ledger = ledger
+        self.accounts: Dict[str, Account] = {}
+        self.jobs: List[ScheduledJob] = []
+        self.next_runs: Dict[ScheduledJob, datetime] = {}
+        self._accounts_mtime = None
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        mtime = os.path.getmtime(os.path.join(self.file_path, "accounts.yml"))
+        if mtime == self._accounts_mtime:
+            return
+        self._accounts_mtime = mtime
+
+        accounts = {name: parse_account(config, []) for name, config in load_accounts(self.file_path).items()}
+        jobs = [
+            ScheduledJob(name, platform, schedule)
+            for name, account in accounts.items()
+            for platform, schedules in account.schedules.items()
+            for schedule in schedules
+        ]
+
+        now = self.clock()
+        # keep the planning of unchanged jobs, so a reload right before a run does not skip it
+        previous_runs = {(job.account_name, job.platform, job.schedule.expression): run for job, run in self.next_runs.items()}
+        self.next_runs = {
+            job: previous_runs.get((job.account_name, job.platform, job.schedule.expression)) or job.schedule.next_after(now) for job in jobs
+        }
+        self.accounts = accounts
+        self.jobs = jobs
+        print(f"Loaded {len(accounts)} accounts with {len(jobs)} scheduled jobs")
+
+    def _account_for_run(self, account_name: str) -> Account:
+        return copy_account_for_run(self.accounts[account_name])
+
+    @property
+    def ledger(self) -> RateLimitLedger:
+        if self._ledger is None:
+            self._ledger = get_rate_limit_ledger()
+        return self._ledger
+
+    def next_available_at(self, job: ScheduledJob) -> Optional[datetime]:
+        # A fan out job waits for the last of its platforms, so the image is not posted to only some of them
+        account = self.accounts[job.account_name]
+        platforms = get_fan_out_platforms(account, job.platform) or [job.platform]
+        deferred_until = [self.ledger.next_available_at(account.id, platform) for platform in platforms]
+        return max((at for at in deferred_until if at is not None), default=None)
+
+    def run_job(self, job: ScheduledJob):
+        print(f"[{self.clock():%Y-%m-%d %H:%M}] Running {job.platform} for {job.account_name} ({job.schedule.expression})")
+        try:
+            return execute(self._account_for_run(job.account_name), job.platform)
+        except RateLimitedError as e:
+            return e
+        except Exception as e:
+            print(f"Job {job.platform} for {job.account_name} failed: {e}")
+            traceback.print_exc()
+            return False
+
+    def run_pending(self) -> List[ScheduledJob]:
+        now = self.clock()
+        due_jobs = [job for job in self.jobs if self.next_runs[job] <= now]
+        for job in due_jobs:
+            # Jobs for a platform without rate limit budget are deferred until it resets, instead of blocking the other jobs
+            deferred_until = self.next_available_at(job)
+            if deferred_until is None:
+                result = self.run_job(job)
+                deferred_until = result.next_available_at if isinstance(result, RateLimitedError) else None
+
+            if deferred_until is not None:
+                print(f"{job.platform} for {job.account_name} is rate limited, deferred until {deferred_until:%Y-%m-%d %H:%M}")
+                self.next_runs[job] = deferred_until
+            else:
+                self.next_runs[job] = job.schedule.next_after(now)
+        return due_jobs
+
+    def seconds_until_next_run(self) -> float:
+        if not self.next_runs:
+            return MAX_SLEEP_SECONDS
+        next_run = min(self.next_runs.values())
+        return min(max((next_run - self.clock()).total_seconds(), 0), MAX_SLEEP_SECONDS)
+
+    def run_forever(self):
+        while True:
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                # a broken edit of accounts.yml must not stop the other schedules, it is loaded again once it changes
+                print(f"Unable to reload accounts.yml, keeping the previous schedule: {e}")
+                traceback.print_exc()
+            self.run_pending()
+            time.sleep(self.seconds_until_next_run())
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Runs the schedules configured in accounts.yml in a single long running process")
+    parser.add_argument("--accounts-path", default=project_root, help="Directory containing the accounts.yml file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    SchedulerDaemon(args.accounts_path).run_forever()
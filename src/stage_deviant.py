@@ -0,0 +1,57 @@
+import argparse
+import copy
+from typing import List
+
+from clients.deviant import DeviantClient
+from deviant_utils.stash_state import StashState, get_stash_state_path
+from models.account import Account
+from utils.account_loader import select_account
+from utils.constants import DEVI_QUEUED
+from utils.file_utils import iter_images_in_folders
+from utils.prepared_upload import prepare_upload
+from utils.random_utils import sample_random
+from utils.renditions import prepare_platform_upload
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Uploads queued Deviant images to Sta.sh ahead of time, so scheduled runs only have to publish them")
+    parser.add_argument("account", help="Account name matching the account(s) in the accounts.yml file")
+    parser.add_argument("--count", type=int, default=5, help="Number of images to stage (default: 5)")
+    parser.add_argument("--scheduler-profile-ids", default=None, help="Stage images of specific schedule profiles")
+    return parser.parse_args()
+
+
+def stage_images(account: Account, count: int) -> List[str]:
+    """Stages up to count random queued images that are not staged yet, returns the staged files"""
+    state = StashState(get_stash_state_path(account.id))
+    already_staged = state.items()
+    files = (
+        file
+        for file in iter_images_in_folders(account, ["Deviant"], skip_queued=False, skip_posted=True, required_tags=[DEVI_QUEUED])
+        if file not in already_staged
+    )
+
+    staged_files = []
+    for file in sample_random(files, count):
+        # Sub configs (tags, mature flag) are applied per file, on a copy of the account
+        file_account = copy.deepcopy(account)
+        file_account.set_config_for(file)
+
+        upload = prepare_platform_upload(file_account, "Deviant", prepare_upload(file, file_account))
+        itemid = DeviantClient(file_account).stage(file, upload.caption, upload.content_tags, upload=upload)
+        if itemid is False:
+            print(f"Staging {file} failed")
+            continue
+
+        state.add(file, itemid, upload.caption, upload.content_tags, upload.display_resolution)
+        staged_files.append(file)
+        print(f"Staged {file} as {itemid}")
+    return staged_files
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    scheduler_profile_ids = args.scheduler_profile_ids.split(",") if args.scheduler_profile_ids else []
+    account = select_account(args.account, scheduler_profile_ids=scheduler_profile_ids)
+    staged_files = stage_images(account, args.count)
+    print(f"Staged {len(staged_files)} images")
@@ -1,5 +1,11 @@
+import copy
+import hashlib
+import pickle
+import time
 import yaml
 import os
+from typing import Dict, List, Optional
+from deviant_utils.deviant_refresh_token import get_refresh_token
 from models.account import Account
 
 current_script_path = os.path.dirname(os.path.abspath(__file__))
@@ -7,6 +13,16 @@ parent_path = os.path.abspath(os.path.join(current_script_path, os.pardir))
 
 project_root = os.path.abspath(os.path.join(parent_path, ".."))
 
+ACCOUNTS_FILE = "accounts.yml"
+# Parsed accounts.yml, stored next to it, so runs skip parsing the yaml as long as the file is unchanged
+SNAPSHOT_FILE = ".accounts.yml.cache"
+SNAPSHOT_VERSION = 1
+# A file modified this recently may change again within the same mtime tick, so its content hash is checked as well
+MTIME_GRACE_NS = 2 * 10**9
+
+# The C parser (when PyYAML was built with libyaml) is many times faster than the pure python one
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def parse_account(account_data, scheduler_profile_ids):
     # Set up account data
@@ -14,17 +30,86 @@ def parse_account(account_data, scheduler_profile_ids):
     return Account(account_data, scheduler_profile_ids)
 
 
-def load_accounts(file_path=project_root):
-    # Loads the provided accounts.yml file to use
-    return yaml.safe_load(open(os.path.join(file_path, "accounts.yml")))
+def _read_snapshot(snapshot_path: str) -> Optional[dict]:
+    try:
+        with open(snapshot_path, "rb") as file:
+            snapshot = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        return None
+    return snapshot if isinstance(snapshot, dict) and snapshot.get("version") == SNAPSHOT_VERSION else None
+
+
+def _write_snapshot(snapshot_path: str, snapshot: dict):
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        # a read only config directory only costs the speed up
+        print(f"Unable to write the accounts snapshot {snapshot_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _load_snapshot(file_path: str) -> Dict[str, bytes]:
+    """
+    Returns the config of every account, each pickled on its own so a lookup only unpickles the account it needs.
+    The yaml is only parsed when the mtime, size and content hash of accounts.yml no longer match the snapshot.
+    """
+    snapshot_path = os.path.join(file_path, SNAPSHOT_FILE)
+    with open(os.path.join(file_path, ACCOUNTS_FILE), "rb") as file:
+        stat = os.fstat(file.fileno())
+        snapshot = _read_snapshot(snapshot_path)
+        recently_modified = time.time_ns() - stat.st_mtime_ns < MTIME_GRACE_NS
+        if snapshot is not None and not recently_modified and (snapshot["mtime_ns"], snapshot["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return snapshot["accounts"]
+        content = file.read()
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    if snapshot is not None and snapshot["content_hash"] == content_hash:
+        if (snapshot["mtime_ns"], snapshot["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return snapshot["accounts"]
+    else:
+        accounts = yaml.load(content, Loader=YamlLoader) or {}
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "content_hash": content_hash,
+            "accounts": {name: pickle.dumps(config, protocol=pickle.HIGHEST_PROTOCOL) for name, config in accounts.items()},
+        }
+
+    # touched but unchanged files only refresh the stat of the snapshot
+    snapshot.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    _write_snapshot(snapshot_path, snapshot)
+    return snapshot["accounts"]
+
+
+def get_account_names(file_path=project_root) -> List[str]:
+    return list(_load_snapshot(file_path).keys())
+
+
+def load_accounts(file_path=project_root, account_names: Optional[List[str]] = None):
+    # Loads the provided accounts.yml file to use, optionally only the given accounts
+    accounts = _load_snapshot(file_path)
+    names = account_names if account_names is not None else accounts.keys()
+    return {name: pickle.loads(accounts[name]) for name in names if name in accounts}
 
 
 def select_account(account_name: str, file_path=project_root, scheduler_profile_ids=[]):
     # Selects a single account, fails if the account name can not be found
-    accounts = load_accounts(file_path)
+    accounts = _load_snapshot(file_path)
 
     if account_name not in accounts:
         err = f"Account {account_name} not known in list. Should be one of: {list(accounts.keys())}"
         raise ValueError(err)
 
-    return parse_account(accounts[account_name], scheduler_profile_ids)
+    return parse_account(pickle.loads(accounts[account_name]), scheduler_profile_ids)
+
+
+def copy_account_for_run(account: Account) -> Account:
+    # Sub configs are merged into the account for the selected file, so every run of a loaded account works on its own copy
+    account_copy = copy.deepcopy(account)
+    if account_copy.deviant_config:
+        # the refresh token rotates on every run
+        account_copy.deviant_config.refresh_token = get_refresh_token(account_copy.id)
+    return account_copy
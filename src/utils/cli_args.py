@@ -1,12 +1,46 @@
 import argparse
 
+PLATFORM_MODES = ["Twitter", "Deviant", "Debug", "All"]
+
+
+def platform_mode(value: str) -> str:
+    # A single mode, or a comma separated list of platforms to post the same image to
+    for mode in value.split(","):
+        if mode.strip() not in PLATFORM_MODES:
+            raise argparse.ArgumentTypeError(f"invalid choice: '{mode}' (choose from {', '.join(PLATFORM_MODES)}, or a comma separated list)")
+    return value
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"should be positive, got {value}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"should be positive, got {value}")
+    return number
+
+
+def non_negative_float(value: str) -> float:
+    number = float(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"should not be negative, got {value}")
+    return number
+
 
 def parse_arguments():
     # Reads the provided CLI arguments for further use in the app
     parser = argparse.ArgumentParser(description="Image Selector and Scheduler")
     parser.add_argument("account", help="Account name matching the account(s) in the accounts.yml file")
     parser.add_argument(
-        "mode", nargs="?", choices=["Twitter", "Deviant", "Debug"], help="Platform to schedule the image for (only for schedule_image.py)"
+        "mode",
+        nargs="?",
+        type=platform_mode,
+        help="Platform to schedule the image for, All or eg: Twitter,Deviant posts one image to several platforms (only for schedule_image.py)",
     )
     parser.add_argument(
         "--sort", choices=["random", "latest", "alphabetical"], default="alphabetical", help="Sorting method for images (default: random)"
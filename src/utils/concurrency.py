@@ -0,0 +1,43 @@
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterable, Optional
+
+
+class KeyedLocks:
+    """One lock per key, created on first use"""
+
+    def __init__(self):
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+
+class ConcurrencyLimits:
+    """
+    Bounds how many jobs use a platform at the same time, eg: {"Twitter": 2, "Deviant": 4}.
+    Platforms without a configured limit fall back to default_limit, None means unbounded.
+    """
+
+    def __init__(self, limits: Dict[str, int], default_limit: Optional[int] = None):
+        self._semaphores = {platform: threading.BoundedSemaphore(limit) for platform, limit in limits.items()}
+        self._default_limit = default_limit
+        self._lock = threading.Lock()
+
+    def _semaphore(self, platform: str) -> Optional[threading.BoundedSemaphore]:
+        with self._lock:
+            if platform not in self._semaphores and self._default_limit is not None:
+                self._semaphores[platform] = threading.BoundedSemaphore(self._default_limit)
+            return self._semaphores.get(platform)
+
+    @contextmanager
+    def acquire(self, platforms: Iterable[str]):
+        # Acquired in a fixed order, so jobs posting to several platforms can not deadlock each other
+        with ExitStack() as stack:
+            for platform in sorted(set(platforms)):
+                semaphore = self._semaphore(platform)
+                if semaphore is not None:
+                    stack.enter_context(semaphore)
+            yield
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from typing import List, Set
+
+# minute, hour, day of month, month, day of week (0 or 7 is sunday)
+FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+# Guards against expressions that can never fire, eg: 0 0 30 2 *
+MAX_LOOKAHEAD = timedelta(days=366 * 5)
+
+
+def _parse_field(field: str, minimum: int, maximum: int) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Invalid step in cron field {field}")
+
+        if part == "*":
+            start, end = minimum, maximum
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            end = maximum if step != 1 else start
+
+        if start < minimum or end > maximum or start > end:
+            raise ValueError(f"Cron field {field} is out of range {minimum}-{maximum}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Minimal 5 field cron expression, eg: '0 9,18 * * 1-5'"""
+
+    expression: str
+    minutes: Set[int]
+    hours: Set[int]
+    days: Set[int]
+    months: Set[int]
+    weekdays: Set[int]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' should have 5 fields")
+
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            _parse_field(field, minimum, maximum) for field, (minimum, maximum) in zip(fields, FIELD_RANGES)
+        ]
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+
+        # Like cron, when both day fields are restricted a match on either one is enough
+        self._days_restricted = fields[2] != "*"
+        self._weekdays_restricted = fields[4] != "*"
+
+    def __repr__(self):
+        return f"CronSchedule('{self.expression}')"
+
+    def _matches_day(self, moment: datetime) -> bool:
+        day_matches = moment.day in self.days
+        weekday_matches = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._days_restricted and self._weekdays_restricted:
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+    def matches(self, moment: datetime) -> bool:
+        return moment.month in self.months and self._matches_day(moment) and moment.hour in self.hours and moment.minute in self.minutes
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Returns the first matching minute strictly after the given moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + MAX_LOOKAHEAD
+
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._matches_day(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+
+def parse_cron_expressions(value) -> List[CronSchedule]:
+    # Schedules can be configured as a single expression or a list of them
+    expressions = [value] if isinstance(value, str) else value
+    return [CronSchedule(expression) for expression in expressions]
@@ -0,0 +1,76 @@
+import struct
+from typing import BinaryIO, Dict, Optional, Union
+
+import piexif
+
+from utils.jpeg_utils import APP1, EXIF_HEADER, SOI, iter_file_segments
+
+# The 0th IFD tags holding the caption, posted keywords and content tags
+XP_TAGS = {piexif.ImageIFD.XPSubject, piexif.ImageIFD.XPKeywords, piexif.ImageIFD.XPComment}
+
+TYPE_BYTE = 1
+TYPE_UNDEFINED = 7
+
+XpValue = Union[tuple, bytes]
+
+
+def read_exif_segment(file: BinaryIO) -> Optional[bytes]:
+    """Returns the payload of the first EXIF APP1 segment (starting with the Exif header), only the segments before the image data are read"""
+    for marker, start, end in iter_file_segments(file):
+        if marker != APP1:
+            continue
+        file.seek(start + 4)
+        payload = file.read(end - start - 4)
+        if payload.startswith(EXIF_HEADER):
+            return payload
+    return None
+
+
+def parse_xp_tags(exif_bytes: bytes) -> Dict[int, XpValue]:
+    """
+    Reads only the XP tags from the 0th IFD of an EXIF payload, in the same form piexif.load returns them
+    (a tuple of ints for BYTE values, bytes for UNDEFINED ones). The other IFDs are never touched
+    """
+    tiff = memoryview(exif_bytes)[len(EXIF_HEADER) :]
+    if len(tiff) < 8:
+        raise ValueError("EXIF data too short")
+    if bytes(tiff[:2]) == b"II":
+        endian = "<"
+    elif bytes(tiff[:2]) == b"MM":
+        endian = ">"
+    else:
+        raise ValueError("Invalid EXIF byte order")
+
+    (ifd_offset,) = struct.unpack_from(f"{endian}I", tiff, 4)
+    if ifd_offset + 2 > len(tiff):
+        raise ValueError("EXIF IFD offset out of range")
+    (entry_count,) = struct.unpack_from(f"{endian}H", tiff, ifd_offset)
+
+    tags = {}
+    for index in range(entry_count):
+        entry_offset = ifd_offset + 2 + index * 12
+        if entry_offset + 12 > len(tiff):
+            raise ValueError("EXIF IFD entry out of range")
+        tag, value_type, count = struct.unpack_from(f"{endian}HHI", tiff, entry_offset)
+        if tag not in XP_TAGS or value_type not in (TYPE_BYTE, TYPE_UNDEFINED):
+            continue
+
+        # values of up to 4 bytes are stored in the entry itself, larger ones at an offset from the TIFF header
+        if count <= 4:
+            value_offset = entry_offset + 8
+        else:
+            (value_offset,) = struct.unpack_from(f"{endian}I", tiff, entry_offset + 8)
+        if value_offset + count > len(tiff):
+            raise ValueError("EXIF value out of range")
+        data = tiff[value_offset : value_offset + count]
+        tags[tag] = tuple(data) if value_type == TYPE_BYTE else bytes(data)
+    return tags
+
+
+def read_xp_tags(path: str) -> Optional[Dict[int, XpValue]]:
+    """The XP tags of a JPEG, read from its header only. Returns None when the file is not a JPEG"""
+    with open(path, "rb") as file:
+        if file.read(2) != SOI:
+            return None
+        exif_bytes = read_exif_segment(file)
+    return parse_xp_tags(exif_bytes) if exif_bytes is not None else {}
@@ -1,12 +1,13 @@
-import fnmatch
-import glob
 import itertools
 import os
 import re
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from models.account import Account
 from utils.constants import QUEUE_TAG_MAPPING, POSTED_TAG_MAPPING
+from utils.image_index import get_image_index
+from utils.image_walker import find_image_entries, iter_image_entries
+from utils.metadata_backend import rename_sidecar_entry
 
 
 def sanitize_caption_for_filename(caption: str, max_length: int = 100) -> str:
@@ -66,16 +67,22 @@ def add_caption_to_filename(filename: str, caption: str) -> str:
 
 def replace_file_tag(filepath: str, old_tag: str, new_tag: str) -> str:
     # Replaces the old tag, eg: TWIT_Q with the new one, eg TWIT_P
+    return replace_file_tags(filepath, [(old_tag, new_tag)])
+
+
+def replace_file_tags(filepath: str, replacements: List[Tuple[str, str]]) -> str:
+    # Applies several (old tag, new tag) replacements in a single rename, eg: after posting to multiple platforms
     # Split the file path into directory, filename, and extension
     directory, basename = os.path.split(filepath)
     filename, file_extension = os.path.splitext(basename)
 
     # Construct the new filename
-    new_name = None
-    if old_tag in filename:
-        new_name = filename.replace(old_tag, new_tag)
-    else:
-        new_name = f"{filename}{new_tag}"
+    new_name = filename
+    for old_tag, new_tag in replacements:
+        if old_tag in new_name:
+            new_name = new_name.replace(old_tag, new_tag)
+        else:
+            new_name = f"{new_name}{new_tag}"
     new_filename = f"{new_name}{file_extension}"
 
     new_filepath = os.path.join(directory, new_filename)
@@ -84,6 +91,7 @@ def replace_file_tag(filepath: str, old_tag: str, new_tag: str) -> str:
     os.rename(filepath, new_filepath)
     print(f"Renamed {filepath} to {new_filepath}")
     rename_json_if_exists(filepath, new_filepath)
+    rename_sidecar_entry(filepath, new_filepath)
     return new_filepath
 
 
@@ -111,6 +119,7 @@ def rename_file_with_tags(filepath: str, platform_dict: Dict[str, bool], caption
     os.rename(filepath, new_filepath)
     print(f"Renamed {filepath} to {new_filepath}")
     rename_json_if_exists(filepath, new_filepath)
+    rename_sidecar_entry(filepath, new_filepath)
     return new_filepath
 
 
@@ -136,60 +145,70 @@ def get_excluded_tags(platforms: List[str], skip_posted: bool, skip_queued: bool
     return excluded_tags
 
 
-def matches_path(file, pattern):
-    return fnmatch.fnmatch(file, f"{pattern}/*")
-
-
-def is_included_via_scheduler_profile_paths(account: Account, file: str):
-    # If one directory path of the scheduler profile matches, include the item
-    for scheduler_profile in account.scheduler_profiles:
-        if matches_path(file, scheduler_profile.directory_path):
-            return True
-    return False
-
-
-def is_excluded_via_scheduler_profile_exclusions(account: Account, file: str):
-    # If one exclude path of the scheduler profile matches, exclude the item
-    for scheduler_profile in account.scheduler_profiles:
-        for exclude_path in scheduler_profile.exclude_paths:
-            if matches_path(file, exclude_path):
-                return True
-    return False
-
-
 def is_excluded_file(account: Account, file: str, excluded_tags: List[str]):
     is_excluded_via_tags = any(tag in file for tag in excluded_tags)
 
     if is_excluded_via_tags:
         return True
 
-    # No-op without scheduler profiles
-    if len(account.scheduler_profiles) == 0:
-        return False
-
-    if is_excluded_via_scheduler_profile_exclusions(account, file):
-        return True
-
-    return not is_included_via_scheduler_profile_paths(account, file)
+    return not account.path_matcher.classify(file).included
 
 
 def exclude_files(files: List[str], account: Account, excluded_tags: List[str]):
     return [file for file in files if not is_excluded_file(account, file, excluded_tags)]
 
 
-def find_images_in_folder(folder_path: str, account: Account, excluded_tags: List[str]):
+def find_images_in_folder(folder_path: str, account: Account, excluded_tags: List[str], mtimes: Optional[Dict[str, float]] = None):
+    # When given, mtimes is filled with the modification time of every returned image, without an extra stat call
+    if account.image_index:
+        index = get_image_index(account)
+        index.refresh(folder_path)
+        image_paths = exclude_files(index.find(folder_path, account.extensions), account, excluded_tags)
+        if mtimes is not None:
+            mtimes.update(index.get_mtimes(image_paths))
+        return image_paths
+
     image_paths = []
-    for ext in account.extensions:
-        files = glob.glob(os.path.join(folder_path, f"*{ext}"), recursive=True)
-        files = [os.path.abspath(file) for file in files]
-        filtered_files = exclude_files(files, account, excluded_tags)
-        image_paths.extend(filtered_files)
+    for file, entry in find_image_entries(folder_path, account.extensions):
+        if is_excluded_file(account, file, excluded_tags):
+            continue
+        image_paths.append(file)
+        if mtimes is not None:
+            mtimes[file] = entry.stat().st_mtime
     return image_paths
 
 
-def find_images_in_folders(account: Account, platforms: List[str], skip_queued: bool, skip_posted: bool=True):
+def find_images_in_folders(
+    account: Account, platforms: List[str], skip_queued: bool, skip_posted: bool = True, mtimes: Optional[Dict[str, float]] = None
+):
     excluded_tags = get_excluded_tags(platforms, skip_posted, skip_queued)
     result = []
     for folder_path in account.directory_paths:
-        result += find_images_in_folder(folder_path, account, excluded_tags)
+        result += find_images_in_folder(folder_path, account, excluded_tags, mtimes)
     return result
+
+
+def iter_images_in_folder(folder_path: str, account: Account, excluded_tags: List[str], required_tags: List[str] = []) -> Iterator[str]:
+    # Lazily yields the images of a folder, only keeping the ones containing all required tags
+    if account.image_index:
+        index = get_image_index(account)
+        index.refresh(folder_path)
+        files = (file for _, file in index.iter_find(folder_path, account.extensions))
+    else:
+        files = (file for _, file, _ in iter_image_entries(folder_path, account.extensions))
+
+    for file in files:
+        if all(tag in file for tag in required_tags) and not is_excluded_file(account, file, excluded_tags):
+            yield file
+
+
+def iter_images_in_folders(
+    account: Account, platforms: List[str], skip_queued: bool, skip_posted: bool = True, required_tags: List[str] = []
+) -> Iterator[str]:
+    """
+    Streaming variant of find_images_in_folders, the images are yielded as they are discovered (in no particular order),
+    so memory does not grow with the size of the library
+    """
+    excluded_tags = get_excluded_tags(platforms, skip_posted, skip_queued)
+    for folder_path in account.directory_paths:
+        yield from iter_images_in_folder(folder_path, account, excluded_tags, required_tags)
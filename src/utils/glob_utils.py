@@ -0,0 +1,99 @@
+import os
+import re
+from typing import List
+
+MAGIC_CHECK = re.compile(r"[*?[]")
+RECURSIVE_SEGMENT = "**"
+
+_SEP = re.escape(os.sep)
+_CASE_INSENSITIVE = os.path.normcase("A") == "a"
+
+
+def has_magic(segment: str) -> bool:
+    return MAGIC_CHECK.search(segment) is not None
+
+
+def is_hidden(name: str) -> bool:
+    return name.startswith(".")
+
+
+def split_pattern(pattern: str) -> List[str]:
+    # Splits an (absolute) glob pattern into its path segments
+    return os.path.abspath(pattern).split(os.sep)
+
+
+def static_root(pattern: str) -> str:
+    """
+    Returns the longest leading part of a directory pattern which contains no wildcards,
+    eg: /pictures/**/posted -> /pictures
+    """
+    segments = split_pattern(pattern)
+    static_segments = []
+    for segment in segments:
+        if has_magic(segment):
+            break
+        static_segments.append(segment)
+    return os.sep.join(static_segments) or os.sep
+
+
+def _translate_segment(segment: str) -> str:
+    # Translates a single glob segment into a regex which never crosses a path separator
+    result = []
+    index, length = 0, len(segment)
+    while index < length:
+        char = segment[index]
+        index += 1
+        if char == "*":
+            result.append(f"[^{_SEP}]*")
+        elif char == "?":
+            result.append(f"[^{_SEP}]")
+        elif char == "[":
+            end = index
+            if end < length and segment[end] == "!":
+                end += 1
+            if end < length and segment[end] == "]":
+                end += 1
+            while end < length and segment[end] != "]":
+                end += 1
+            if end >= length:
+                result.append(re.escape(char))
+                continue
+            stuff = segment[index:end].replace("\\", "\\\\")
+            index = end + 1
+            if stuff.startswith("!"):
+                stuff = "^" + stuff[1:]
+            elif stuff.startswith("^"):
+                stuff = "\\" + stuff
+            result.append(f"[{stuff}]")
+        else:
+            result.append(re.escape(char))
+
+    translated = "".join(result)
+    # glob skips hidden entries unless the pattern explicitly starts with a dot
+    if has_magic(segment) and not is_hidden(segment):
+        translated = r"(?!\.)" + translated
+    return translated
+
+
+def compile_glob(pattern: str) -> re.Pattern:
+    """
+    Compiles a recursive glob pattern into a regex matching absolute paths,
+    following the same rules glob.glob(pattern, recursive=True) applies
+    """
+    recursive = rf"(?:(?!\.)[^{_SEP}]+{_SEP})*"
+    segments = split_pattern(pattern)
+
+    parts = []
+    for segment in segments[:-1]:
+        if segment == RECURSIVE_SEGMENT:
+            parts.append(recursive)
+        else:
+            parts.append(_translate_segment(segment) + _SEP)
+
+    if segments[-1] == RECURSIVE_SEGMENT:
+        parts.append(recursive + rf"(?!\.)[^{_SEP}]+")
+    else:
+        parts.append(_translate_segment(segments[-1]))
+
+    flags = re.DOTALL | (re.IGNORECASE if _CASE_INSENSITIVE else 0)
+    return re.compile("".join(parts) + r"\Z", flags)
@@ -0,0 +1,223 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models.account import Account
+from utils.constants import POSTED_TAG_MAPPING, QUEUE_TAG_MAPPING
+from utils.glob_utils import compile_glob, static_root
+
+current_script_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_script_path, os.pardir, os.pardir))
+
+INDEX_CACHE_PATH = os.path.join(project_root, "image_index_cache")
+
+# Directories modified this recently are rescanned on the next refresh, as coarse (eg: NAS) mtime
+# granularity could otherwise hide a file written in the same tick as our scan
+MTIME_GRACE_SECONDS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS directories_parent ON directories (parent);
+
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    twit_state TEXT,
+    devi_state TEXT
+);
+CREATE INDEX IF NOT EXISTS images_directory ON images (directory);
+"""
+
+QUEUED = "queued"
+POSTED = "posted"
+
+
+def get_platform_state(filename: str, platform: str) -> Optional[str]:
+    # Derives the queue state of a platform from the file name, posted takes precedence
+    if POSTED_TAG_MAPPING[platform] in filename:
+        return POSTED
+    if QUEUE_TAG_MAPPING[platform] in filename:
+        return QUEUED
+    return None
+
+
+def _prefix_clause(column: str) -> str:
+    # Matches the directory itself and everything nested below it, without LIKE escaping issues
+    return f"({column} = ? OR substr({column}, 1, ?) = ?)"
+
+
+def _prefix_params(path: str) -> tuple:
+    prefix = path.rstrip(os.sep) + os.sep
+    return (path, len(prefix), prefix)
+
+
+class ImageIndex:
+    """
+    Persistent index of the images found in the account directories.
+    Directories are only rescanned when their mtime changed, so refreshing an unchanged library costs one stat per directory.
+    Note that editing a file in place does not touch its directory mtime, so size and mtime of such files may lag behind.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def refresh(self, folder_path: str):
+        """Brings the index up to date for the directory tree the given glob pattern can match"""
+        root = static_root(folder_path)
+        with self._lock, self._connection:
+            # (directory, (st_dev, st_ino) of the directories it is nested in)
+            stack = [(root, frozenset())]
+            while stack:
+                directory, ancestors = stack.pop()
+                stack.extend(self._refresh_directory(directory, ancestors))
+
+    def find(self, folder_path: str, extensions: List[str]) -> List[str]:
+        """
+        Answers glob.glob(os.path.join(folder_path, f"*{ext}"), recursive=True) for every extension, from the index.
+        The matches of an extension are sorted by path, where glob returns them in directory listing order
+        """
+        results_per_extension: List[List[str]] = [[] for _ in extensions]
+        for ext_index, path in self.iter_find(folder_path, extensions):
+            results_per_extension[ext_index].append(path)
+        return [path for results in results_per_extension for path in results]
+
+    def iter_find(self, folder_path: str, extensions: List[str], batch_size: int = 1000) -> Iterator[Tuple[int, str]]:
+        # Streams (extension index, path) for every match, without loading the full listing in memory
+        root = static_root(folder_path)
+        patterns = [compile_glob(os.path.join(folder_path, f"*{ext}")) for ext in extensions]
+
+        cursor = self._connection.cursor()
+        with self._lock:
+            cursor.execute(f"SELECT path FROM images WHERE {_prefix_clause('directory')} ORDER BY path", _prefix_params(root))
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for (path,) in rows:
+                    for ext_index, pattern in enumerate(patterns):
+                        if pattern.match(path):
+                            yield ext_index, path
+        finally:
+            cursor.close()
+
+    def get_mtimes(self, paths: Iterable[str]) -> Dict[str, float]:
+        # Returns the indexed mtimes (in seconds, like os.path.getmtime) for the given paths
+        result = {}
+        with self._lock:
+            for path in paths:
+                row = self._connection.execute("SELECT mtime_ns FROM images WHERE path = ?", (path,)).fetchone()
+                if row:
+                    result[path] = row[0] / 1e9
+        return result
+
+    def _refresh_directory(self, directory: str, ancestors: frozenset) -> List[Tuple[str, frozenset]]:
+        # Rescans a directory if needed, returns the subdirectories to visit next
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            self._forget_directory(directory)
+            return []
+
+        # symlinked directories are followed like glob does, also when their target is indexed as well.
+        # Only a link to a directory it is nested in is skipped, as it would never end
+        directory_id = (stat.st_dev, stat.st_ino)
+        if directory_id in ancestors:
+            return []
+        ancestors = ancestors | {directory_id}
+
+        row = self._connection.execute("SELECT mtime_ns FROM directories WHERE path = ?", (directory,)).fetchone()
+        if row is not None and row[0] == stat.st_mtime_ns:
+            children = [child[0] for child in self._connection.execute("SELECT path FROM directories WHERE parent = ?", (directory,))]
+        else:
+            children = self._rescan_directory(directory, stat)
+        return [(child, ancestors) for child in children]
+
+    def _rescan_directory(self, directory: str, stat: os.stat_result) -> List[str]:
+        images = {}
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            subdirectories.append(entry.path)
+                        elif entry.is_file():
+                            images[entry.path] = entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            self._forget_directory(directory)
+            return []
+
+        known_images = {row[0] for row in self._connection.execute("SELECT path FROM images WHERE directory = ?", (directory,))}
+        for vanished in known_images - images.keys():
+            self._connection.execute("DELETE FROM images WHERE path = ?", (vanished,))
+
+        for path, file_stat in images.items():
+            name = os.path.basename(path)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO images (path, directory, extension, size, mtime_ns, twit_state, devi_state) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    directory,
+                    os.path.splitext(name)[1].lstrip("."),
+                    file_stat.st_size,
+                    file_stat.st_mtime_ns,
+                    get_platform_state(name, "Twitter"),
+                    get_platform_state(name, "Deviant"),
+                ),
+            )
+
+        known_subdirectories = {row[0] for row in self._connection.execute("SELECT path FROM directories WHERE parent = ?", (directory,))}
+        for vanished in known_subdirectories - set(subdirectories):
+            self._forget_directory(vanished)
+        for subdirectory in subdirectories:
+            # unknown mtime forces the subdirectory to be scanned when it is visited
+            self._connection.execute("INSERT OR IGNORE INTO directories (path, parent, mtime_ns) VALUES (?, ?, NULL)", (subdirectory, directory))
+
+        mtime_ns = stat.st_mtime_ns
+        if time.time() - stat.st_mtime < MTIME_GRACE_SECONDS:
+            mtime_ns = None
+        self._connection.execute(
+            "INSERT OR REPLACE INTO directories (path, parent, mtime_ns) VALUES (?, ?, ?)",
+            (directory, os.path.dirname(directory), mtime_ns),
+        )
+        return subdirectories
+
+    def _forget_directory(self, directory: str):
+        params = _prefix_params(directory)
+        self._connection.execute(f"DELETE FROM images WHERE {_prefix_clause('directory')}", params)
+        self._connection.execute(f"DELETE FROM directories WHERE {_prefix_clause('path')}", params)
+
+
+_indexes: Dict[str, ImageIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index_path(account_id: str) -> str:
+    return os.path.join(INDEX_CACHE_PATH, f"{account_id}.sqlite3")
+
+
+def get_image_index(account: Account) -> ImageIndex:
+    # Indexes are kept open for the lifetime of the process, so long running callers reuse the connection
+    with _indexes_lock:
+        if account.id not in _indexes:
+            _indexes[account.id] = ImageIndex(get_index_path(account.id))
+        return _indexes[account.id]
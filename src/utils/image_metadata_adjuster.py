@@ -1,27 +1,94 @@
+import os
 import piexif
 import re
-from PIL import Image
+import shutil
+import tempfile
+from typing import Optional
+
+from utils.exif_reader import read_exif_segment
+from utils.jpeg_utils import SOI, write_jpeg_with_exif
+from utils.metadata_cache import get_file_key, get_metadata_cache, get_metadata_store
+
+
+def load_exif(image) -> dict:
+    try:
+        return piexif.load(image.info["exif"])
+    except KeyError:
+        return {"0th": {}}
+
+
+def read_file_exif(image_path: str) -> dict:
+    # The EXIF segment of a JPEG is read from its header, Pillow is only needed for other formats (or malformed JPEGs)
+    with open(image_path, "rb") as file:
+        if file.read(2) == SOI:
+            try:
+                exif_bytes = read_exif_segment(file)
+                return piexif.load(exif_bytes) if exif_bytes is not None else {"0th": {}}
+            except ValueError as e:
+                print(f"Unable to read the EXIF segment of {image_path}, falling back to Pillow: {e}")
+
+    # Pillow is imported lazily, it is a large part of the startup time of the scheduler
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        return load_exif(image)
+
+
+def merge_keywords(current_keywords: str, tags: str) -> str:
+    if current_keywords == "":
+        return tags
+    return f"{current_keywords};{tags}"
+
+
+def normalize_content_tags(new_tags: str) -> str:
+    # Split tags into a set to remove duplicates
+    tag_set = set(
+        re.sub(r"\W+", "_", tag.strip().replace(" ", "_"))  # Replace invalid chars and spaces with underscores
+        for tag in new_tags.split(",")
+        if tag.strip()
+    )
+
+    # Join tags back into a string
+    merged_tags = ", ".join(sorted(tag_set))
+
+    # Check length limit (256 characters in UTF-16LE)
+    if len(merged_tags.encode("utf-16le")) > 512:
+        raise ValueError("These tags exceed the 256 character limit for XPComment")
+    return merged_tags
 
 
 class ImageMetadataAdjuster:
-    def __init__(self, image_path: str):
+    def __init__(self, image_path: str, exif: Optional[dict] = None):
+        # exif can be passed in when the metadata was already read, eg: by PreparedUpload
         self.image_path = image_path
         self.image = None
-        self.exif = None
+        self.exif = exif
 
     def decode_user_comment(self, comment_bytes):
         # for now this is ok, all our content is utf-8
         return comment_bytes.decode("utf-8")
 
     def read_metadata(self) -> dict:
-        image = Image.open(self.image_path)
         if not self.exif:
-            try:
-                self.exif = piexif.load(image.info["exif"])
-            except KeyError:
-                self.exif = {"0th": {}}
+            key = get_file_key(self.image_path)
+            exif = get_metadata_cache().get(key) if key else None
+            if exif is None and key:
+                exif = get_metadata_store().get(key)
+                if exif is not None:
+                    get_metadata_cache().put(key, exif)
+            if exif is None:
+                self.exif = read_file_exif(self.image_path)
+                self._cache_metadata(key)
+            else:
+                self.exif = exif
         return self.exif
 
+    def _cache_metadata(self, key):
+        if key is None:
+            return
+        get_metadata_cache().put(key, self.exif)
+        get_metadata_store().put(key, self.exif, self.get_caption(), self.get_keywords(), self.get_content_tags())
+
     def get_caption(self) -> str:
         exif = self.read_metadata()
         if piexif.ImageIFD.XPSubject not in exif["0th"]:
@@ -31,24 +98,26 @@ class ImageMetadataAdjuster:
             caption = "".join(chr(x) for x in caption[::2])
         return caption
 
-    def add_tags(self, tags):
+    def get_keywords(self) -> str:
         exif = self.read_metadata()
 
-        if piexif.ImageIFD.XPKeywords not in exif["0th"]:
-            exif["0th"][piexif.ImageIFD.XPKeywords] = ""
+        keywords = exif["0th"].get(piexif.ImageIFD.XPKeywords, "")
+        if isinstance(keywords, tuple):
+            keywords = "".join(chr(x) for x in keywords[::2])
+        elif isinstance(keywords, bytes):
+            keywords = keywords.decode("utf-16le")
+        return keywords
 
-        current_keywords = exif["0th"][piexif.ImageIFD.XPKeywords]
-        if isinstance(current_keywords, tuple):
-            current_keywords = "".join(chr(x) for x in current_keywords[::2])
+    def set_keywords(self, keywords: str):
+        exif = self.read_metadata()
 
-        merged_keywords = current_keywords
-        if merged_keywords != "":
-            merged_keywords += ";"
-        merged_keywords += tags
         # todo why utf16 here?
-        exif["0th"][piexif.ImageIFD.XPKeywords] = merged_keywords.encode("utf-16le")
+        exif["0th"][piexif.ImageIFD.XPKeywords] = keywords.encode("utf-16le")
         self.exif = exif
 
+    def add_tags(self, tags):
+        self.set_keywords(merge_keywords(self.get_keywords(), tags))
+
     def add_subject(self, subject):
         exif = self.read_metadata()
 
@@ -72,24 +141,49 @@ class ImageMetadataAdjuster:
     def set_content_tags(self, new_tags: str):
         exif = self.read_metadata()
 
-        # Split tags into a set to remove duplicates
-        tag_set = set(tag.strip() for tag in new_tags.split(",") if tag.strip())
-        tag_set = set(
-            re.sub(r"\W+", "_", tag.strip().replace(" ", "_"))  # Replace invalid chars and spaces with underscores
-            for tag in new_tags.split(",")
-            if tag.strip()
-        )
+        exif["0th"][piexif.ImageIFD.XPComment] = normalize_content_tags(new_tags).encode("utf-16le")
+        self.exif = exif
 
-        # Join tags back into a string
-        merged_tags = ", ".join(sorted(tag_set))
+    def _write_tmp_file(self, write) -> str:
+        # Written next to the image, so it can be swapped in atomically once the image itself is closed
+        directory, filename = os.path.split(os.path.abspath(self.image_path))
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{filename}.", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as output:
+                write(output)
+            shutil.copymode(self.image_path, tmp_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def _save_jpeg(self, exif_bytes: bytes) -> bool:
+        # Splices the EXIF segment into the JPEG bytes, the image data is copied as is instead of being decoded and re-encoded
+        with open(self.image_path, "rb") as file:
+            if file.read(2) != SOI:
+                return False
+            try:
+                tmp_path = self._write_tmp_file(lambda output: write_jpeg_with_exif(file, output, exif_bytes))
+            except ValueError as e:
+                print(f"Unable to write the EXIF segment of {self.image_path}, falling back to re-encoding: {e}")
+                return False
+        os.replace(tmp_path, self.image_path)
+        return True
 
-        # Check length limit (256 characters in UTF-16LE)
-        if len(merged_tags.encode("utf-16le")) > 512:
-            raise ValueError("These tags exceed the 256 character limit for XPComment")
+    def _save_with_pillow(self, exif_bytes: bytes):
+        from PIL import Image
 
-        exif["0th"][piexif.ImageIFD.XPComment] = merged_tags.encode("utf-16le")
-        self.exif = exif
+        with Image.open(self.image_path) as image:
+            image_format = image.format
+            tmp_path = self._write_tmp_file(lambda output: image.save(output, format=image_format, exif=exif_bytes))
+        os.replace(tmp_path, self.image_path)
 
     def save(self):
-        image = Image.open(self.image_path)
-        image.save(self.image_path, exif=piexif.dump(self.exif))
+        get_metadata_cache().invalidate(self.image_path)
+        exif_bytes = piexif.dump(self.exif)
+        if not self._save_jpeg(exif_bytes):
+            self._save_with_pillow(exif_bytes)
+        # the saved exif is known, so the next read of this version of the file does not need to open it.
+        # It is loaded back from the dumped bytes, to cache the same types a read of the file returns
+        self.exif = piexif.load(exif_bytes)
+        self._cache_metadata(get_file_key(self.image_path))
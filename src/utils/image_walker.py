@@ -0,0 +1,112 @@
+import fnmatch
+import os
+import re
+from typing import Dict, Iterator, List, Tuple
+
+from utils.glob_utils import RECURSIVE_SEGMENT, has_magic, is_hidden
+
+# A directory listing, as (name, DirEntry) pairs in scandir order
+Listing = List[Tuple[str, os.DirEntry]]
+
+
+def _listdir(directory: str, cache: Dict[str, Listing]) -> Listing:
+    key = os.path.normpath(directory or os.curdir)
+    if key in cache:
+        return cache.pop(key)
+
+    listing = []
+    try:
+        with os.scandir(directory or os.curdir) as entries:
+            for entry in entries:
+                listing.append((entry.name, entry))
+    except OSError:
+        pass
+    return listing
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _iter_recursive(directory: str, cache: Dict[str, Listing]) -> Iterator[str]:
+    # Yields every non hidden subdirectory (relative to directory), parents before their children
+    for name, entry in _listdir(directory, cache):
+        if is_hidden(name) or not _is_dir(entry):
+            continue
+        yield name
+        for child in _iter_recursive(os.path.join(directory, name) if directory else name, cache):
+            yield os.path.join(name, child)
+
+
+def _match_in_directory(directory: str, segment: str, cache: Dict[str, Listing]) -> Iterator[str]:
+    if segment == RECURSIVE_SEGMENT:
+        yield ""
+        yield from _iter_recursive(directory, cache)
+    elif has_magic(segment):
+        names = [name for name, entry in _listdir(directory, cache) if _is_dir(entry)]
+        if not is_hidden(segment):
+            names = [name for name in names if not is_hidden(name)]
+        yield from fnmatch.filter(names, segment)
+    elif segment:
+        if os.path.lexists(os.path.join(directory, segment)):
+            yield segment
+    elif os.path.isdir(directory):
+        yield segment
+
+
+def _iter_directories(pattern: str, cache: Dict[str, Listing]) -> Iterator[str]:
+    # Expands a directory pattern in the same order glob.glob(..., recursive=True) would
+    if not has_magic(pattern):
+        yield pattern
+        return
+
+    parent, segment = os.path.split(pattern)
+    if not parent:
+        yield from _match_in_directory("", segment, cache)
+        return
+
+    parents = _iter_directories(parent, cache) if parent != pattern and has_magic(parent) else [parent]
+    for directory in parents:
+        for name in _match_in_directory(directory, segment, cache):
+            yield os.path.join(directory, name)
+
+
+def iter_image_entries(folder_path: str, extensions: List[str]) -> Iterator[Tuple[int, str, os.DirEntry]]:
+    """
+    Walks the directories matching folder_path once, matching every extension in the same pass.
+    Yields (extension index, absolute path, DirEntry) for every match, so the same file is yielded once per matching extension
+    """
+    matchers = [re.compile(fnmatch.translate(os.path.normcase(f"*{ext}"))).match for ext in extensions]
+    # The recursive expansion lists every directory it descends into, keep our listing around so it can reuse it
+    keep_listings = RECURSIVE_SEGMENT in folder_path.replace("\\", "/").split("/")
+    cache: Dict[str, Listing] = {}
+
+    # the directory glob would use for os.path.join(folder_path, "*ext")
+    directory_pattern = os.path.dirname(os.path.join(folder_path, "*"))
+    for directory in _iter_directories(directory_pattern, cache):
+        listing = _listdir(directory, cache)
+        if keep_listings:
+            cache[os.path.normpath(directory or os.curdir)] = listing
+
+        for name, entry in listing:
+            if is_hidden(name):
+                continue
+            normalized_name = os.path.normcase(name)
+            for ext_index, match in enumerate(matchers):
+                if match(normalized_name):
+                    yield ext_index, os.path.abspath(os.path.join(directory, name)), entry
+
+
+def find_image_entries(folder_path: str, extensions: List[str]) -> List[Tuple[str, os.DirEntry]]:
+    """
+    Same result as globbing os.path.join(folder_path, f"*{ext}") recursively for every extension in turn,
+    but with a single directory traversal. The DirEntry is kept so callers can reuse its stat result
+    """
+    results_per_extension: List[List[Tuple[str, os.DirEntry]]] = [[] for _ in extensions]
+    for ext_index, path, entry in iter_image_entries(folder_path, extensions):
+        results_per_extension[ext_index].append((path, entry))
+    return [result for results in results_per_extension for result in results]
+
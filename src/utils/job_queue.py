@@ -0,0 +1,225 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+current_script_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_script_path, os.pardir, os.pardir))
+
+JOB_QUEUE_PATH = os.path.join(project_root, "job_queue", "jobs.sqlite3")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_MAX_ATTEMPTS = 3
+# Delay before the first retry of a failed job, doubled on every following attempt
+RETRY_BACKOFF_SECONDS = 60
+# Workers renew the lease of their running job this often, however long the post takes
+HEARTBEAT_SECONDS = 60
+# Running jobs whose lease was not renewed for this long belong to a worker that died, they are handed out again
+STALE_AFTER_SECONDS = 5 * HEARTBEAT_SECONDS
+
+# Fan out mode posting to every platform of the account, see schedule_image.py
+FAN_OUT_MODE = "All"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_name TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    file TEXT,
+    due_at REAL NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_due ON jobs (status, due_at);
+"""
+
+JOB_COLUMNS = "id, account_name, platform, file, due_at, priority, status, attempts, max_attempts, last_error"
+
+
+class Job(NamedTuple):
+    id: int
+    account_name: str
+    platform: str
+    file: Optional[str]
+    due_at: float
+    priority: int
+    status: str
+    attempts: int
+    max_attempts: int
+    last_error: Optional[str]
+
+
+def get_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def get_retry_delay(attempts: int) -> float:
+    return RETRY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0)
+
+
+def split_platforms(account_name: str, platform: str) -> List[str]:
+    # The platforms a job posts to, a fan out job (eg: Twitter,Deviant) posts to each of them
+    return [platform.strip() for platform in platform.split(",") if platform.strip()]
+
+
+class JobQueue:
+    """
+    Durable queue of posts, stored in sqlite so jobs survive a crash and several worker processes can share it.
+    A job is claimed by exactly one worker, failures are retried with exponential backoff until max_attempts is reached.
+    """
+
+    def __init__(self, db_path: str, clock=time.time):
+        self.db_path = db_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        # autocommit, claims manage their own (immediate) transaction
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        # queues created before the lease was renewed by a heartbeat
+        if "heartbeat_at" not in {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}:
+            self._connection.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    def close(self):
+        self._connection.close()
+
+    def enqueue(
+        self,
+        account_name: str,
+        platform: str,
+        file: Optional[str] = None,
+        due_at: Optional[float] = None,
+        priority: int = 0,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> int:
+        now = self._clock()
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (account_name, platform, file, due_at, priority, status, max_attempts, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (account_name, platform, file, due_at if due_at is not None else now, priority, PENDING, max_attempts, now),
+            )
+            return cursor.lastrowid
+
+    def claim(
+        self,
+        worker_id: str,
+        platform_limits: Optional[Dict[str, int]] = None,
+        get_platforms: Callable[[str, str], List[str]] = split_platforms,
+    ) -> Optional[Job]:
+        """
+        Atomically hands the most urgent due job to the worker, or returns None.
+        Accounts with a running job and platforms at their limit are skipped, for every worker sharing the queue.
+        get_platforms(account_name, platform) expands the platforms of a fan out job, All is counted against every
+        limited platform when it is not expanded.
+        """
+        now = self._clock()
+        platform_limits = platform_limits or {}
+
+        def job_platforms(account_name: str, platform: str) -> List[str]:
+            platforms = get_platforms(account_name, platform)
+            return list(platform_limits) if FAN_OUT_MODE in platforms else platforms
+
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers can never select the same job
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "UPDATE jobs SET status = ?, claimed_by = NULL WHERE status = ? AND COALESCE(heartbeat_at, claimed_at) < ?",
+                    (PENDING, RUNNING, now - STALE_AFTER_SECONDS),
+                )
+
+                running = Counter()
+                for account_name, platform in self._connection.execute("SELECT account_name, platform FROM jobs WHERE status = ?", (RUNNING,)):
+                    running.update(job_platforms(account_name, platform))
+                full_platforms = {platform for platform, limit in platform_limits.items() if running[platform] >= limit}
+
+                candidates = self._connection.execute(
+                    f"SELECT {JOB_COLUMNS} FROM jobs WHERE status = ? AND due_at <= ?"
+                    " AND account_name NOT IN (SELECT account_name FROM jobs WHERE status = ?)"
+                    " ORDER BY priority DESC, due_at, id",
+                    (PENDING, now, RUNNING),
+                )
+                # a fan out job needs room on every platform it posts to
+                row = next((row for row in candidates if full_platforms.isdisjoint(job_platforms(row[1], row[2]))), None)
+                if row is None:
+                    self._connection.execute("COMMIT")
+                    return None
+
+                self._connection.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, claimed_by = ?, claimed_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (RUNNING, worker_id, now, now, row[0]),
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        job = Job(*row)
+        return job._replace(status=RUNNING, attempts=job.attempts + 1)
+
+    def heartbeat(self, job_id: int) -> bool:
+        """Renews the lease of a running job, so it is not handed to another worker while it is still being posted"""
+        with self._lock:
+            cursor = self._connection.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?", (self._clock(), job_id, RUNNING))
+            return cursor.rowcount > 0
+
+    def complete(self, job_id: int):
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET status = ?, finished_at = ?, last_error = NULL WHERE id = ?", (DONE, self._clock(), job_id))
+
+    def fail(self, job_id: int, error: str, retry: bool = True) -> Optional[float]:
+        """Schedules a retry with backoff and returns its due time, or marks the job failed when it has no attempts left"""
+        now = self._clock()
+        with self._lock:
+            attempts, max_attempts = self._connection.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not retry or attempts >= max_attempts:
+                self._connection.execute("UPDATE jobs SET status = ?, finished_at = ?, last_error = ? WHERE id = ?", (FAILED, now, error, job_id))
+                return None
+            retry_at = now + get_retry_delay(attempts)
+            self._connection.execute("UPDATE jobs SET status = ?, due_at = ?, last_error = ? WHERE id = ?", (PENDING, retry_at, error, job_id))
+            return retry_at
+
+    def defer(self, job_id: int, until: float, reason: str):
+        """Puts the job back until the given time without using up an attempt, eg: when the platform is rate limited"""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, due_at = ?, attempts = attempts - 1, last_error = ? WHERE id = ?", (PENDING, until, reason, job_id)
+            )
+
+    def reprioritize(self, job_id: int, priority: int) -> bool:
+        with self._lock:
+            cursor = self._connection.execute("UPDATE jobs SET priority = ? WHERE id = ? AND status = ?", (priority, job_id, PENDING))
+            return cursor.rowcount > 0
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            row = self._connection.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(*row) if row is not None else None
+
+    def jobs(self, status: Optional[str] = None) -> List[Job]:
+        query = f"SELECT {JOB_COLUMNS} FROM jobs"
+        params = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY priority DESC, due_at, id", params).fetchall()
+        return [Job(*row) for row in rows]
+
+    def next_due_at(self) -> Optional[float]:
+        with self._lock:
+            return self._connection.execute("SELECT MIN(due_at) FROM jobs WHERE status = ?", (PENDING,)).fetchone()[0]
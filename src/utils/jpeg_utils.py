@@ -0,0 +1,202 @@
+import io
+import os
+from typing import BinaryIO, Iterator, List, Tuple
+
+SOI = b"\xff\xd8"
+SOS = 0xDA
+EOI = 0xD9
+COM = 0xFE
+APP0 = 0xE0
+APP1 = 0xE1
+APP2 = 0xE2
+APP14 = 0xEE
+APP15 = 0xEF
+
+EXIF_HEADER = b"Exif\x00\x00"
+# the segment length field is 2 bytes and counts itself
+MAX_SEGMENT_PAYLOAD = 0xFFFF - 2
+
+# read size when streaming the image data of large files
+CHUNK_SIZE = 1024 * 1024
+
+# markers without a length field
+STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+
+
+def is_jpeg(data: bytes) -> bool:
+    return data[:2] == SOI
+
+
+def iter_file_segments(file: BinaryIO) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yields (marker, start, end) for every segment before the image data, where start:end spans the full segment
+    including its marker. The last segment yielded is SOS (or EOI), its end is the end of the file as everything from
+    there on is entropy coded image data. Only the marker and length fields are read, segment bodies are skipped
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    if file.read(2) != SOI:
+        raise ValueError("Not a JPEG file")
+
+    position = 2
+    while position < size:
+        # the caller may read from the file in between segments
+        file.seek(position)
+        if file.read(1) != b"\xff":
+            raise ValueError(f"Expected a JPEG marker at offset {position}")
+        # markers may be preceded by any number of fill bytes
+        marker_byte = file.read(1)
+        while marker_byte == b"\xff":
+            position += 1
+            marker_byte = file.read(1)
+        if not marker_byte:
+            break
+
+        marker = marker_byte[0]
+        if marker in (SOS, EOI):
+            yield marker, position, size
+            return
+        if marker in STANDALONE_MARKERS:
+            yield marker, position, position + 2
+            position += 2
+            continue
+
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            raise ValueError("Truncated JPEG segment")
+        length = int.from_bytes(length_bytes, "big")
+        end = position + 2 + length
+        if length < 2 or end > size:
+            raise ValueError(f"Invalid length for JPEG segment at offset {position}")
+        yield marker, position, end
+        position = end
+
+    raise ValueError("JPEG file contains no image data")
+
+
+def iter_segments(data: bytes) -> Iterator[Tuple[int, int, int]]:
+    """Same as iter_file_segments, data[start:end] is the full segment"""
+    return iter_file_segments(io.BytesIO(data))
+
+
+def is_metadata_segment(marker: int, payload: bytes) -> bool:
+    """
+    APPn and comment segments carry metadata (EXIF, XMP, IPTC, ...). The JFIF header, ICC colour profiles and the
+    Adobe colour transform are kept, as dropping those changes how the image is rendered
+    """
+    if marker == COM:
+        return True
+    if not APP0 <= marker <= APP15:
+        return False
+    if marker == APP0:
+        return False
+    if marker == APP2 and payload.startswith(b"ICC_PROFILE\0"):
+        return False
+    if marker == APP14 and payload.startswith(b"Adobe"):
+        return False
+    return True
+
+
+def strip_jpeg_metadata(data: bytes) -> bytes:
+    """Removes the metadata segments straight from the JPEG byte stream, the image data itself is copied as is"""
+    parts = [SOI]
+    for marker, start, end in iter_segments(data):
+        if is_metadata_segment(marker, data[start + 4 : start + 4 + 14]):
+            continue
+        parts.append(data[start:end])
+    return b"".join(parts)
+
+
+def _kept_segments(file: BinaryIO) -> List[Tuple[int, int]]:
+    kept = []
+    for marker, start, end in iter_file_segments(file):
+        file.seek(start + 4)
+        if not is_metadata_segment(marker, file.read(14)):
+            kept.append((start, end))
+    return kept
+
+
+def stripped_jpeg_size(file: BinaryIO) -> int:
+    """Size of the JPEG once its metadata is stripped, without reading the image data"""
+    return len(SOI) + sum(end - start for start, end in _kept_segments(file))
+
+
+def iter_stripped_jpeg(file: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Streams the JPEG without its metadata segments in chunks of at most chunk_size bytes"""
+    kept = _kept_segments(file)
+    yield SOI
+    for start, end in kept:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                raise ValueError("JPEG file was truncated while streaming")
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _copy_range(file: BinaryIO, output: BinaryIO, start: int, end: int, chunk_size: int):
+    file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = file.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ValueError("JPEG file was truncated while copying")
+        output.write(chunk)
+        remaining -= len(chunk)
+
+
+def write_jpeg_with_exif(file: BinaryIO, output: BinaryIO, exif_bytes: bytes, chunk_size: int = CHUNK_SIZE):
+    """
+    Writes the JPEG with its EXIF (APP1) segment replaced by exif_bytes, as piexif.insert does, but without holding the file in memory.
+    Every other segment and the image data are copied byte for byte, a missing EXIF segment is added after SOI (or the JFIF header)
+    """
+    if not exif_bytes.startswith(EXIF_HEADER):
+        raise ValueError("EXIF data should start with the Exif header")
+    if len(exif_bytes) > MAX_SEGMENT_PAYLOAD:
+        raise ValueError("EXIF data does not fit in a single APP1 segment")
+    exif_segment = bytes([0xFF, APP1]) + (len(exif_bytes) + 2).to_bytes(2, "big") + exif_bytes
+
+    segments = []
+    for marker, start, end in iter_file_segments(file):
+        file.seek(start + 4)
+        is_exif = marker == APP1 and file.read(len(EXIF_HEADER)) == EXIF_HEADER
+        segments.append((marker, start, end, is_exif))
+
+    has_exif = any(is_exif for _, _, _, is_exif in segments)
+
+    output.write(SOI)
+    written_exif = False
+    for index, (marker, start, end, is_exif) in enumerate(segments):
+        if is_exif:
+            # the first EXIF segment is replaced in place, further ones are dropped as they would shadow the new one
+            if not written_exif:
+                output.write(exif_segment)
+                written_exif = True
+            continue
+        if not has_exif and not written_exif and not (index == 0 and marker == APP0):
+            output.write(exif_segment)
+            written_exif = True
+        _copy_range(file, output, start, end, chunk_size)
+
+
+def strip_metadata_with_pillow(data: bytes) -> bytes:
+    # Fallback for non JPEG (or malformed) inputs, re-saves the image in its own format without its metadata
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        output = io.BytesIO()
+        options = {"quality": "keep"} if image.format == "JPEG" else {}
+        image.save(output, format=image.format, **options)
+        return output.getvalue()
+
+
+def strip_image_metadata(data: bytes) -> bytes:
+    if is_jpeg(data):
+        try:
+            return strip_jpeg_metadata(data)
+        except ValueError as e:
+            print(f"Unable to strip metadata from the JPEG stream, falling back to re-encoding: {e}")
+    return strip_metadata_with_pillow(data)
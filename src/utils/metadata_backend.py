@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Optional
+
+from models.account import Account
+from utils.file_lock import file_lock, write_json_atomic
+from utils.image_metadata_adjuster import ImageMetadataAdjuster, merge_keywords, normalize_content_tags
+from utils.metadata_cache import get_file_key
+
+SIDECAR_FILENAME = ".image_metadata.json"
+# Lock file next to the sidecar, the sidecar itself is replaced on every write so it cannot be locked
+SIDECAR_LOCK_FILENAME = ".image_metadata.lock"
+
+CAPTION = "caption"
+KEYWORDS = "keywords"
+CONTENT_TAGS = "content_tags"
+
+_lock = threading.Lock()
+
+
+def get_sidecar_path(image_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(image_path)), SIDECAR_FILENAME)
+
+
+def _read_sidecar(sidecar_path: str) -> Dict[str, Dict[str, str]]:
+    try:
+        with open(sidecar_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Ignoring unreadable metadata sidecar {sidecar_path}: {e}")
+        return {}
+
+
+def _write_sidecar(sidecar_path: str, entries: Dict[str, Dict[str, str]]):
+    if not entries:
+        if os.path.exists(sidecar_path):
+            os.remove(sidecar_path)
+        return
+    write_json_atomic(sidecar_path, entries, indent=2, ensure_ascii=False, sort_keys=True)
+
+
+@contextmanager
+def _locked(*sidecar_paths: str):
+    # Every process editing the metadata of a directory (eg: the image selector and a scheduled post) takes its lock
+    with _lock, ExitStack() as stack:
+        for sidecar_path in sorted(set(sidecar_paths)):
+            stack.enter_context(file_lock(os.path.join(os.path.dirname(sidecar_path), SIDECAR_LOCK_FILENAME)))
+        yield
+
+
+def read_sidecar_entry(image_path: str) -> Dict[str, str]:
+    """The metadata of the image stored in the sidecar of its directory, only the fields that were set"""
+    sidecar_path = get_sidecar_path(image_path)
+    # most directories have no sidecar, checking is cheaper than opening it
+    if not os.path.exists(sidecar_path):
+        return {}
+    return _read_sidecar(sidecar_path).get(os.path.basename(image_path), {})
+
+
+def write_sidecar_entry(image_path: str, entry: Dict[str, str]):
+    sidecar_path = get_sidecar_path(image_path)
+    with _locked(sidecar_path):
+        entries = _read_sidecar(sidecar_path)
+        entries[os.path.basename(image_path)] = entry
+        _write_sidecar(sidecar_path, entries)
+
+
+def remove_sidecar_entry(image_path: str):
+    sidecar_path = get_sidecar_path(image_path)
+    with _locked(sidecar_path):
+        entries = _read_sidecar(sidecar_path)
+        if entries.pop(os.path.basename(image_path), None) is not None:
+            _write_sidecar(sidecar_path, entries)
+
+
+def rename_sidecar_entry(image_path: str, new_image_path: str):
+    # The entries are stored by filename, so they have to follow the image when its tags are renamed
+    sidecar_path = get_sidecar_path(image_path)
+    if not os.path.exists(sidecar_path):
+        return
+    new_sidecar_path = get_sidecar_path(new_image_path)
+    with _locked(sidecar_path, new_sidecar_path):
+        entries = _read_sidecar(sidecar_path)
+        entry = entries.pop(os.path.basename(image_path), None)
+        if entry is None:
+            return
+        if new_sidecar_path != sidecar_path:
+            _write_sidecar(sidecar_path, entries)
+            entries = _read_sidecar(new_sidecar_path)
+        entries[os.path.basename(new_image_path)] = entry
+        _write_sidecar(new_sidecar_path, entries)
+
+
+class SidecarMetadataAdjuster(ImageMetadataAdjuster):
+    """
+    Keeps caption, content tags and posted keywords in a JSON sidecar per directory instead of in the image EXIF, so an edit
+    writes a few bytes instead of the whole image. Fields missing from the sidecar are read from the EXIF.
+    flush() writes the sidecar fields into the EXIF, eg: once the image is posted.
+    """
+
+    def __init__(self, image_path: str, exif: Optional[dict] = None):
+        super().__init__(image_path, exif)
+        self.entry = read_sidecar_entry(image_path)
+
+    def get_caption(self) -> str:
+        if CAPTION in self.entry:
+            return self.entry[CAPTION]
+        return super().get_caption()
+
+    def get_keywords(self) -> str:
+        if KEYWORDS in self.entry:
+            return self.entry[KEYWORDS]
+        return super().get_keywords()
+
+    def get_content_tags(self) -> str:
+        if CONTENT_TAGS in self.entry:
+            return self.entry[CONTENT_TAGS]
+        return super().get_content_tags()
+
+    def add_tags(self, tags):
+        self.entry[KEYWORDS] = merge_keywords(self.get_keywords(), tags)
+
+    def add_subject(self, subject):
+        self.entry[CAPTION] = subject
+
+    def set_content_tags(self, new_tags: str):
+        self.entry[CONTENT_TAGS] = normalize_content_tags(new_tags)
+
+    def save(self):
+        write_sidecar_entry(self.image_path, self.entry)
+        # the image itself is unchanged, only the decoded tags of the metadata store have to be updated
+        self.read_metadata()
+        self._cache_metadata(get_file_key(self.image_path))
+
+    def flush(self):
+        """Writes the sidecar fields into the EXIF of the image, and drops them from the sidecar"""
+        if not self.entry:
+            return
+        if CAPTION in self.entry:
+            super().add_subject(self.entry[CAPTION])
+        if KEYWORDS in self.entry:
+            self.set_keywords(self.entry[KEYWORDS])
+        if CONTENT_TAGS in self.entry:
+            super().set_content_tags(self.entry[CONTENT_TAGS])
+        self.entry = {}
+        super().save()
+        remove_sidecar_entry(self.image_path)
+
+
+def get_metadata_adjuster(account: Account, image_path: str, exif: Optional[dict] = None) -> ImageMetadataAdjuster:
+    """The adjuster of the metadata backend configured for the account"""
+    if account.metadata_config.backend == "sidecar":
+        return SidecarMetadataAdjuster(image_path, exif)
+    return ImageMetadataAdjuster(image_path, exif)
+
+
+def save_posted_metadata(account: Account, adjuster: ImageMetadataAdjuster):
+    # The image is rewritten once it is posted rather than on every edit, when the account flushes on upload
+    if isinstance(adjuster, SidecarMetadataAdjuster) and account.metadata_config.flush_on_upload:
+        adjuster.flush()
+    else:
+        adjuster.save()
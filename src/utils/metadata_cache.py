@@ -0,0 +1,233 @@
+import atexit
+import copy
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+current_script_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_script_path, os.pardir, os.pardir))
+
+METADATA_STORE_PATH = os.environ.get("METADATA_STORE_PATH", os.path.join(project_root, "metadata_cache", "metadata.sqlite3"))
+
+MAX_CACHED_FILES = 512
+
+# Reads of new files are written to the store in batches, rather than with a commit per file
+COMMIT_BATCH_SIZE = 100
+COMMIT_INTERVAL_SECONDS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    exif BLOB,
+    caption TEXT NOT NULL,
+    keywords TEXT NOT NULL,
+    content_tags TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class MetadataEntry(NamedTuple):
+    path: str
+    caption: str
+    keywords: str
+    content_tags: str
+
+
+class FileKey(NamedTuple):
+    path: str
+    mtime_ns: int
+    size: int
+
+
+def get_file_key(path: str) -> Optional[FileKey]:
+    # Any write to the file changes its mtime (and usually size), so cached metadata of an older version is never returned
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return FileKey(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+class MetadataCache:
+    """
+    Bounded LRU of the parsed exif per file version, shared by every ImageMetadataAdjuster of the process.
+    Entries are copied on the way in and out, as the adjuster edits the exif dict it was given.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_FILES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[FileKey, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: FileKey) -> Optional[dict]:
+        with self._lock:
+            exif = self._entries.get(key)
+            if exif is None:
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(exif)
+
+    def put(self, key: FileKey, exif: dict):
+        exif = copy.deepcopy(exif)
+        with self._lock:
+            self._entries[key] = exif
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: str):
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [key for key in self._entries if key.path == path]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class MetadataStore:
+    """
+    The metadata of every file read before, stored in sqlite so a new process skips parsing the exif of unchanged files.
+    Caption, keywords and content tags are stored decoded next to the exif, so they can be queried.
+    Files indexed by metadata_index.py only have the decoded tags, their exif is parsed on first use.
+    Single files are buffered and written in batches, the buffer is written on close and at exit.
+    """
+
+    def __init__(self, db_path: str, clock=time.time):
+        self.db_path = db_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        # rows by path, not yet written
+        self._pending: Dict[str, tuple] = {}
+        self._pending_since = 0.0
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO metadata (path, mtime_ns, size, exif, caption, keywords, content_tags, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            list(self._pending.values()),
+        )
+        self._connection.commit()
+        self._pending.clear()
+
+    def get(self, key: FileKey) -> Optional[dict]:
+        with self._lock:
+            pending = self._pending.get(key.path)
+            if pending is not None:
+                row = (pending[3],) if pending[1:3] == (key.mtime_ns, key.size) and pending[3] is not None else None
+            else:
+                row = self._connection.execute(
+                    "SELECT exif FROM metadata WHERE path = ? AND mtime_ns = ? AND size = ? AND exif IS NOT NULL", (key.path, key.mtime_ns, key.size)
+                ).fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def put(self, key: FileKey, exif: dict, caption: str, keywords: str, content_tags: str):
+        now = self._clock()
+        row = (key.path, key.mtime_ns, key.size, pickle.dumps(exif, protocol=pickle.HIGHEST_PROTOCOL), caption, keywords, content_tags, now)
+        with self._lock:
+            if not self._pending:
+                self._pending_since = now
+            self._pending[key.path] = row
+            if len(self._pending) >= COMMIT_BATCH_SIZE or now - self._pending_since >= COMMIT_INTERVAL_SECONDS:
+                self._flush()
+
+    def get_version(self, path: str) -> Optional[Tuple[int, int, float]]:
+        """(mtime_ns, size, updated_at) of the stored version of the file"""
+        with self._lock:
+            self._flush()
+            row = self._connection.execute("SELECT mtime_ns, size, updated_at FROM metadata WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def put_tags_many(self, entries: List[Tuple[FileKey, str, str, str]]):
+        """Stores (key, caption, keywords, content tags) of many files in one transaction"""
+        now = self._clock()
+        with self._lock:
+            self._flush()
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO metadata (path, mtime_ns, size, exif, caption, keywords, content_tags, updated_at) VALUES (?, ?, ?, NULL, ?, ?, ?, ?)",
+                [(key.path, key.mtime_ns, key.size, caption, keywords, content_tags, now) for key, caption, keywords, content_tags in entries],
+            )
+            self._connection.commit()
+
+    def iter_entries(self, roots: Optional[List[str]] = None) -> Iterator[MetadataEntry]:
+        """Stored metadata of the files below any of the given directories, or of all files"""
+        query = "SELECT path, caption, keywords, content_tags FROM metadata"
+        params = []
+        if roots:
+            query += " WHERE " + " OR ".join("substr(path, 1, ?) = ?" for _ in roots)
+            for root in roots:
+                prefix = os.path.abspath(root).rstrip(os.sep) + os.sep
+                params += [len(prefix), prefix]
+        with self._lock:
+            self._flush()
+            rows = self._connection.execute(query + " ORDER BY path", params).fetchall()
+        return (MetadataEntry(*row) for row in rows)
+
+    def search(self, text: str, roots: Optional[List[str]] = None) -> List[MetadataEntry]:
+        text = text.lower()
+        return [entry for entry in self.iter_entries(roots) if text in entry.caption.lower() or text in entry.content_tags.lower()]
+
+    def untagged(self, roots: Optional[List[str]] = None) -> List[MetadataEntry]:
+        return [entry for entry in self.iter_entries(roots) if not entry.content_tags.strip()]
+
+    def tag_stats(self, roots: Optional[List[str]] = None) -> Counter:
+        counts = Counter()
+        for entry in self.iter_entries(roots):
+            counts.update(tag.strip() for tag in entry.content_tags.split(",") if tag.strip())
+        return counts
+
+    def prune(self, roots: Optional[List[str]] = None) -> int:
+        """Drops the entries of files that no longer exist, eg: renamed when posted"""
+        missing = [entry.path for entry in self.iter_entries(roots) if not os.path.exists(entry.path)]
+        with self._lock:
+            self._connection.executemany("DELETE FROM metadata WHERE path = ?", [(path,) for path in missing])
+            self._connection.commit()
+        return len(missing)
+
+    def remove(self, path: str):
+        with self._lock:
+            self._pending.pop(os.path.abspath(path), None)
+            self._connection.execute("DELETE FROM metadata WHERE path = ?", (os.path.abspath(path),))
+            self._connection.commit()
+
+
+_cache: Optional[MetadataCache] = None
+_store: Optional[MetadataStore] = None
+_lock = threading.Lock()
+
+
+def get_metadata_cache() -> MetadataCache:
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = MetadataCache()
+        return _cache
+
+
+def get_metadata_store() -> MetadataStore:
+    global _store
+    with _lock:
+        if _store is None:
+            _store = MetadataStore(METADATA_STORE_PATH)
+            atexit.register(_store.flush)
+        return _store
@@ -0,0 +1,64 @@
+import mimetypes
+import uuid
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Union
+
+
+class MultipartFile(NamedTuple):
+    filename: str
+    size: int
+    # called for every pass over the body, a retried request needs to stream the file again
+    open_chunks: Callable[[], Iterable[bytes]]
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class MultipartEncoder:
+    """
+    multipart/form-data body that is produced while it is sent, files are streamed in chunks instead of being read into memory.
+    The length is known upfront, so requests sends a Content-Length instead of a chunked body.
+    Fields follow the requests conventions: a list value adds the field once per item.
+    """
+
+    boundary: str
+    content_type: str
+
+    def __init__(self, fields: Dict[str, Union[str, List[str]]], files: Dict[str, MultipartFile]):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._fields = [(name, str(item)) for name, value in fields.items() for item in (value if isinstance(value, list) else [value])]
+        self._files = list(files.items())
+
+    def _field_header(self, name: str) -> bytes:
+        return f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'.encode("utf-8")
+
+    def _file_header(self, name: str, file: MultipartFile) -> bytes:
+        content_type = mimetypes.guess_type(file.filename)[0] or "application/octet-stream"
+        return (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{_quote(name)}"; filename="{_quote(file.filename)}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+
+    def _closing(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("utf-8")
+
+    def __len__(self) -> int:
+        fields_length = sum(len(self._field_header(name)) + len(value.encode("utf-8")) + 2 for name, value in self._fields)
+        files_length = sum(len(self._file_header(name, file)) + file.size + 2 for name, file in self._files)
+        return fields_length + files_length + len(self._closing())
+
+    def __iter__(self) -> Iterator[bytes]:
+        for name, value in self._fields:
+            yield self._field_header(name) + value.encode("utf-8") + b"\r\n"
+        for name, file in self._files:
+            yield self._file_header(name, file)
+            written = 0
+            for chunk in file.open_chunks():
+                written += len(chunk)
+                yield chunk
+            if written != file.size:
+                raise ValueError(f"{file.filename} streamed {written} bytes, expected {file.size}")
+            yield b"\r\n"
+        yield self._closing()
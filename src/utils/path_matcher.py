@@ -0,0 +1,59 @@
+import fnmatch
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class PathClassification(NamedTuple):
+    included: bool
+    # indexes of the matching entries in the account sub_configs
+    sub_config_ids: Tuple[int, ...]
+
+
+def _translate(directory_pattern: str) -> str:
+    # Same semantics as fnmatch.fnmatch(path, f"{directory_pattern}/*")
+    return fnmatch.translate(os.path.normcase(f"{directory_pattern}/*"))
+
+
+def _compile_any(directory_patterns: List[str]) -> Optional[re.Pattern]:
+    if len(directory_patterns) == 0:
+        return None
+    return re.compile("|".join(f"(?:{_translate(pattern)})" for pattern in directory_patterns))
+
+
+class PathMatcher:
+    """
+    Classifies paths against the scheduler profile and sub config directory patterns of an account.
+    The patterns are compiled once, and since a pattern ending in /* can only be satisfied by the directory part of a path,
+    results are memoized per parent directory.
+    """
+
+    def __init__(self, include_patterns: List[str], exclude_patterns: List[str], sub_config_patterns: List[str]):
+        self._filter_by_profiles = len(include_patterns) > 0
+        self._include = _compile_any(include_patterns)
+        self._exclude = _compile_any(exclude_patterns)
+        self._sub_configs = [(index, _compile_any([pattern])) for index, pattern in enumerate(sub_config_patterns)]
+        self._cache: Dict[str, PathClassification] = {}
+
+    def classify(self, path: str) -> PathClassification:
+        normalized_path = os.path.normcase(path)
+        parent = normalized_path[: normalized_path.rfind(os.sep) + 1]
+
+        classification = self._cache.get(parent)
+        if classification is None:
+            classification = PathClassification(
+                included=self._is_included(normalized_path),
+                sub_config_ids=tuple(index for index, pattern in self._sub_configs if pattern.match(normalized_path)),
+            )
+            self._cache[parent] = classification
+        return classification
+
+    def _is_included(self, path: str) -> bool:
+        # No-op without scheduler profiles
+        if not self._filter_by_profiles:
+            return True
+
+        if self._exclude and self._exclude.match(path):
+            return False
+
+        return self._include.match(path) is not None
@@ -0,0 +1,131 @@
+import hashlib
+import io
+import os
+from functools import cached_property
+from typing import BinaryIO, Iterator, Optional
+
+from deviant_utils.pick_resolution import resolution_for_width
+from models.account import Account
+from utils.image_metadata_adjuster import load_exif
+from utils.jpeg_utils import CHUNK_SIZE, is_jpeg, iter_stripped_jpeg, strip_image_metadata, stripped_jpeg_size
+from utils.metadata_backend import get_metadata_adjuster
+
+# Files above this size are streamed from disk instead of being held in memory, which bounds the memory of an upload
+STREAMING_THRESHOLD = 8 * 1024 * 1024
+
+
+class PreparedUpload:
+    """
+    Everything the platform clients need to post an image, read from a single read of the file.
+    The pixels are never decoded: dimensions and EXIF come from the image header, and the metadata is stripped from the bytes.
+    Large files are not kept in memory (data is None), their header is read upfront and the stripped bytes are streamed in chunks.
+    """
+
+    path: str
+    account: Account
+    filename: str
+    size: int
+    data: Optional[bytes]
+    format: Optional[str]
+    caption: str
+    content_tags: str
+    width: int
+    height: int
+
+    def __init__(self, path: str, account: Account, data: Optional[bytes] = None, filename: Optional[str] = None):
+        self.path = path
+        self.account = account
+        self.filename = filename or os.path.basename(path)
+        self.data = data
+        with self.open() as file:
+            self.size = os.fstat(file.fileno()).st_size if data is None else len(data)
+            self._read_header(file)
+
+    def _read_header(self, file: BinaryIO):
+        # Pillow is imported lazily, it is a large part of the startup time of the scheduler
+        from PIL import Image
+
+        with Image.open(file) as image:
+            self.width, self.height = image.size
+            self.format = image.format
+            # with the sidecar backend, edits pending in the sidecar take precedence over the EXIF of the image
+            adjuster = get_metadata_adjuster(self.account, self.path, exif=load_exif(image))
+        self.caption = adjuster.get_caption()
+        self.content_tags = adjuster.get_content_tags()
+
+    @property
+    def streamed(self) -> bool:
+        return self.data is None
+
+    @property
+    def display_resolution(self) -> int:
+        # Deviant display resolution code for the width of the image
+        return resolution_for_width(self.width)
+
+    def as_rendition(self, data: bytes, filename: str) -> "PreparedUpload":
+        """The same post with other image bytes, eg: a resized rendition. Caption and content tags are kept"""
+        rendition = PreparedUpload(self.path, self.account, data, filename)
+        rendition.caption = self.caption
+        rendition.content_tags = self.content_tags
+        return rendition
+
+    def open(self) -> BinaryIO:
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.path, "rb")
+
+    @cached_property
+    def content_hash(self) -> str:
+        if self.data is not None:
+            return hashlib.sha256(self.data).hexdigest()
+        digest = hashlib.sha256()
+        with self.open() as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @cached_property
+    def stripped_data(self) -> bytes:
+        if self.data is not None:
+            return strip_image_metadata(self.data)
+        if self._streams_jpeg:
+            return b"".join(self.iter_stripped())
+        with self.open() as file:
+            return strip_image_metadata(file.read())
+
+    @cached_property
+    def _streams_jpeg(self) -> bool:
+        # Other formats, or JPEGs that can not be parsed, are stripped in memory by Pillow
+        with self.open() as file:
+            if not is_jpeg(file.read(2)):
+                return False
+            try:
+                self._stripped_size = stripped_jpeg_size(file)
+                return True
+            except ValueError as e:
+                print(f"Unable to stream {self.path} without metadata, stripping it in memory: {e}")
+                return False
+
+    @property
+    def stripped_size(self) -> int:
+        if self.streamed and self._streams_jpeg:
+            return self._stripped_size
+        return len(self.stripped_data)
+
+    def iter_stripped(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Yields the metadata stripped image in chunks, large JPEGs are never fully loaded in memory"""
+        if self.streamed and self._streams_jpeg:
+            with self.open() as file:
+                yield from iter_stripped_jpeg(file, chunk_size)
+            return
+
+        stripped_data = self.stripped_data
+        for start in range(0, len(stripped_data), chunk_size):
+            yield stripped_data[start : start + chunk_size]
+
+
+def prepare_upload(path: str, account: Account, streaming_threshold: int = STREAMING_THRESHOLD) -> PreparedUpload:
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size > streaming_threshold:
+            return PreparedUpload(path, account)
+        return PreparedUpload(path, account, file.read())
@@ -0,0 +1,7 @@
+import os
+
+
+def lower_priority():
+    # Process pool initializer for background work (renders, indexing), which should not slow down a post happening at the same time
+    if hasattr(os, "nice"):
+        os.nice(10)
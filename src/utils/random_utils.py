@@ -0,0 +1,31 @@
+import random
+from typing import Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def pick_random(items: Iterable[T]) -> Optional[T]:
+    """
+    Picks one item uniformly at random in a single pass (reservoir sampling), without materializing the items.
+    Uses the module level random generator, so random.seed applies. Returns None when there are no items
+    """
+    chosen = None
+    for count, item in enumerate(items, start=1):
+        # the n-th item replaces the current pick with probability 1/n
+        if random.randrange(count) == 0:
+            chosen = item
+    return chosen
+
+
+def sample_random(items: Iterable[T], count: int) -> List[T]:
+    """Picks up to count items uniformly at random in a single pass (reservoir sampling), like pick_random"""
+    reservoir: List[T] = []
+    for index, item in enumerate(items):
+        if index < count:
+            reservoir.append(item)
+            continue
+        # the n-th item replaces a random pick with probability count/n
+        slot = random.randrange(index + 1)
+        if slot < count:
+            reservoir[slot] = item
+    return reservoir
@@ -0,0 +1,164 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+from utils.rate_limiter import parse_retry_after
+
+current_script_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_script_path, os.pardir, os.pardir))
+
+LEDGER_PATH = os.environ.get("RATE_LIMIT_LEDGER_PATH", os.path.join(project_root, "rate_limit_cache", "ledger.sqlite3"))
+
+# Budget of the whole platform, set by a 429 that does not say which limit was hit
+PLATFORM_WIDE = "*"
+# How long a platform is considered exhausted after a 429 without Retry-After or reset header
+DEFAULT_BLOCK_SECONDS = 60
+
+# Twitter reports the 15 minute window per endpoint, and separate 24 hour limits for posting
+LIMIT_HEADER_PREFIXES = ["x-rate-limit", "x-user-limit-24hour", "x-app-limit-24hour"]
+
+PLATFORM_HOSTS = {"twitter.com": "Twitter", "x.com": "Twitter", "deviantart.com": "Deviant"}
+
+ID_SEGMENT = re.compile(r"^(?:\d+|[0-9a-fA-F-]{16,})$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS budgets (
+    account_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    remaining INTEGER NOT NULL,
+    reset_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account_id, platform, endpoint)
+);
+"""
+
+
+class RateLimitedError(Exception):
+    """
+    Raised instead of waiting when the ledger knows a platform has no budget left.
+    rejected is set when the api answered the request with a 429, instead of the ledger failing it before it was sent
+    """
+
+    platform: str
+    next_available_at: datetime
+    rejected: bool
+
+    def __init__(self, platform: str, next_available_at: datetime, rejected: bool = False):
+        super().__init__(f"{platform} is rate limited, next available at {next_available_at:%Y-%m-%d %H:%M:%S}")
+        self.platform = platform
+        self.next_available_at = next_available_at
+        self.rejected = rejected
+
+
+def get_platform_for_url(url: str) -> Optional[str]:
+    host = urlparse(url).hostname or ""
+    for platform_host, platform in PLATFORM_HOSTS.items():
+        if host == platform_host or host.endswith(f".{platform_host}"):
+            return platform
+    return None
+
+
+def get_endpoint(url: str) -> str:
+    # ids in the path (eg: deviation/edit/{deviationid}) share the budget of their endpoint
+    parsed = urlparse(url)
+    segments = ["{id}" if ID_SEGMENT.match(segment) else segment for segment in parsed.path.split("/")]
+    return f"{parsed.hostname}{'/'.join(segments)}"
+
+
+class RateLimitLedger:
+    """
+    Remaining rate limit budget per account, platform and endpoint, as reported by the apis.
+    Stored in sqlite so every scheduler process sees the budget the others used up.
+    """
+
+    def __init__(self, db_path: str, clock=time.time):
+        self.db_path = db_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def record(self, account_id: str, platform: str, endpoint: str, remaining: int, reset_at: float):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO budgets (account_id, platform, endpoint, remaining, reset_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (account_id, platform, endpoint, remaining, reset_at, self._clock()),
+            )
+            self._connection.commit()
+
+    def record_response(self, account_id: str, response):
+        platform = get_platform_for_url(response.url)
+        if platform is None:
+            return
+        endpoint = get_endpoint(response.url)
+        headers = response.headers
+
+        recorded_reset = False
+        for prefix in LIMIT_HEADER_PREFIXES:
+            remaining = headers.get(f"{prefix}-remaining")
+            reset = headers.get(f"{prefix}-reset")
+            if remaining is None or reset is None:
+                continue
+            try:
+                scope = endpoint if prefix == "x-rate-limit" else f"{endpoint}#{prefix}"
+                self.record(account_id, platform, scope, int(remaining), float(reset))
+                recorded_reset = recorded_reset or int(remaining) <= 0
+            except ValueError:
+                continue
+
+        if response.status_code == 429 and not recorded_reset:
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            blocked_for = retry_after if retry_after is not None else DEFAULT_BLOCK_SECONDS
+            self.record(account_id, platform, PLATFORM_WIDE, 0, self._clock() + blocked_for)
+
+    def next_available_at(self, account_id: str, platform: str, endpoint: Optional[str] = None) -> Optional[datetime]:
+        """When the exhausted budget resets, or None when there is budget left. Without endpoint every budget of the platform counts"""
+        query = "SELECT MAX(reset_at) FROM budgets WHERE account_id = ? AND platform = ? AND remaining <= 0 AND reset_at > ?"
+        params = [account_id, platform, self._clock()]
+        if endpoint is not None:
+            query += " AND (endpoint = ? OR endpoint = ? OR substr(endpoint, 1, ?) = ?)"
+            params += [endpoint, PLATFORM_WIDE, len(endpoint) + 1, f"{endpoint}#"]
+        with self._lock:
+            reset_at = self._connection.execute(query, params).fetchone()[0]
+        return datetime.fromtimestamp(reset_at) if reset_at is not None else None
+
+    def check(self, account_id: str, platform: str, endpoint: Optional[str] = None):
+        """Fails fast with RateLimitedError instead of sending a request that would be rejected"""
+        next_available_at = self.next_available_at(account_id, platform, endpoint)
+        if next_available_at is not None:
+            raise RateLimitedError(platform, next_available_at)
+
+    def get_rejection(self, account_id: str, response) -> Optional[RateLimitedError]:
+        """The error for a 429 of a platform, once record_response stored when its budget resets"""
+        platform = get_platform_for_url(response.url)
+        if platform is None or response.status_code != 429:
+            return None
+        next_available_at = self.next_available_at(account_id, platform, get_endpoint(response.url))
+        return RateLimitedError(platform, next_available_at or datetime.fromtimestamp(self._clock()), rejected=True)
+
+    def check_url(self, account_id: str, url: str):
+        platform = get_platform_for_url(url)
+        if platform is not None:
+            self.check(account_id, platform, get_endpoint(url))
+
+
+_ledger: Optional[RateLimitLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_rate_limit_ledger() -> RateLimitLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = RateLimitLedger(LEDGER_PATH)
+        return _ledger
@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+# Multiplicative decrease on a 429, additive increase (a fraction of the configured rate) on every success
+DECREASE_FACTOR = 0.5
+INCREASE_STEP = 0.05
+
+
+def parse_retry_after(value: Optional[str], now: Callable[[], datetime] = lambda: datetime.now(timezone.utc)) -> Optional[float]:
+    """Retry-After is either a number of seconds or an HTTP date, returns the seconds to wait"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - now()).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket pacing requests at `rate` per second, with bursts of up to `capacity` requests.
+    The rate adapts to the api: it is halved on every 429 (and paused for the Retry-After) and slowly recovers
+    towards the configured rate while requests succeed.
+    """
+
+    max_rate: float
+    min_rate: float
+    rate: float
+    capacity: float
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1,
+        min_rate: float = 0.05,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate <= 0:
+            raise ValueError("The rate should be positive")
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self):
+        """Blocks until a request may be sent"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * INCREASE_STEP)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self._tokens = 0
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self._blocked_until = max(self._blocked_until, now + pause)
+
+    def pause(self, seconds: float):
+        """Holds every request for the given time without changing the rate, eg: when the budget is known to be used up"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
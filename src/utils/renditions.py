@@ -0,0 +1,162 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+from typing import BinaryIO, Optional
+
+from models.account import Account, RenditionProfile
+from utils.jpeg_utils import CHUNK_SIZE
+from utils.prepared_upload import PreparedUpload
+
+current_script_path = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_script_path, os.pardir, os.pardir))
+
+RENDITION_CACHE_PATH = os.path.join(project_root, "rendition_cache")
+
+# Lowest quality used to get a rendition below the size cap of its profile
+MIN_QUALITY = 60
+QUALITY_STEP = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+
+class SourceHashIndex:
+    """Remembers the content hash of source images by path, size and mtime, so unchanged files are never hashed twice"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT size, mtime_ns, sha256 FROM source_hashes WHERE path = ?", (path,)).fetchone()
+        if row is None or (row[0], row[1]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return row[2]
+
+    def put(self, path: str, stat: os.stat_result, sha256: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO source_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, sha256),
+            )
+            self._connection.commit()
+
+
+_source_hash_index: Optional[SourceHashIndex] = None
+_source_hash_index_lock = threading.Lock()
+
+
+def get_source_hash_index(cache_dir: str = RENDITION_CACHE_PATH) -> SourceHashIndex:
+    global _source_hash_index
+    with _source_hash_index_lock:
+        if _source_hash_index is None or os.path.dirname(_source_hash_index.db_path) != cache_dir:
+            _source_hash_index = SourceHashIndex(os.path.join(cache_dir, "source_hashes.sqlite3"))
+        return _source_hash_index
+
+
+def hash_file(file: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_rendition_path(source_hash: str, profile: RenditionProfile, cache_dir: str = RENDITION_CACHE_PATH) -> str:
+    # content addressed, a renamed (eg: queued -> posted) or copied file shares its renditions
+    return os.path.join(cache_dir, source_hash[:2], f"{source_hash}-{profile.key}.jpg")
+
+
+def get_platform_rendition_profile(account: Account, platform: str) -> Optional[RenditionProfile]:
+    config = {"Twitter": account.twitter_config, "Deviant": account.deviant_config}.get(platform)
+    return config.rendition if config else None
+
+
+def needs_rendition(width: int, height: int, image_format: Optional[str], size: int, profile: RenditionProfile) -> bool:
+    # Originals that already fit the profile are uploaded as is, re-encoding them would only lose quality
+    too_large = profile.max_dimension is not None and max(width, height) > profile.max_dimension
+    too_heavy = profile.max_bytes > 0 and size > profile.max_bytes
+    return too_large or too_heavy or image_format != "JPEG"
+
+
+def render(file: BinaryIO, profile: RenditionProfile) -> bytes:
+    """Resizes the image to the profile and encodes it as a JPEG without metadata, the colour profile is kept"""
+    # Pillow is imported lazily, it is a large part of the startup time of the scheduler
+    from PIL import Image, ImageOps
+
+    with Image.open(file) as original:
+        icc_profile = original.info.get("icc_profile")
+        # the EXIF orientation is dropped with the rest of the metadata, so it is applied to the pixels
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        if profile.max_dimension is not None:
+            image.thumbnail((profile.max_dimension, profile.max_dimension), Image.LANCZOS)
+
+        quality = profile.quality
+        while True:
+            output = io.BytesIO()
+            options = {"icc_profile": icc_profile} if icc_profile else {}
+            image.save(output, format="JPEG", quality=quality, progressive=profile.progressive, optimize=True, **options)
+            if profile.max_bytes <= 0 or output.tell() <= profile.max_bytes or quality <= MIN_QUALITY:
+                return output.getvalue()
+            quality = max(quality - QUALITY_STEP, MIN_QUALITY)
+
+
+def write_rendition(path: str, data: bytes):
+    # written next to its destination and moved in place, concurrent warm-ups never see a partial rendition
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+
+def get_source_hash(upload: PreparedUpload, index: SourceHashIndex) -> str:
+    stat = os.stat(upload.path)
+    source_hash = index.get(upload.path, stat)
+    if source_hash is None:
+        source_hash = upload.content_hash
+        index.put(upload.path, stat, source_hash)
+    return source_hash
+
+
+def get_rendition(upload: PreparedUpload, profile: RenditionProfile, cache_dir: str = RENDITION_CACHE_PATH) -> PreparedUpload:
+    """Returns the upload with the rendition for the profile, from the cache when it was rendered before"""
+    if not needs_rendition(upload.width, upload.height, upload.format, upload.size, profile):
+        return upload
+
+    source_hash = get_source_hash(upload, get_source_hash_index(cache_dir))
+    rendition_path = get_rendition_path(source_hash, profile, cache_dir)
+    try:
+        with open(rendition_path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        print(f"Rendering {upload.path} for profile {profile.key}")
+        with upload.open() as file:
+            data = render(file, profile)
+        write_rendition(rendition_path, data)
+
+    filename = f"{os.path.splitext(upload.filename)[0]}.jpg"
+    return upload.as_rendition(data, filename)
+
+
+def prepare_platform_upload(account: Account, platform: str, upload: PreparedUpload) -> PreparedUpload:
+    profile = get_platform_rendition_profile(account, platform)
+    if profile is None:
+        return upload
+    # looked up on every call rather than bound as a default, so the cache can be moved (eg: by the tests)
+    return get_rendition(upload, profile, RENDITION_CACHE_PATH)
@@ -0,0 +1,95 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from models.account import Account, RenditionProfile
+from utils.account_loader import select_account
+from utils.constants import QUEUE_TAG_MAPPING
+from utils.file_utils import iter_images_in_folders
+from utils.process_utils import lower_priority
+from utils.renditions import (
+    RENDITION_CACHE_PATH,
+    get_platform_rendition_profile,
+    get_rendition_path,
+    get_source_hash_index,
+    hash_file,
+    needs_rendition,
+    render,
+    write_rendition,
+)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Renders the upload renditions of every queued image ahead of time")
+    parser.add_argument("account", help="Account name matching the account(s) in the accounts.yml file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of render processes (default: one per cpu)")
+    parser.add_argument("--scheduler-profile-ids", default=None, help="Only warm the images of specific schedule profiles")
+    return parser.parse_args()
+
+
+def get_queued_profiles(account: Account) -> Dict[str, List[RenditionProfile]]:
+    """Rendition profiles needed per queued file, for every platform of the account that has one"""
+    profiles_by_file: Dict[str, List[RenditionProfile]] = {}
+    for platform in account.platforms:
+        profile = get_platform_rendition_profile(account, platform)
+        if profile is None:
+            continue
+        queued_tag = QUEUE_TAG_MAPPING[platform]
+        for file in iter_images_in_folders(account, [platform], skip_queued=False, skip_posted=True, required_tags=[queued_tag]):
+            profiles_by_file.setdefault(file, []).append(profile)
+    return profiles_by_file
+
+
+def warm_file(path: str, profiles: List[RenditionProfile], source_hash: Optional[str], cache_dir: str) -> Tuple[str, Optional[str], int]:
+    """Renders the missing renditions of one file in a worker process, returns (path, source hash, rendered count)"""
+    # Pillow is imported lazily, it is a large part of the startup time of the scheduler
+    from PIL import Image
+
+    rendered = 0
+    try:
+        with open(path, "rb") as file:
+            if source_hash is None:
+                source_hash = hash_file(file)
+            size = os.fstat(file.fileno()).st_size
+            file.seek(0)
+            with Image.open(file) as image:
+                width, height = image.size
+                image_format = image.format
+
+            for profile in profiles:
+                rendition_path = get_rendition_path(source_hash, profile, cache_dir)
+                if not needs_rendition(width, height, image_format, size, profile) or os.path.exists(rendition_path):
+                    continue
+                file.seek(0)
+                write_rendition(rendition_path, render(file, profile))
+                rendered += 1
+    except (OSError, ValueError) as e:
+        print(f"Unable to render {path}: {e}")
+    return path, source_hash, rendered
+
+
+def warm_renditions(account: Account, workers: Optional[int] = None, cache_dir: str = RENDITION_CACHE_PATH) -> int:
+    """Renders the renditions of all queued images that are not in the cache yet, returns the number of rendered files"""
+    index = get_source_hash_index(cache_dir)
+    profiles_by_file = get_queued_profiles(account)
+    stats = {file: os.stat(file) for file in profiles_by_file}
+
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=lower_priority) as executor:
+        futures = [
+            executor.submit(warm_file, file, profiles, index.get(file, stats[file]), cache_dir) for file, profiles in profiles_by_file.items()
+        ]
+        for future in futures:
+            path, source_hash, count = future.result()
+            if source_hash is not None:
+                index.put(path, stats[path], source_hash)
+            rendered += count
+    return rendered
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    scheduler_profile_ids = args.scheduler_profile_ids.split(",") if args.scheduler_profile_ids else []
+    account = select_account(args.account, scheduler_profile_ids=scheduler_profile_ids)
+    print(f"Rendered {warm_renditions(account, args.workers)} renditions")
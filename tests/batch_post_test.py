@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from batch_post import FAILED, RATE_LIMITED, SUCCEEDED, BatchJob, format_summary, get_due_jobs, load_batch_accounts, run_batch
+from utils.cron import parse_cron_expressions
+from utils.rate_limit_ledger import RateLimitedError
+
+path = "tests/fixtures"
+
+
+class ConcurrencyTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+
+    def __call__(self, account, mode):
+        with self.lock:
+            self.running[mode] = self.running.get(mode, 0) + 1
+            self.max_running[mode] = max(self.max_running.get(mode, 0), self.running[mode])
+        time.sleep(0.02)
+        with self.lock:
+            self.running[mode] -= 1
+
+
+class TestBatchPost(unittest.TestCase):
+    def setUp(self):
+        account = load_batch_accounts(path, ["my_account"])["my_account"]
+        self.accounts = {f"account_{i}": account for i in range(6)}
+
+    def test_reports_the_result_of_every_job(self):
+        def execute(account, mode):
+            if mode == "Deviant":
+                raise RateLimitedError("Deviant", datetime(2024, 6, 3, 9, 15))
+            return False if account is None else {"id": 1}
+
+        jobs = [BatchJob("account_0", "Twitter"), BatchJob("account_1", "Deviant"), BatchJob("account_2", "Twitter")]
+        with patch("batch_post.execute", side_effect=execute), patch("batch_post.copy_account_for_run", side_effect=[object(), object(), None]):
+            results = run_batch(self.accounts, jobs, workers=1)
+
+        self.assertEqual([result.status for result in results], [SUCCEEDED, RATE_LIMITED, FAILED])
+        self.assertIn("1 succeeded, 1 failed, 1 rate limited", format_summary(results))
+
+    def test_a_fan_out_failing_on_every_platform_fails(self):
+        jobs = [BatchJob("account_0", "All"), BatchJob("account_1", "All")]
+        results = [{"Twitter": False, "Deviant": False}, {"Twitter": False, "Deviant": {"id": 1}}]
+        with patch("batch_post.execute", side_effect=results):
+            results = run_batch(self.accounts, jobs, workers=1)
+
+        self.assertEqual([result.status for result in results], [FAILED, SUCCEEDED])
+
+    def test_a_failing_job_does_not_stop_the_batch(self):
+        jobs = [BatchJob("account_0", "Twitter"), BatchJob("account_1", "Twitter")]
+        with patch("batch_post.execute", side_effect=[ValueError("No file found"), {"id": 1}]):
+            results = run_batch(self.accounts, jobs, workers=1)
+
+        self.assertEqual([(result.status, result.message) for result in results], [(FAILED, "No file found"), (SUCCEEDED, "")])
+
+    def test_limits_the_parallel_posts_per_platform(self):
+        tracker = ConcurrencyTracker()
+        jobs = [BatchJob(name, platform) for name in self.accounts for platform in ["Twitter", "Deviant"]]
+        with patch("batch_post.execute", side_effect=tracker):
+            run_batch(self.accounts, jobs, workers=12, platform_limits={"Twitter": 2, "Deviant": 3})
+
+        self.assertLessEqual(tracker.max_running["Twitter"], 2)
+        self.assertLessEqual(tracker.max_running["Deviant"], 3)
+
+    def test_runs_the_jobs_of_an_account_one_after_the_other(self):
+        tracker = ConcurrencyTracker()
+        jobs = [BatchJob("account_0", "Twitter")] * 4 + [BatchJob("account_1", "Deviant")] * 4
+        with patch("batch_post.execute", side_effect=tracker):
+            run_batch(self.accounts, jobs, workers=8, platform_limits={})
+
+        self.assertEqual(tracker.max_running, {"Twitter": 1, "Deviant": 1})
+
+    def test_every_job_runs_on_its_own_account_copy(self):
+        with patch("batch_post.execute") as mock_execute:
+            run_batch(self.accounts, [BatchJob("account_0", "Twitter")])
+
+        self.assertIsNot(mock_execute.call_args.args[0], self.accounts["account_0"])
+
+    def test_fails_on_unknown_accounts(self):
+        with self.assertRaises(ValueError):
+            run_batch(self.accounts, [BatchJob("unknown", "Twitter")])
+
+    def test_picks_the_due_jobs(self):
+        accounts = load_batch_accounts(path)
+        accounts["my_account"].schedules = {"Twitter": parse_cron_expressions("0 * * * *"), "Deviant": parse_cron_expressions(["30 9 * * *", "0 9 * * *"])}
+
+        self.assertEqual(get_due_jobs(accounts, datetime(2024, 6, 3, 9, 0, 30)), [BatchJob("my_account", "Twitter"), BatchJob("my_account", "Deviant")])
+        self.assertEqual(get_due_jobs(accounts, datetime(2024, 6, 3, 9, 1)), [])
+        self.assertEqual(get_due_jobs(accounts, datetime(2024, 6, 3, 9, 4), window_minutes=5), [BatchJob("my_account", "Twitter"), BatchJob("my_account", "Deviant")])
@@ -3,9 +3,12 @@ import unittest
 import uuid
 
 from models.account import Account
-from src.deviant_utils.deviant_refresh_token import get_refresh_token
+from deviant_utils.deviant_refresh_token import get_refresh_token
 
 from src.clients.deviant import SUBMIT_URL, TOKEN_URL, UPLOAD_URL, DeviantClient
+from deviant_utils.access_token_cache import invalidate_access_token
+from utils.jpeg_utils import strip_image_metadata
+from utils.prepared_upload import prepare_upload
 from factories.factories import sub_config, account
 import requests_mock
 
@@ -116,3 +119,65 @@ class TestDeviantClient(unittest.TestCase):
             expected_gallery_ids = "galleryids%5B%5D=prem123"
             self.assertIn(expected_feature, req_mock.request_history[2].text)
             self.assertIn(expected_gallery_ids, req_mock.request_history[2].text)
+
+    def test_reuses_the_access_token_until_it_expires(self):
+        self.addCleanup(invalidate_access_token, "my_account")
+        with requests_mock.Mocker() as req_mock:
+            token_mock = req_mock.post(TOKEN_URL, json={"refresh_token": "12345", "access_token": "acc123", "expires_in": 3600})
+            req_mock.post(UPLOAD_URL, json={"itemid": "1"})
+            req_mock.post(SUBMIT_URL, json={"id": "123"})
+
+            DeviantClient(account()).schedule("tests/fixtures/test.jpg", "some caption", "")
+            DeviantClient(account()).schedule("tests/fixtures/test.jpg", "some caption", "")
+
+            self.assertEqual(token_mock.call_count, 1)
+            self.assertEqual(req_mock.request_history[-1].headers["Authorization"], "Bearer acc123")
+
+    def test_refreshes_the_access_token_close_to_expiry(self):
+        self.addCleanup(invalidate_access_token, "my_account")
+        with requests_mock.Mocker() as req_mock:
+            token_mock = req_mock.post(TOKEN_URL, json={"refresh_token": "12345", "access_token": "acc123", "expires_in": 30})
+            req_mock.post(UPLOAD_URL, json={"itemid": "1"})
+            req_mock.post(SUBMIT_URL, json={"id": "123"})
+
+            DeviantClient(account()).schedule("tests/fixtures/test.jpg", "some caption", "")
+            DeviantClient(account()).schedule("tests/fixtures/test.jpg", "some caption", "")
+
+            self.assertEqual(token_mock.call_count, 2)
+
+    def test_refreshes_the_access_token_after_a_401(self):
+        self.addCleanup(invalidate_access_token, "my_account")
+        with requests_mock.Mocker() as req_mock:
+            token_mock = req_mock.post(
+                TOKEN_URL,
+                [
+                    {"json": {"refresh_token": "12345", "access_token": "expired", "expires_in": 3600}},
+                    {"json": {"refresh_token": "12345", "access_token": "fresh", "expires_in": 3600}},
+                ],
+            )
+            upload_mock = req_mock.post(UPLOAD_URL, [{"status_code": 401, "json": {}}, {"json": {"itemid": "1"}}])
+            publish_mock = req_mock.post(SUBMIT_URL, json={"id": "123"})
+
+            result = DeviantClient(account()).schedule("tests/fixtures/test.jpg", "some caption", "")
+
+            self.assertEqual(result, {"id": "123"})
+            self.assertEqual(token_mock.call_count, 2)
+            self.assertEqual(upload_mock.last_request.headers["Authorization"], "Bearer fresh")
+            # the publish reuses the refreshed token instead of being rejected and refreshing again
+            self.assertEqual(publish_mock.call_count, 1)
+            self.assertEqual(publish_mock.last_request.headers["Authorization"], "Bearer fresh")
+
+    def test_streams_large_images(self):
+        upload = prepare_upload("tests/fixtures/test.jpg", account(), streaming_threshold=0)
+        with requests_mock.Mocker() as req_mock:
+            req_mock.post(TOKEN_URL, json={"refresh_token": "12345", "access_token": "acc123"})
+            upload_mock = req_mock.post(UPLOAD_URL, json={"itemid": "1"})
+            req_mock.post(SUBMIT_URL, json={"id": "123"})
+
+            result = DeviantClient(account()).schedule("tests/fixtures/test.jpg", "some caption", "", upload=upload)
+
+            self.assertEqual(result, {"id": "123"})
+            body = upload_mock.last_request.body
+            self.assertTrue(upload_mock.last_request.headers["Content-Type"].startswith("multipart/form-data; boundary="))
+            self.assertEqual(upload_mock.last_request.headers["Content-Length"], str(len(body)))
+            self.assertIn(strip_image_metadata(open("tests/fixtures/test.jpg", "rb").read()), b"".join(body))
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests_mock
+
+from clients.http_session import PlatformRetry, close_sessions, get_session
+from factories.factories import account
+from utils.rate_limit_ledger import RateLimitedError, RateLimitLedger
+
+PUBLISH_URL = "https://www.deviantart.com/api/v1/oauth2/stash/publish"
+
+
+class TestHttpSession(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(close_sessions)
+
+    def test_shares_one_session_per_account(self):
+        self.assertIs(get_session(account()), get_session(account()))
+        self.assertIsNot(get_session(account()), get_session(account({"id": "other"})))
+
+    def test_recreates_the_session_when_the_http_config_changes(self):
+        session = get_session(account())
+        self.assertIsNot(get_session(account({"http": {"timeout": 5}})), session)
+
+    def test_applies_the_configured_timeout_by_default(self):
+        session = get_session(account({"http": {"timeout": 5}}))
+        with requests_mock.Mocker() as req_mock:
+            req_mock.get("https://example.com", json={})
+            session.get("https://example.com")
+            session.get("https://example.com", timeout=1)
+
+            self.assertEqual([request.timeout for request in req_mock.request_history], [5, 1])
+
+    def test_configures_the_retry_policy(self):
+        session = get_session(account({"http": {"retries": 5, "backoff_factor": 2}}))
+        retry = session.get_adapter("https://www.deviantart.com").max_retries
+        self.assertEqual((retry.total, retry.backoff_factor), (5, 2))
+
+    def test_never_retries_posts_or_rate_limited_requests(self):
+        retry = PlatformRetry(total=3, status_forcelist=[429, 500, 503])
+        self.assertTrue(retry.is_retry("GET", 500))
+        self.assertFalse(retry.is_retry("GET", 429))
+        self.assertFalse(retry.is_retry("POST", 429))
+        self.assertFalse(retry.is_retry("POST", 500))
+        self.assertFalse(retry.is_retry("GET", 404))
+
+    def test_raises_on_a_429_once_the_ledger_recorded_it(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        ledger = RateLimitLedger(os.path.join(directory.name, "ledger.sqlite3"))
+        self.addCleanup(ledger.close)
+
+        with patch("clients.http_session.get_rate_limit_ledger", return_value=ledger), requests_mock.Mocker() as req_mock:
+            publish_mock = req_mock.post(PUBLISH_URL, status_code=429, headers={"Retry-After": "600"}, json={})
+            with self.assertRaises(RateLimitedError) as context:
+                get_session(account({"http": {"retry_statuses": [429, 503]}})).post(PUBLISH_URL)
+
+        self.assertEqual(publish_mock.call_count, 1)
+        self.assertTrue(context.exception.rejected)
+        self.assertIsNotNone(ledger.next_available_at("my_account", "Deviant"))
@@ -7,6 +7,7 @@ import tweepy
 
 from models.account import Account
 from src.clients.twitter import TwitterClient
+from utils.prepared_upload import prepare_upload
 
 
 def get_fake_config(partial: Dict[str, any] = {}):
@@ -99,3 +100,13 @@ class TestTwitterClient(unittest.TestCase):
             client = TwitterClient(get_fake_config({"twitter": {"random_tag_count": 3}}))
             client.schedule("tests/fixtures/test.jpg", "some caption")
             self.mock_client.create_tweet.assert_called_once_with(text="some caption #AIArtwork #AIイラスト #AIArtworks", media_ids=["1"])
+
+    def test_uses_the_chunked_upload_for_large_images(self):
+        with (
+            patch("tweepy.OAuthHandler", return_value=self.mock_oauth_handler),
+            patch("tweepy.API", return_value=self.mock_api),
+            patch("tweepy.Client", return_value=self.mock_client),
+        ):
+            upload = prepare_upload("tests/fixtures/test.jpg", get_fake_config(), streaming_threshold=0)
+            TwitterClient(get_fake_config()).schedule("tests/fixtures/test.jpg", "some caption", upload=upload)
+            self.assertTrue(self.mock_api.media_upload.call_args.kwargs["chunked"])
@@ -0,0 +1,48 @@
+import os
+import shutil
+
+import pytest
+
+from deviant_utils import access_token_cache, deviant_refresh_token, gallery_checkpoint, gallery_mirror, stash_state
+from utils import image_index, job_queue, metadata_cache, rate_limit_ledger, renditions
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_stores(tmp_path_factory):
+    # The caches and stores are shared by the whole process, point them away from the project's own files
+    directory = tmp_path_factory.mktemp("stores")
+    # the refresh tokens the tests read are checked in
+    shutil.copytree(deviant_refresh_token.REFRESH_TOKEN_CACHE_PATH, directory / "refresh_token_cache")
+    for name in ["access_token_cache", "gallery_checkpoints", "gallery_mirror_cache", "image_index_cache", "job_queue", "rendition_cache", "stash_state"]:
+        (directory / name).mkdir()
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(metadata_cache, "METADATA_STORE_PATH", str(directory / "metadata.sqlite3"))
+        monkeypatch.setattr(metadata_cache, "_store", None)
+        monkeypatch.setattr(rate_limit_ledger, "LEDGER_PATH", str(directory / "ledger.sqlite3"))
+        monkeypatch.setattr(rate_limit_ledger, "_ledger", None)
+        monkeypatch.setattr(deviant_refresh_token, "REFRESH_TOKEN_CACHE_PATH", str(directory / "refresh_token_cache"))
+        monkeypatch.setattr(access_token_cache, "ACCESS_TOKEN_CACHE_PATH", str(directory / "access_token_cache"))
+        monkeypatch.setattr(gallery_checkpoint, "CHECKPOINT_PATH", str(directory / "gallery_checkpoints"))
+        monkeypatch.setattr(gallery_mirror, "MIRROR_CACHE_PATH", str(directory / "gallery_mirror_cache"))
+        monkeypatch.setattr(image_index, "INDEX_CACHE_PATH", str(directory / "image_index_cache"))
+        monkeypatch.setattr(job_queue, "JOB_QUEUE_PATH", str(directory / "job_queue" / "jobs.sqlite3"))
+        monkeypatch.setattr(renditions, "RENDITION_CACHE_PATH", str(directory / "rendition_cache"))
+        monkeypatch.setattr(stash_state, "STASH_STATE_PATH", str(directory / "stash_state"))
+        yield directory
+        if metadata_cache._store is not None:
+            metadata_cache._store.close()
+        if rate_limit_ledger._ledger is not None:
+            rate_limit_ledger._ledger.close()
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_fixtures(tmp_path_factory):
+    # Tests post, rename and tag the images in tests/fixtures, and snapshot its accounts.yml. They run in a copy of it
+    root = tmp_path_factory.mktemp("root")
+    shutil.copytree(os.path.join(project_root, "tests", "fixtures"), root / "tests" / "fixtures", ignore=shutil.ignore_patterns(".accounts.yml.cache"))
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(root)
+        yield root
@@ -0,0 +1,149 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import requests_mock
+
+from clients.deviant import DEVIATION_EDIT_URL, DeviantClient
+from clients.http_session import close_sessions
+from deviant_gallery import fix_deviation, fix_resolutions_pipelined, parse_arguments
+from deviant_utils.gallery_checkpoint import load_checkpoint
+from deviant_utils.gallery_mirror import GalleryMirror
+from factories.factories import account
+from utils.rate_limit_ledger import DEFAULT_BLOCK_SECONDS, RateLimitedError, RateLimitLedger
+from utils.rate_limiter import TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, json, headers={}):
+        self.status_code = status_code
+        self._json = json
+        self.headers = headers
+
+    def json(self):
+        return self._json
+
+
+def deviation(deviationid, width):
+    return {"deviationid": deviationid, "title": deviationid, "url": "", "content": {"width": width, "height": 1000}}
+
+
+class FakeDeviantClient:
+    def __init__(self, pages, edit_responses={}):
+        self.pages = pages
+        self.edit_responses = edit_responses
+        self.fetched_offsets = []
+        self.edited = []
+
+    def get_all_deviations(self, username, offset=0, limit=24):
+        self.fetched_offsets.append(offset)
+        return self.pages[offset], "token"
+
+    def send_deviation_resolution_edit(self, deviationid, display_resolution=8, access_token=None):
+        self.edited.append(deviationid)
+        responses = self.edit_responses.get(deviationid)
+        if responses:
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return FakeResponse(200, {"status": "success"})
+
+
+PAGES = {
+    0: {"results": [deviation("a", 3000), deviation("b", 1024)], "has_more": True, "next_offset": 2},
+    2: {"results": [deviation("c", 2048), deviation("d", 4096)], "has_more": True, "next_offset": 4},
+    4: {"results": [deviation("e", 1920)], "has_more": False},
+}
+
+
+class TestFixResolutionsPipelined(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint_path = os.path.join(directory.name, "checkpoint.json")
+        self.limiter = TokenBucket(rate=1000, capacity=10)
+
+    def fix(self, client, offset=0, max_pages=None):
+        return fix_resolutions_pipelined(client, "user", offset, 2, self.limiter, 2, self.checkpoint_path, max_pages=max_pages)
+
+    def test_fixes_every_wide_deviation_of_the_gallery(self):
+        client = FakeDeviantClient(PAGES)
+        self.assertTrue(self.fix(client))
+        self.assertEqual(sorted(client.edited), ["a", "c", "d"])
+        self.assertEqual(client.fetched_offsets, [0, 2, 4])
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_checkpoints_the_next_offset(self):
+        client = FakeDeviantClient(PAGES)
+        self.assertTrue(self.fix(client, max_pages=2))
+        self.assertEqual(load_checkpoint(self.checkpoint_path), 4)
+
+    def test_retries_rate_limited_edits(self):
+        client = FakeDeviantClient(PAGES, {"c": [RateLimitedError("Deviant", datetime.now(), rejected=True)]})
+        self.assertTrue(self.fix(client, offset=2))
+        self.assertEqual(sorted(client.edited), ["c", "c", "d"])
+        self.assertLess(self.limiter.rate, 1000)
+
+    def test_records_fixed_deviations_in_the_mirror(self):
+        mirror = GalleryMirror(os.path.join(os.path.dirname(self.checkpoint_path), "mirror.sqlite3"))
+        self.addCleanup(mirror.close)
+        fix_resolutions_pipelined(FakeDeviantClient(PAGES), "user", 0, 2, self.limiter, 2, self.checkpoint_path, mirror=mirror)
+
+        # a later sync of the gallery keeps the recorded resolution, so the already correct deviations are not edited again
+        mirror.sync(FakeDeviantClient(PAGES), "user")
+
+        self.assertEqual(mirror.needs_resolution_fix("user"), [])
+
+    def test_stops_at_the_page_of_a_failed_edit(self):
+        client = FakeDeviantClient(PAGES, {"c": [FakeResponse(400, {"status": "error"})]})
+        self.assertFalse(self.fix(client))
+        self.assertEqual(load_checkpoint(self.checkpoint_path), 2)
+
+
+class TestFixDeviation(unittest.TestCase):
+    def test_waits_for_the_ledger_after_a_429_without_retry_after(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(close_sessions)
+        started_at = time.time()
+        now = [started_at]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        ledger = RateLimitLedger(os.path.join(directory.name, "ledger.sqlite3"), clock=lambda: now[0])
+        self.addCleanup(ledger.close)
+        limiter = TokenBucket(rate=10, capacity=1, clock=lambda: now[0], sleep=sleep)
+
+        with patch("clients.http_session.get_rate_limit_ledger", return_value=ledger), requests_mock.Mocker() as req_mock:
+            edit_mock = req_mock.post(
+                DEVIATION_EDIT_URL.format(deviationid="abc"),
+                [{"status_code": 429, "json": {"error": "user_api_threshold"}}, {"status_code": 200, "json": {"status": "success"}}],
+            )
+            success, _ = fix_deviation(DeviantClient(account()), "abc", "token", limiter)
+
+        self.assertTrue(success)
+        self.assertEqual(edit_mock.call_count, 2)
+        # the second edit was only sent once the platform wide block of the ledger was over
+        self.assertGreaterEqual(now[0] - started_at, DEFAULT_BLOCK_SECONDS)
+
+
+class TestParseArguments(unittest.TestCase):
+    def parse(self, *args):
+        with patch.object(sys, "argv", ["deviant_gallery.py", "account", "user", *args]):
+            return parse_arguments()
+
+    def test_rejects_a_rate_delay_or_worker_count_that_cannot_pace_the_edits(self):
+        for args in [["--rate", "0"], ["--rate", "-1"], ["--delay", "-1"], ["--pipelined", "--delay", "0"], ["--workers", "0"]]:
+            with self.subTest(args=args), self.assertRaises(SystemExit), patch("sys.stderr"):
+                self.parse(*args)
+
+    def test_allows_no_delay_with_a_rate(self):
+        args = self.parse("--pipelined", "--delay", "0", "--rate", "2")
+
+        self.assertEqual((args.delay, args.rate), (0, 2))
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from deviant_utils.gallery_mirror import GalleryMirror
+
+
+def deviation(deviationid, published_time, width=1024, favourites=0):
+    return {
+        "deviationid": deviationid,
+        "title": deviationid,
+        "url": f"https://deviantart.com/{deviationid}",
+        "published_time": str(published_time),
+        "content": {"width": width, "height": 1000},
+        "stats": {"favourites": favourites, "comments": 0},
+    }
+
+
+class FakeGalleryClient:
+    """Serves a newest first gallery in pages of two"""
+
+    def __init__(self, deviations):
+        self.deviations = deviations
+        self.fetched_offsets = []
+
+    def get_all_deviations(self, username, offset=0, limit=24):
+        self.fetched_offsets.append(offset)
+        results = self.deviations[offset : offset + 2]
+        has_more = offset + 2 < len(self.deviations)
+        return {"results": results, "has_more": has_more, "next_offset": offset + 2}, "token"
+
+
+class TestGalleryMirror(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.mirror = GalleryMirror(os.path.join(directory.name, "mirror.sqlite3"))
+        self.addCleanup(self.mirror.close)
+
+    def test_first_sync_mirrors_the_whole_gallery(self):
+        client = FakeGalleryClient([deviation(str(i), 100 - i) for i in range(5)])
+        result = self.mirror.sync(client, "user", now=1000)
+
+        self.assertTrue(result.full)
+        self.assertEqual(client.fetched_offsets, [0, 2, 4])
+        self.assertEqual(self.mirror.latest_published_time("user"), 100)
+
+    def test_incremental_sync_stops_at_synced_deviations(self):
+        old = [deviation(str(i), 100 - i) for i in range(5)]
+        self.mirror.sync(FakeGalleryClient(old), "user", now=1000)
+
+        client = FakeGalleryClient([deviation("new1", 102), deviation("new2", 101), *old])
+        result = self.mirror.sync(client, "user", now=2000)
+
+        self.assertFalse(result.full)
+        self.assertEqual(client.fetched_offsets, [0, 2])
+        self.assertEqual(self.mirror.latest_published_time("user"), 102)
+
+    def test_refreshes_stats_and_drops_deleted_deviations_when_due(self):
+        self.mirror.sync(FakeGalleryClient([deviation("a", 2), deviation("b", 1)]), "user", now=1000)
+        result = self.mirror.sync(FakeGalleryClient([deviation("a", 2, favourites=5)]), "user", stats_max_age_seconds=500, now=2000)
+
+        self.assertTrue(result.full)
+        self.assertEqual([(row.deviationid, row.favourites) for row in self.mirror.top_by_favourites("user")], [("a", 5)])
+
+    def test_lists_deviations_needing_a_resolution_fix(self):
+        self.mirror.sync(FakeGalleryClient([deviation("wide", 3, width=3000), deviation("fixed", 2, width=4000), deviation("small", 1)]), "user", now=1000)
+        self.mirror.set_display_resolution("fixed", 8)
+
+        self.assertEqual([row.deviationid for row in self.mirror.needs_resolution_fix("user")], ["wide"])
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from multiprocessing import Pool
+from unittest.mock import patch
+
+import piexif
+from PIL import Image
+
+from deviant_utils.stash_state import CLAIM_EXPIRY_SECONDS, StashState, is_current, pick_staged_item
+from factories.factories import account
+from utils.metadata_backend import SidecarMetadataAdjuster
+
+
+def stage_files(args):
+    state_path, directory, worker = args
+    state = StashState(state_path)
+    for index in range(10):
+        file_path = os.path.join(directory, f"{worker}_{index}_DEVI_Q.jpg")
+        state.add(file_path, f"item_{worker}_{index}", "caption", "", 8)
+
+
+class TestStashState(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.state_path = os.path.join(self.directory, "account.json")
+        for worker in range(4):
+            for index in range(10):
+                with open(os.path.join(self.directory, f"{worker}_{index}_DEVI_Q.jpg"), "wb") as file:
+                    file.write(b"\xff\xd8\xff\xd9")
+
+    def test_keeps_the_items_staged_by_concurrent_processes(self):
+        with Pool(4) as pool:
+            pool.map(stage_files, [(self.state_path, self.directory, worker) for worker in range(4)])
+
+        self.assertEqual(len(StashState(self.state_path).items()), 40)
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith(".tmp")], [])
+
+    def test_removes_items(self):
+        state = StashState(self.state_path)
+        file_path = os.path.join(self.directory, "0_0_DEVI_Q.jpg")
+        state.add(file_path, "item", "caption", "", 8)
+
+        state.remove(file_path)
+
+        self.assertEqual(state.items(), {})
+
+    def test_a_staged_item_goes_stale_when_its_sidecar_metadata_changes(self):
+        file_path = os.path.join(self.directory, "image_DEVI_Q.jpg")
+        Image.new("RGB", (8, 8)).save(file_path, exif=piexif.dump({"0th": {piexif.ImageIFD.XPSubject: "caption".encode("utf-16le")}}))
+        state = StashState(self.state_path)
+        state.add(file_path, "item", "caption", "", 8)
+        sidecar_account = account({"metadata": {"backend": "sidecar"}})
+        self.assertTrue(is_current(sidecar_account, file_path, state.items()[file_path]))
+
+        adjuster = SidecarMetadataAdjuster(file_path)
+        adjuster.add_subject("a new caption")
+        adjuster.save()
+
+        self.assertFalse(is_current(sidecar_account, file_path, state.items()[file_path]))
+        # the sidecar is not read for accounts keeping their metadata in the EXIF
+        self.assertTrue(is_current(account(), file_path, state.items()[file_path]))
+
+    def test_an_item_is_claimed_by_one_run_at_a_time(self):
+        state = StashState(self.state_path)
+        file_path = os.path.join(self.directory, "0_0_DEVI_Q.jpg")
+        state.add(file_path, "item", "caption", "", 8)
+
+        self.assertEqual(state.claim(file_path).itemid, "item")
+        self.assertIsNone(state.claim(file_path))
+        state.release(file_path)
+        self.assertIsNotNone(state.claim(file_path))
+
+    def test_the_claim_of_a_run_that_died_expires(self):
+        state = StashState(self.state_path)
+        file_path = os.path.join(self.directory, "0_0_DEVI_Q.jpg")
+        state.add(file_path, "item", "caption", "", 8)
+        state.claim(file_path)
+
+        with patch("deviant_utils.stash_state.time.time", return_value=state.items()[file_path].claimed_at + CLAIM_EXPIRY_SECONDS + 1):
+            self.assertIsNotNone(state.claim(file_path))
+
+    def test_picks_unclaimed_items_and_discards_stale_ones(self):
+        state = StashState(self.state_path)
+        claimed, unclaimed, stale = [os.path.join(self.directory, f"0_{index}_DEVI_Q.jpg") for index in range(3)]
+        for index, file_path in enumerate([claimed, unclaimed, stale]):
+            state.add(file_path, f"item_{index}", "", "", 8)
+        state.claim(claimed)
+        with open(stale, "ab") as file:
+            file.write(b"changed")
+        discarded = []
+
+        picked = pick_staged_item(account({"directory_path": self.directory}), state, lambda file_path, item: discarded.append(item.itemid))
+
+        self.assertEqual(picked[0], unclaimed)
+        self.assertEqual(discarded, ["item_2"])
+        self.assertIsNone(pick_staged_item(account({"directory_path": self.directory}), state, lambda file_path, item: None))
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import unittest
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Heavy dependencies which should only be imported once a platform client actually needs them.
+# They make up most of the startup time of the scheduler, asserting on them keeps the test stable on slow machines
+LAZY_MODULES = ["tweepy", "requests", "requests_oauthlib", "PIL", "clients.twitter", "clients.deviant"]
+
+# Coarse cumulative import time budget of the scheduler entry point, in microseconds.
+# It is an order of magnitude above the usual import time, it only catches a heavy dependency imported at startup
+IMPORT_BUDGET_US = 500_000
+
+
+def run_import(module: str) -> subprocess.CompletedProcess:
+    # Imports the module in a fresh interpreter, printing every module loaded along with it
+    env = dict(os.environ, PYTHONPATH=os.path.join(project_root, "src"))
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys, {module}; print('\\n'.join(sys.modules))"],
+        cwd=project_root,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def imported_modules(module: str):
+    return set(run_import(module).stdout.splitlines())
+
+
+def import_time(module: str) -> int:
+    # The cumulative import time (us) of the module, as reported by -X importtime
+    for line in run_import(module).stderr.splitlines():
+        if line.startswith("import time:") and line.split("|")[-1].strip() == module:
+            return int(line.split("|")[1])
+    raise AssertionError(f"No import time reported for {module}")
+
+
+class TestImportTime(unittest.TestCase):
+    def test_schedule_image_does_not_import_platform_dependencies(self):
+        modules = imported_modules("schedule_image")
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules, f"{module} should be imported lazily")
+
+    def test_schedule_image_stays_within_the_import_budget(self):
+        # best of a few runs, to not fail on a single slow run
+        self.assertLess(min(import_time("schedule_image") for _ in range(3)), IMPORT_BUDGET_US)
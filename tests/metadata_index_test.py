@@ -0,0 +1,101 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import piexif
+from PIL import Image
+
+from factories.factories import account as account_factory
+from metadata_index import build_index, extract_metadata, get_roots, parse_arguments
+from utils.metadata_backend import write_sidecar_entry
+from utils.metadata_cache import MetadataStore
+
+
+def create_image(path, caption=None, content_tags=None):
+    zeroth = {}
+    if caption is not None:
+        zeroth[piexif.ImageIFD.XPSubject] = caption.encode("utf-16le")
+    if content_tags is not None:
+        zeroth[piexif.ImageIFD.XPComment] = content_tags.encode("utf-16le")
+    Image.new("RGB", (16, 16), color="red").save(path, exif=piexif.dump({"0th": zeroth}))
+
+
+class TestMetadataIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.library = os.path.join(self.tmp, "library")
+        os.makedirs(self.library)
+        create_image(os.path.join(self.library, "cat_TWIT_Q.jpg"), "a cat", "cat, animal")
+        create_image(os.path.join(self.library, "dog_DEVI_P.jpg"), "a dog", "dog, animal")
+        create_image(os.path.join(self.library, "untagged.jpg"))
+
+        self.account = account_factory({"directory_path": self.library, "sub_configs": []})
+        self.store = MetadataStore(os.path.join(self.tmp, "metadata.sqlite3"))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def test_indexes_the_whole_library(self):
+        result = build_index(self.account, self.store, workers=2, batch_size=2)
+
+        self.assertEqual(result, (3, 0, 0))
+        roots = get_roots(self.account)
+        self.assertEqual([entry.caption for entry in self.store.search("animal", roots)], ["a cat", "a dog"])
+        self.assertEqual([os.path.basename(entry.path) for entry in self.store.untagged(roots)], ["untagged.jpg"])
+        self.assertEqual(self.store.tag_stats(roots), {"animal": 2, "cat": 1, "dog": 1})
+
+    def test_only_reads_new_and_changed_files_again(self):
+        build_index(self.account, self.store, workers=1)
+        create_image(os.path.join(self.library, "new.jpg"), "new")
+        changed = os.path.join(self.library, "cat_TWIT_Q.jpg")
+        create_image(changed, "a changed cat", "cat")
+        stat = os.stat(changed)
+        os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        with patch("metadata_index.ProcessPoolExecutor.map", side_effect=lambda fn, files, chunksize: map(fn, files)) as mock_map:
+            result = build_index(self.account, self.store, workers=1)
+
+        self.assertEqual(result, (2, 2, 0))
+        self.assertEqual(sorted(os.path.basename(file) for file in mock_map.call_args.args[1]), ["cat_TWIT_Q.jpg", "new.jpg"])
+        self.assertEqual([entry.caption for entry in self.store.search("cat")], ["a changed cat"])
+
+    def test_reads_other_formats_with_pillow(self):
+        png_path = os.path.join(self.library, "image.png")
+        Image.new("RGB", (8, 8)).save(png_path, exif=piexif.dump({"0th": {piexif.ImageIFD.XPSubject: "a png".encode("utf-16le")}}))
+
+        key, caption, keywords, content_tags = extract_metadata(png_path)
+
+        self.assertEqual((key.path, caption, content_tags), (os.path.abspath(png_path), "a png", ""))
+
+    def test_prunes_removed_files(self):
+        build_index(self.account, self.store, workers=1)
+        os.remove(os.path.join(self.library, "untagged.jpg"))
+
+        self.assertEqual(self.store.prune(get_roots(self.account)), 1)
+        self.assertEqual(len(list(self.store.iter_entries())), 2)
+
+    def test_reads_files_again_when_their_sidecar_changed(self):
+        build_index(self.account, self.store, workers=1)
+        cat_path = os.path.join(self.library, "cat_TWIT_Q.jpg")
+        write_sidecar_entry(cat_path, {"caption": "a sidecar cat"})
+        sidecar_path = os.path.join(self.library, ".image_metadata.json")
+        os.utime(sidecar_path, (time.time() + 1, time.time() + 1))
+
+        with patch("metadata_index.ProcessPoolExecutor.map", side_effect=lambda fn, files, chunksize: map(fn, files)):
+            result = build_index(self.account, self.store, workers=1)
+
+        self.assertEqual(result.indexed, 3)
+        self.assertEqual([entry.caption for entry in self.store.search("sidecar")], ["a sidecar cat"])
+
+
+class TestParseArguments(unittest.TestCase):
+    def test_rejects_no_workers_or_empty_batches(self):
+        for args in [["--workers", "0"], ["--workers", "-2"], ["--batch-size", "0"]]:
+            with self.subTest(args=args), self.assertRaises(SystemExit), patch("sys.stderr"):
+                with patch.object(sys, "argv", ["metadata_index.py", "account", "index", *args]):
+                    parse_arguments()
@@ -1,14 +1,23 @@
 from collections import namedtuple
 import os
 import random
+import shutil
+import tempfile
+import time
 import unittest
 from unittest.mock import Mock, patch
 import uuid
 from schedule_image import execute
+from stage_deviant import stage_images
+from deviant_utils.stash_state import StashState
 from utils.account_loader import select_account
+from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.rate_limit_ledger import PLATFORM_WIDE, RateLimitedError, RateLimitLedger
+from factories.factories import account as account_factory
+import piexif
 import tweepy
 import requests_mock
-from src.clients.deviant import SUBMIT_URL, TOKEN_URL, UPLOAD_URL
+from src.clients.deviant import STASH_DELETE_URL, SUBMIT_URL, TOKEN_URL, UPLOAD_URL
 
 path = "tests/fixtures"
 
@@ -70,6 +79,24 @@ class IntegrationTestScheduleImage(unittest.TestCase):
             expected_destination_file = os.path.join(expected_path, "test_TWIT_P.jpg")
             mock_rename.assert_called_once_with(expected_origin_file, expected_destination_file)
 
+    def test_schedules_the_requested_file(self):
+        account = select_account("my_account", path)
+
+        with (
+            patch("tweepy.OAuthHandler", return_value=self.mock_oauth_handler),
+            patch("tweepy.API", return_value=self.mock_api),
+            patch("tweepy.Client", return_value=self.mock_client),
+            patch("os.rename") as mock_rename,
+        ):
+            execute(account, "Twitter", "tests/fixtures/test_TWIT_Q.jpg")
+            mock_rename.assert_called_once_with("tests/fixtures/test_TWIT_Q.jpg", "tests/fixtures/test_TWIT_P.jpg")
+
+    def test_refuses_a_requested_file_that_is_not_queued(self):
+        account = select_account("my_account", path)
+
+        with self.assertRaises(ValueError):
+            execute(account, "Twitter", "tests/fixtures/test_TWIT_P.jpg")
+
     def test_schedules_deviant_successfully(self):
         account = select_account("my_account", path)
 
@@ -96,3 +123,144 @@ class IntegrationTestScheduleImage(unittest.TestCase):
             expected_origin_file = os.path.join(expected_path, "test_DEVI_Q.jpg")
             expected_destination_file = os.path.join(expected_path, "test_DEVI_P.jpg")
             mock_rename.assert_called_once_with(expected_origin_file, expected_destination_file)
+
+    def test_fans_out_one_image_to_all_platforms_with_a_single_rename(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        shutil.copy(os.path.join(path, "test.jpg"), os.path.join(tmp, "test_TWIT_Q_DEVI_Q.jpg"))
+        shutil.copy(os.path.join(path, "test.jpg"), os.path.join(tmp, "other_TWIT_Q.jpg"))
+        account = account_factory({"directory_path": tmp})
+
+        with (
+            patch("tweepy.OAuthHandler", return_value=self.mock_oauth_handler),
+            patch("tweepy.API", return_value=self.mock_api),
+            patch("tweepy.Client", return_value=self.mock_client),
+            requests_mock.Mocker() as req_mock,
+            patch("os.rename", wraps=os.rename) as mock_rename,
+        ):
+            req_mock.post(TOKEN_URL, json={"refresh_token": str(uuid.uuid4()), "access_token": "acc123"})
+            req_mock.post(UPLOAD_URL, json={"itemid": "1"})
+            req_mock.post(SUBMIT_URL, json={"id": "123"})
+
+            result = execute(account, "All")
+
+        self.assertEqual(result, {"Twitter": TweetResponse(data={"id": "123"}), "Deviant": {"id": "123"}})
+        expected_destination_file = os.path.join(tmp, "test_TWIT_P_DEVI_P.jpg")
+        mock_rename.assert_called_once_with(os.path.join(tmp, "test_TWIT_Q_DEVI_Q.jpg"), expected_destination_file)
+        exif = ImageMetadataAdjuster(expected_destination_file).read_metadata()
+        self.assertEqual(bytes(exif["0th"][piexif.ImageIFD.XPKeywords]).decode("utf-16le"), "TWIT;DEVI")
+
+    def test_fan_out_only_tags_the_platforms_that_succeeded(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        shutil.copy(os.path.join(path, "test.jpg"), os.path.join(tmp, "test_TWIT_Q_DEVI_Q.jpg"))
+        account = account_factory({"directory_path": tmp})
+        self.mock_client.create_tweet.side_effect = tweepy.errors.TweepyException("failed")
+        self.addCleanup(setattr, self.mock_client.create_tweet, "side_effect", None)
+
+        with (
+            patch("tweepy.OAuthHandler", return_value=self.mock_oauth_handler),
+            patch("tweepy.API", return_value=self.mock_api),
+            patch("tweepy.Client", return_value=self.mock_client),
+            requests_mock.Mocker() as req_mock,
+        ):
+            req_mock.post(TOKEN_URL, json={"refresh_token": str(uuid.uuid4()), "access_token": "acc123"})
+            req_mock.post(UPLOAD_URL, json={"itemid": "1"})
+            req_mock.post(SUBMIT_URL, json={"id": "123"})
+
+            result = execute(account, "Twitter,Deviant")
+
+        self.assertEqual(result, {"Twitter": False, "Deviant": {"id": "123"}})
+        self.assertTrue(os.path.exists(os.path.join(tmp, "test_TWIT_Q_DEVI_P.jpg")))
+
+    def fan_out_with_deviant_rate_limited(self, tmp):
+        ledger = RateLimitLedger(os.path.join(tmp, "ledger.sqlite3"))
+        self.addCleanup(ledger.close)
+        ledger.record("my_account", "Deviant", PLATFORM_WIDE, 0, time.time() + 600)
+        account = account_factory({"directory_path": tmp})
+
+        with (
+            patch("tweepy.OAuthHandler", return_value=self.mock_oauth_handler),
+            patch("tweepy.API", return_value=self.mock_api),
+            patch("tweepy.Client", return_value=self.mock_client),
+            patch("clients.deviant.get_rate_limit_ledger", return_value=ledger),
+        ):
+            return execute(account, "All")
+
+    def test_fan_out_defers_when_no_platform_was_posted_to(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        shutil.copy(os.path.join(path, "test.jpg"), os.path.join(tmp, "test_TWIT_Q_DEVI_Q.jpg"))
+        self.mock_client.create_tweet.side_effect = tweepy.errors.TweepyException("failed")
+        self.addCleanup(setattr, self.mock_client.create_tweet, "side_effect", None)
+
+        with self.assertRaises(RateLimitedError) as context:
+            self.fan_out_with_deviant_rate_limited(tmp)
+
+        self.assertEqual(context.exception.platform, "Deviant")
+        self.assertTrue(os.path.exists(os.path.join(tmp, "test_TWIT_Q_DEVI_Q.jpg")))
+
+    def test_fan_out_keeps_the_image_queued_for_rate_limited_platforms(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        shutil.copy(os.path.join(path, "test.jpg"), os.path.join(tmp, "test_TWIT_Q_DEVI_Q.jpg"))
+
+        result = self.fan_out_with_deviant_rate_limited(tmp)
+
+        self.assertEqual(result, {"Twitter": TweetResponse(data={"id": "123"}), "Deviant": False})
+        self.assertTrue(os.path.exists(os.path.join(tmp, "test_TWIT_P_DEVI_Q.jpg")))
+
+    def test_publishes_pre_staged_deviant_images_without_uploading(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        library = os.path.join(tmp, "library")
+        os.mkdir(library)
+        shutil.copy(os.path.join(path, "test.jpg"), os.path.join(library, "test_DEVI_Q.jpg"))
+        state_path = os.path.join(tmp, "stash_state.json")
+        account = account_factory({"directory_path": library})
+
+        with (
+            requests_mock.Mocker() as req_mock,
+            patch("stage_deviant.get_stash_state_path", return_value=state_path),
+            patch("schedule_image.get_stash_state_path", return_value=state_path),
+        ):
+            req_mock.post(TOKEN_URL, json={"refresh_token": str(uuid.uuid4()), "access_token": "acc123"})
+            upload_mock = req_mock.post(UPLOAD_URL, json={"itemid": "staged1"})
+            submit_mock = req_mock.post(SUBMIT_URL, json={"id": "123"})
+
+            self.assertEqual(stage_images(account, 5), [os.path.join(library, "test_DEVI_Q.jpg")])
+            self.assertEqual(upload_mock.call_count, 1)
+
+            result = execute(account, "Deviant")
+
+            self.assertEqual(result, {"id": "123"})
+            self.assertEqual(upload_mock.call_count, 1)
+            self.assertIn("itemid=staged1", submit_mock.last_request.text)
+
+        self.assertTrue(os.path.exists(os.path.join(library, "test_DEVI_P.jpg")))
+        self.assertEqual(StashState(state_path).items(), {})
+
+    def test_deletes_the_staged_item_of_a_failed_publish(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        shutil.copy(os.path.join(path, "test.jpg"), os.path.join(tmp, "test_DEVI_Q.jpg"))
+        state_path = os.path.join(tmp, "stash_state.json")
+        account = account_factory({"directory_path": tmp})
+
+        with (
+            requests_mock.Mocker() as req_mock,
+            patch("stage_deviant.get_stash_state_path", return_value=state_path),
+            patch("schedule_image.get_stash_state_path", return_value=state_path),
+        ):
+            req_mock.post(TOKEN_URL, json={"refresh_token": str(uuid.uuid4()), "access_token": "acc123"})
+            req_mock.post(UPLOAD_URL, json={"itemid": "staged1"})
+            req_mock.post(SUBMIT_URL, status_code=500, text="error")
+            delete_mock = req_mock.post(STASH_DELETE_URL, json={"success": True})
+
+            stage_images(account, 1)
+            result = execute(account, "Deviant")
+
+        self.assertFalse(result)
+        self.assertIn("itemid=staged1", delete_mock.last_request.text)
+        self.assertEqual(StashState(state_path).items(), {})
+        self.assertTrue(os.path.exists(os.path.join(tmp, "test_DEVI_Q.jpg")))
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import yaml
+
+from scheduler_daemon import SchedulerDaemon
+from utils.account_loader import load_accounts
+from utils.rate_limit_ledger import PLATFORM_WIDE, RateLimitedError, RateLimitLedger
+
+path = "tests/fixtures"
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StopDaemon(Exception):
+    pass
+
+
+class TestSchedulerDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        accounts = load_accounts(path)
+        accounts["my_account"]["schedules"] = {"Twitter": "0 * * * *", "Deviant": ["30 9 * * *", "30 18 * * *"]}
+        with open(os.path.join(self.tmp, "accounts.yml"), "w") as file:
+            yaml.safe_dump(accounts, file)
+        self.clock = FakeClock(datetime(2024, 6, 3, 8, 59))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_loads_the_jobs_from_the_accounts_file(self):
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock)
+        self.assertEqual(sorted((job.platform, job.schedule.expression) for job in daemon.jobs), [("Deviant", "30 18 * * *"), ("Deviant", "30 9 * * *"), ("Twitter", "0 * * * *")])
+        self.assertEqual(daemon.seconds_until_next_run(), 60)
+
+    def test_runs_due_jobs_once(self):
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock)
+        with patch("scheduler_daemon.execute") as mock_execute:
+            self.clock.now = datetime(2024, 6, 3, 9, 0, 5)
+            self.assertEqual([job.platform for job in daemon.run_pending()], ["Twitter"])
+            self.assertEqual(daemon.run_pending(), [])
+
+            self.clock.now = datetime(2024, 6, 3, 9, 30)
+            self.assertEqual([job.platform for job in daemon.run_pending()], ["Deviant"])
+
+        self.assertEqual([call.args[1] for call in mock_execute.call_args_list], ["Twitter", "Deviant"])
+
+    def test_runs_every_job_on_its_own_account_copy(self):
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock)
+        with patch("scheduler_daemon.execute") as mock_execute:
+            self.clock.now += timedelta(minutes=1)
+            daemon.run_pending()
+
+        self.assertIsNot(mock_execute.call_args.args[0], daemon.accounts["my_account"])
+
+    def test_keeps_running_when_a_job_fails(self):
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock)
+        with patch("scheduler_daemon.execute", side_effect=ValueError("No file found")):
+            self.clock.now += timedelta(minutes=1)
+            self.assertEqual(len(daemon.run_pending()), 1)
+
+    def test_keeps_the_previous_schedule_when_the_accounts_file_is_broken(self):
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock)
+        jobs = list(daemon.jobs)
+        accounts_path = os.path.join(self.tmp, "accounts.yml")
+        with open(accounts_path, "a") as file:
+            file.write("  broken: [yaml\n")
+        os.utime(accounts_path, (0, 0))
+
+        with patch("scheduler_daemon.time.sleep", side_effect=StopDaemon), self.assertRaises(StopDaemon):
+            daemon.run_forever()
+
+        self.assertEqual(daemon.jobs, jobs)
+        self.assertEqual(daemon.next_runs, {job: job.schedule.next_after(self.clock.now) for job in jobs})
+
+    def test_defers_jobs_of_rate_limited_platforms(self):
+        now = datetime(2024, 6, 3, 9, 0, 5)
+        ledger = RateLimitLedger(os.path.join(self.tmp, "ledger.sqlite3"), clock=lambda: now.timestamp())
+        self.addCleanup(ledger.close)
+        ledger.record("my_account", "Twitter", PLATFORM_WIDE, 0, (now + timedelta(minutes=20)).timestamp())
+
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock, ledger=ledger)
+        with patch("scheduler_daemon.execute") as mock_execute:
+            self.clock.now = now
+            self.assertEqual([job.platform for job in daemon.run_pending()], ["Twitter"])
+
+        mock_execute.assert_not_called()
+        twitter_job = next(job for job in daemon.jobs if job.platform == "Twitter")
+        self.assertEqual(daemon.next_runs[twitter_job], now + timedelta(minutes=20))
+
+    def test_defers_jobs_that_ran_into_a_rate_limit(self):
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock, ledger=RateLimitLedger(os.path.join(self.tmp, "ledger.sqlite3")))
+        next_available_at = datetime(2024, 6, 3, 9, 15)
+        with patch("scheduler_daemon.execute", side_effect=RateLimitedError("Twitter", next_available_at)):
+            self.clock.now = datetime(2024, 6, 3, 9, 0, 5)
+            daemon.run_pending()
+
+        twitter_job = next(job for job in daemon.jobs if job.platform == "Twitter")
+        self.assertEqual(daemon.next_runs[twitter_job], next_available_at)
+
+    def test_defers_fan_out_jobs_while_one_of_their_platforms_is_rate_limited(self):
+        accounts = load_accounts(path)
+        accounts["my_account"]["schedules"] = {"All": "0 * * * *"}
+        with open(os.path.join(self.tmp, "accounts.yml"), "w") as file:
+            yaml.safe_dump(accounts, file)
+        now = datetime(2024, 6, 3, 9, 0, 5)
+        ledger = RateLimitLedger(os.path.join(self.tmp, "ledger.sqlite3"), clock=lambda: now.timestamp())
+        self.addCleanup(ledger.close)
+        ledger.record("my_account", "Deviant", PLATFORM_WIDE, 0, (now + timedelta(minutes=20)).timestamp())
+
+        daemon = SchedulerDaemon(self.tmp, clock=self.clock, ledger=ledger)
+        with patch("scheduler_daemon.execute") as mock_execute:
+            self.clock.now = now
+            daemon.run_pending()
+
+        mock_execute.assert_not_called()
+        self.assertEqual(list(daemon.next_runs.values()), [now + timedelta(minutes=20)])
@@ -1,7 +1,12 @@
+import os
+import shutil
+import tempfile
 from typing import Dict
 import unittest
+from unittest.mock import patch
+import yaml
 from models.account import Account
-from utils.account_loader import load_accounts, select_account, parse_account
+from utils.account_loader import SNAPSHOT_FILE, load_accounts, select_account, parse_account
 from factories.factories import config, deviant
 
 path = "tests/fixtures"
@@ -92,3 +97,47 @@ class TestAccount(unittest.TestCase):
         self.assertEqual(result.deviant_config.gallery_ids, ["1", "123"])
         self.assertEqual(result.deviant_config.tags, ["tag1", "tag2", "testtag", "othertesttag"])
         self.assertEqual(result.twitter_config.fixed_tags, ["#extra1", "#extra2", "#extra3"])
+
+
+class TestAccountsSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.accounts = load_accounts(path)
+        self.write_accounts({"first": self.accounts["my_account"], "second": self.accounts["my_account"]}, mtime=1_700_000_000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_accounts(self, accounts, mtime):
+        accounts_path = os.path.join(self.tmp, "accounts.yml")
+        with open(accounts_path, "w") as file:
+            yaml.safe_dump(accounts, file)
+        os.utime(accounts_path, (mtime, mtime))
+
+    def test_parses_the_yaml_once_while_unchanged(self):
+        self.assertEqual(list(load_accounts(self.tmp).keys()), ["first", "second"])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, SNAPSHOT_FILE)))
+
+        with patch("yaml.load") as mock_load:
+            self.assertEqual(select_account("second", self.tmp).id, "my_account")
+            os.utime(os.path.join(self.tmp, "accounts.yml"), (1_700_000_100, 1_700_000_100))
+            self.assertEqual(list(load_accounts(self.tmp).keys()), ["first", "second"])
+        mock_load.assert_not_called()
+
+    def test_parses_the_yaml_again_when_it_changed(self):
+        load_accounts(self.tmp)
+        self.write_accounts({"third": self.accounts["my_account"]}, mtime=1_700_000_000)
+
+        self.assertEqual(list(load_accounts(self.tmp).keys()), ["third"])
+
+    def test_selecting_an_account_only_loads_that_account(self):
+        load_accounts(self.tmp)
+        with patch("pickle.loads", return_value=self.accounts["my_account"]) as mock_loads:
+            select_account("first", self.tmp)
+        mock_loads.assert_called_once()
+
+    def test_ignores_a_corrupt_snapshot(self):
+        with open(os.path.join(self.tmp, SNAPSHOT_FILE), "wb") as file:
+            file.write(b"not a snapshot")
+
+        self.assertEqual(list(load_accounts(self.tmp).keys()), ["first", "second"])
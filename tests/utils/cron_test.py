@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime
+
+from utils.cron import CronSchedule
+
+
+class TestCronSchedule(unittest.TestCase):
+    def test_rejects_invalid_expressions(self):
+        with self.assertRaises(ValueError):
+            CronSchedule("* * *")
+        with self.assertRaises(ValueError):
+            CronSchedule("61 * * * *")
+
+    def test_matches_lists_ranges_and_steps(self):
+        schedule = CronSchedule("*/15 9-17 * * 1,3")
+        self.assertTrue(schedule.matches(datetime(2024, 6, 3, 9, 45)))  # monday
+        self.assertFalse(schedule.matches(datetime(2024, 6, 3, 9, 50)))
+        self.assertFalse(schedule.matches(datetime(2024, 6, 4, 9, 45)))  # tuesday
+
+    def test_treats_seven_as_sunday(self):
+        self.assertTrue(CronSchedule("0 0 * * 7").matches(datetime(2024, 6, 2)))
+
+    def test_matches_either_day_field_when_both_are_restricted(self):
+        schedule = CronSchedule("0 0 1 * 1")
+        self.assertTrue(schedule.matches(datetime(2024, 6, 1)))  # first of the month, a saturday
+        self.assertTrue(schedule.matches(datetime(2024, 6, 3)))  # monday
+
+    def test_finds_the_next_run(self):
+        schedule = CronSchedule("30 9 * * *")
+        self.assertEqual(schedule.next_after(datetime(2024, 6, 3, 9, 29, 59)), datetime(2024, 6, 3, 9, 30))
+        self.assertEqual(schedule.next_after(datetime(2024, 6, 3, 9, 30)), datetime(2024, 6, 4, 9, 30))
+        self.assertEqual(CronSchedule("0 0 29 2 *").next_after(datetime(2024, 3, 1)), datetime(2028, 2, 29))
+
+    def test_fails_for_schedules_that_never_fire(self):
+        with self.assertRaises(ValueError):
+            CronSchedule("0 0 30 2 *").next_after(datetime(2024, 1, 1))
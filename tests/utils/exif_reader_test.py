@@ -0,0 +1,68 @@
+import io
+import os
+import tempfile
+import unittest
+
+import piexif
+from PIL import Image
+
+from utils.exif_reader import parse_xp_tags, read_exif_segment, read_xp_tags
+
+XP_EXIF = {
+    "0th": {
+        piexif.ImageIFD.XPSubject: "a caption".encode("utf-16le"),
+        piexif.ImageIFD.XPKeywords: "TW".encode("utf-16le"),
+        piexif.ImageIFD.XPComment: "tag_1, tag_2".encode("utf-16le"),
+        piexif.ImageIFD.Artist: b"someone",
+    },
+    "Exif": {piexif.ExifIFD.UserComment: b"ASCII\x00\x00\x00a comment"},
+}
+
+
+def create_jpeg(exif=None):
+    output = io.BytesIO()
+    options = {"exif": exif} if exif is not None else {}
+    Image.new("RGB", (32, 32), color="red").save(output, format="JPEG", **options)
+    return output.getvalue()
+
+
+class TestExifReader(unittest.TestCase):
+    def test_reads_the_xp_tags_like_piexif(self):
+        exif_bytes = piexif.dump(XP_EXIF)
+        loaded = piexif.load(exif_bytes)["0th"]
+        expected = {tag: loaded[tag] for tag in [piexif.ImageIFD.XPSubject, piexif.ImageIFD.XPKeywords, piexif.ImageIFD.XPComment]}
+
+        self.assertEqual(parse_xp_tags(exif_bytes), expected)
+
+    def test_reads_little_endian_exif(self):
+        exif = Image.Exif()
+        exif[piexif.ImageIFD.XPSubject] = "a caption".encode("utf-16le")
+        exif[piexif.ImageIFD.XPComment] = b"t\x00"
+
+        tags = parse_xp_tags(exif.tobytes())
+
+        self.assertEqual(tags[piexif.ImageIFD.XPSubject], tuple("a caption".encode("utf-16le")))
+        self.assertEqual(tags[piexif.ImageIFD.XPComment], (ord("t"), 0))
+
+    def test_reads_only_the_header_of_the_file(self):
+        data = create_jpeg(piexif.dump(XP_EXIF))
+
+        self.assertEqual(read_exif_segment(io.BytesIO(data)), Image.open(io.BytesIO(data)).info["exif"])
+        self.assertIsNone(read_exif_segment(io.BytesIO(create_jpeg())))
+
+    def test_reads_the_tags_of_a_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            jpeg_path = os.path.join(tmp, "test.jpg")
+            with open(jpeg_path, "wb") as file:
+                file.write(create_jpeg(piexif.dump(XP_EXIF)))
+            png_path = os.path.join(tmp, "test.png")
+            Image.new("RGB", (8, 8)).save(png_path)
+
+            self.assertEqual(read_xp_tags(jpeg_path)[piexif.ImageIFD.XPSubject], tuple("a caption".encode("utf-16le")))
+            self.assertIsNone(read_xp_tags(png_path))
+
+    def test_rejects_malformed_exif(self):
+        with self.assertRaises(ValueError):
+            parse_xp_tags(b"Exif\x00\x00XX\x00*")
+        with self.assertRaises(ValueError):
+            parse_xp_tags(b"Exif\x00\x00MM\x00*\x00\x00\xff\xff")
@@ -1,6 +1,7 @@
+import os
 import unittest
 from factories.factories import account, config, scheduler_profile
-from utils.file_utils import exclude_files
+from utils.file_utils import exclude_files, iter_images_in_folders
 
 
 def get_paths():
@@ -87,3 +88,9 @@ class TestFileUtils(unittest.TestCase):
                 "/pictures/folder2/to-post/nested/image8_DEVI_P.jpg",
             ],
         )
+
+    def test_iterates_images_lazily_with_required_tags(self):
+        acc = account({"directory_path": "./tests/fixtures"})
+        images = iter_images_in_folders(acc, ["Twitter"], skip_queued=False, required_tags=["_TWIT_Q"])
+        self.assertNotIsInstance(images, list)
+        self.assertListEqual(list(images), [os.path.abspath("./tests/fixtures/test_TWIT_Q.jpg")])
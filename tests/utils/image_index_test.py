@@ -0,0 +1,114 @@
+import glob
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from factories.factories import account
+from utils.file_utils import find_images_in_folders
+from utils.image_index import ImageIndex, get_platform_state
+
+
+def touch(path, timestamp=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(b"\xff\xd8\xff\xd9")
+    if timestamp:
+        os.utime(path, (timestamp, timestamp))
+
+
+def age_tree(root, timestamp=1_000_000):
+    # Pretend the tree was last modified long ago, so directory mtimes are trusted by the index
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, (timestamp, timestamp))
+
+
+def globbed(pattern, extensions):
+    result = []
+    for ext in extensions:
+        result.extend(os.path.abspath(file) for file in glob.glob(os.path.join(pattern, f"*{ext}"), recursive=True))
+    return sorted(result)
+
+
+class TestImageIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "library")
+        for relative_path in [
+            "a/posted/one.jpg",
+            "a/posted/two_TWIT_Q.jpeg",
+            "a/nested/posted/three_DEVI_P.jpg",
+            "a/nested/other/four.jpg",
+            "b/posted/five.png",
+            "b/posted/.hidden.jpg",
+            ".hidden/posted/six.jpg",
+            "seven.jpg",
+        ]:
+            touch(os.path.join(self.root, relative_path))
+        self.index = ImageIndex(os.path.join(self.tmp.name, "index.sqlite3"))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def assert_matches_glob(self, pattern, extensions=("jpg", "jpeg")):
+        self.index.refresh(pattern)
+        self.assertListEqual(sorted(self.index.find(pattern, extensions)), globbed(pattern, extensions))
+
+    def test_matches_glob_for_plain_directories(self):
+        self.assert_matches_glob(self.root)
+
+    def test_matches_glob_for_recursive_patterns(self):
+        self.assert_matches_glob(os.path.join(self.root, "**"))
+        self.assert_matches_glob(os.path.join(self.root, "**", "posted"))
+        self.assert_matches_glob(os.path.join(self.root, "*", "posted"))
+
+    def test_follows_symlinked_directories_like_glob(self):
+        os.symlink(os.path.join(self.root, "a", "posted"), os.path.join(self.root, "b", "linked"))
+        os.symlink(self.root, os.path.join(self.root, "a", "nested", "loop"))
+
+        self.index.refresh(self.root)
+        found = self.index.find(os.path.join(self.root, "**"), ["jpg"])
+
+        self.assertIn(os.path.join(self.root, "a", "posted", "one.jpg"), found)
+        self.assertIn(os.path.join(self.root, "b", "linked", "one.jpg"), found)
+        self.assertEqual(len(found), len(set(found)))
+        self.assert_matches_glob(os.path.join(self.root, "*", "linked"))
+
+    def test_picks_up_added_and_removed_files(self):
+        pattern = os.path.join(self.root, "**", "posted")
+        self.index.refresh(pattern)
+        touch(os.path.join(self.root, "c", "posted", "eight.jpg"))
+        os.remove(os.path.join(self.root, "a", "posted", "one.jpg"))
+        self.assert_matches_glob(pattern)
+
+    def test_only_rescans_changed_directories(self):
+        age_tree(self.root)
+        self.index.refresh(self.root)
+
+        touch(os.path.join(self.root, "a", "posted", "eight.jpg"))
+        with patch("os.scandir", wraps=os.scandir) as scandir:
+            self.index.refresh(self.root)
+            scanned = [call.args[0] for call in scandir.call_args_list]
+
+        self.assertListEqual(scanned, [os.path.join(self.root, "a", "posted")])
+        self.assertIn(os.path.join(self.root, "a", "posted", "eight.jpg"), self.index.find(self.root + "/**", ["jpg"]))
+
+    def test_parses_platform_state_from_file_name(self):
+        self.assertEqual(get_platform_state("image_TWIT_Q.jpg", "Twitter"), "queued")
+        self.assertEqual(get_platform_state("image_TWIT_Q_TWIT_P.jpg", "Twitter"), "posted")
+        self.assertEqual(get_platform_state("image_TWIT_Q.jpg", "Deviant"), None)
+
+    def test_find_images_in_folders_answers_from_the_index_when_enabled(self):
+        acc = account({"directory_path": os.path.join(self.root, "**", "posted"), "image_index": True})
+        with patch("utils.file_utils.get_image_index", return_value=self.index), patch("glob.glob") as mock_glob:
+            result = find_images_in_folders(acc, ["Twitter"], skip_queued=True)
+
+        mock_glob.assert_not_called()
+        self.assertListEqual(
+            sorted(result),
+            [
+                os.path.join(self.root, "a", "nested", "posted", "three_DEVI_P.jpg"),
+                os.path.join(self.root, "a", "posted", "one.jpg"),
+            ],
+        )
@@ -1,8 +1,10 @@
 import unittest
 import os
+from unittest.mock import patch
 from PIL import Image
 import piexif
 from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.jpeg_utils import iter_segments
 
 
 def create_test_image(path):
@@ -92,3 +94,34 @@ class TestImageMetadataAdjuster(unittest.TestCase):
         adjuster.save()
 
         self.assertEqual(adjuster.get_content_tags(), "hello_world_, invalid_chars_here")
+
+    def test_save_keeps_the_image_data(self):
+        with open(self.test_image_path, "rb") as file:
+            original = file.read()
+        _, sos_start, _ = list(iter_segments(original))[-1]
+
+        adjuster = ImageMetadataAdjuster(self.test_image_path)
+        adjuster.add_subject("a caption")
+        with patch("PIL.Image.open") as mock_open:
+            adjuster.save()
+        mock_open.assert_not_called()
+
+        with open(self.test_image_path, "rb") as file:
+            saved = file.read()
+        self.assertTrue(saved.endswith(original[sos_start:]))
+        self.assertEqual(piexif.load(self.test_image_path)["0th"][piexif.ImageIFD.XPSubject], tuple("a caption".encode("utf-16le")))
+        self.assertEqual([name for name in os.listdir(".") if name.endswith(".tmp")], [])
+
+    def test_save_re_encodes_other_formats(self):
+        png_path = "test.png"
+        Image.new("RGB", (10, 10), color="blue").save(png_path)
+        try:
+            adjuster = ImageMetadataAdjuster(png_path)
+            adjuster.set_content_tags("tag1")
+            adjuster.save()
+
+            with Image.open(png_path) as image:
+                self.assertEqual(image.format, "PNG")
+                self.assertEqual(piexif.load(image.info["exif"])["0th"][piexif.ImageIFD.XPComment], tuple("tag1".encode("utf-16le")))
+        finally:
+            os.remove(png_path)
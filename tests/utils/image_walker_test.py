@@ -0,0 +1,79 @@
+import glob
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from utils.image_walker import find_image_entries
+
+
+def globbed(folder_path, extensions):
+    # The original implementation, one recursive glob per extension
+    result = []
+    for ext in extensions:
+        result.extend(os.path.abspath(file) for file in glob.glob(os.path.join(folder_path, f"*{ext}"), recursive=True))
+    return result
+
+
+class TestImageWalker(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.root = cls.tmp.name
+        for relative_path in [
+            "one.jpg",
+            "two.jpeg",
+            "pictures/to-post/three.jpg",
+            "pictures/to-post/four_TWIT_Q.jpeg",
+            "pictures/nested/to-post/five.jpg",
+            "pictures/nested/to-post/deeper/six.jpg",
+            "pictures/nested/other/seven.png",
+            "pictures/.hidden/to-post/eight.jpg",
+            "pictures/to-post/.nine.jpg",
+            "pictures/post/ten.JPG",
+        ]:
+            path = os.path.join(cls.root, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+        os.makedirs(os.path.join(cls.root, "pictures", "folder.jpg"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def assert_matches_glob(self, folder_path, extensions=("jpg", "jpeg")):
+        result = [path for path, _ in find_image_entries(folder_path, list(extensions))]
+        self.assertListEqual(result, globbed(folder_path, extensions))
+
+    def test_matches_glob_for_plain_directories(self):
+        self.assert_matches_glob(self.root)
+        self.assert_matches_glob(os.path.join(self.root, "pictures", "to-post"))
+
+    def test_matches_glob_for_recursive_patterns(self):
+        self.assert_matches_glob(os.path.join(self.root, "**"))
+        self.assert_matches_glob(os.path.join(self.root, "**", "to-post"))
+        self.assert_matches_glob(os.path.join(self.root, "**", "*post*"))
+        self.assert_matches_glob(os.path.join(self.root, "pictures", "**", "to-post", "**"))
+
+    def test_matches_glob_for_wildcard_segments(self):
+        self.assert_matches_glob(os.path.join(self.root, "*", "to-post"))
+        self.assert_matches_glob(os.path.join(self.root, "pictures", "*", "to-post"))
+        self.assert_matches_glob(os.path.join(self.root, "pictures", "[nt]*"))
+
+    def test_matches_glob_for_overlapping_extensions(self):
+        self.assert_matches_glob(os.path.join(self.root, "**"), ["jpg", "pg", "JPG"])
+
+    def test_matches_glob_for_missing_directories(self):
+        self.assert_matches_glob(os.path.join(self.root, "missing"))
+        self.assert_matches_glob(os.path.join(self.root, "missing", "**"))
+
+    def test_lists_each_directory_once_regardless_of_extension_count(self):
+        with patch("os.scandir", wraps=os.scandir) as scandir:
+            find_image_entries(os.path.join(self.root, "**"), ["jpg", "jpeg", "png", "webp"])
+            scanned = [os.path.normpath(call.args[0]) for call in scandir.call_args_list]
+
+        self.assertEqual(len(scanned), len(set(scanned)))
+
+    def test_keeps_the_dir_entry_for_stat_reuse(self):
+        path, entry = find_image_entries(self.root, ["jpg"])[0]
+        self.assertEqual(entry.stat().st_mtime, os.path.getmtime(path))
@@ -0,0 +1,198 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from factories.factories import account
+from job_worker import get_job_platforms, run_job, work
+from utils.job_queue import DONE, FAILED, HEARTBEAT_SECONDS, PENDING, RETRY_BACKOFF_SECONDS, RUNNING, STALE_AFTER_SECONDS, JobQueue
+from utils.rate_limit_ledger import RateLimitedError
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.clock = FakeClock(1_700_000_000.0)
+        self.queue = JobQueue(os.path.join(self.tmp, "jobs.sqlite3"), clock=self.clock)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp)
+
+    def test_claims_due_jobs_by_priority(self):
+        self.queue.enqueue("a", "Twitter")
+        urgent = self.queue.enqueue("b", "Twitter", priority=5)
+        self.queue.enqueue("c", "Twitter", due_at=self.clock.now + 60)
+
+        job = self.queue.claim("worker")
+        self.assertEqual((job.id, job.status, job.attempts), (urgent, RUNNING, 1))
+        self.assertEqual(self.queue.claim("worker").account_name, "a")
+        self.assertIsNone(self.queue.claim("worker"))
+
+    def test_runs_one_job_per_account_at_a_time(self):
+        first = self.queue.enqueue("a", "Twitter")
+        self.queue.enqueue("a", "Deviant")
+
+        self.queue.claim("worker")
+        self.assertIsNone(self.queue.claim("worker"))
+        self.queue.complete(first)
+        self.assertEqual(self.queue.claim("worker").platform, "Deviant")
+
+    def test_respects_the_platform_limits(self):
+        for account_name in ["a", "b", "c"]:
+            self.queue.enqueue(account_name, "Twitter")
+        self.queue.enqueue("d", "Deviant")
+
+        claimed = [self.queue.claim("worker", {"Twitter": 2}) for _ in range(4)]
+        self.assertEqual([job.platform if job else None for job in claimed], ["Twitter", "Twitter", "Deviant", None])
+
+    def test_counts_fan_out_jobs_against_every_platform_they_post_to(self):
+        accounts = {"a": account({"id": "a"}), "b": account({"id": "b"}), "c": account({"id": "c"})}
+        self.queue.enqueue("a", "All")
+        self.queue.enqueue("b", "Twitter")
+        self.queue.enqueue("c", "Twitter,Deviant")
+
+        def claim():
+            return self.queue.claim("worker", {"Twitter": 1, "Deviant": 1}, lambda account_name, mode: get_job_platforms(accounts, account_name, mode))
+
+        first = claim()
+        self.assertEqual(first.platform, "All")
+        self.assertIsNone(claim())
+        self.queue.complete(first.id)
+        self.assertEqual([claim().platform, claim()], ["Twitter", None])
+
+    def test_counts_unexpanded_fan_out_jobs_against_every_limited_platform(self):
+        self.queue.enqueue("a", "All")
+        self.queue.enqueue("b", "Deviant")
+
+        self.assertEqual(self.queue.claim("worker", {"Deviant": 1}).platform, "All")
+        self.assertIsNone(self.queue.claim("worker", {"Deviant": 1}))
+
+    def test_a_job_is_claimed_only_once(self):
+        for i in range(20):
+            self.queue.enqueue(f"account_{i}", "Twitter")
+
+        claimed = []
+        lock = threading.Lock()
+
+        def claim_all():
+            queue = JobQueue(self.queue.db_path, clock=self.clock)
+            while (job := queue.claim("worker")) is not None:
+                with lock:
+                    claimed.append(job.id)
+            queue.close()
+
+        threads = [threading.Thread(target=claim_all) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), list(range(1, 21)))
+
+    def test_retries_failed_jobs_with_backoff(self):
+        job_id = self.queue.enqueue("a", "Twitter", max_attempts=2)
+
+        self.queue.claim("worker")
+        self.assertEqual(self.queue.fail(job_id, "upload failed"), self.clock.now + RETRY_BACKOFF_SECONDS)
+        self.assertIsNone(self.queue.claim("worker"))
+
+        self.clock.now += RETRY_BACKOFF_SECONDS
+        self.assertEqual(self.queue.claim("worker").attempts, 2)
+        self.assertIsNone(self.queue.fail(job_id, "upload failed"))
+        self.assertEqual(self.queue.get(job_id).status, FAILED)
+
+    def test_deferring_does_not_use_an_attempt(self):
+        job_id = self.queue.enqueue("a", "Twitter")
+        self.queue.claim("worker")
+        self.queue.defer(job_id, self.clock.now + 900, "rate limited")
+
+        job = self.queue.get(job_id)
+        self.assertEqual((job.status, job.attempts, job.due_at), (PENDING, 0, self.clock.now + 900))
+
+    def test_hands_out_jobs_of_dead_workers_again(self):
+        job_id = self.queue.enqueue("a", "Twitter")
+        self.queue.claim("worker")
+
+        self.clock.now += STALE_AFTER_SECONDS + 1
+        self.assertEqual(self.queue.claim("other worker").id, job_id)
+
+    def test_keeps_long_running_jobs_of_live_workers(self):
+        job_id = self.queue.enqueue("a", "Twitter")
+        self.queue.enqueue("a", "Deviant")
+        self.queue.claim("worker")
+
+        for _ in range(10):
+            self.clock.now += HEARTBEAT_SECONDS
+            self.assertTrue(self.queue.heartbeat(job_id))
+            self.assertIsNone(self.queue.claim("other worker"))
+        self.assertEqual(self.queue.get(job_id).status, RUNNING)
+
+
+class TestJobWorker(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.tmp, "jobs.sqlite3"))
+        self.accounts = {"a": account({"id": "a"}), "b": account({"id": "b"})}
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp)
+
+    def test_records_the_outcome_of_every_job(self):
+        done = self.queue.enqueue("a", "Twitter")
+        failed = self.queue.enqueue("b", "Twitter", max_attempts=1)
+        unknown = self.queue.enqueue("unknown", "Twitter")
+
+        with patch("job_worker.execute", side_effect=[{"id": 1}, ValueError("No file found")]), patch("job_worker.copy_account_for_run"):
+            work(self.queue, self.accounts, workers=1, drain=True)
+
+        self.assertEqual([self.queue.get(job_id).status for job_id in [done, failed, unknown]], [DONE, FAILED, FAILED])
+        self.assertEqual(self.queue.get(failed).last_error, "No file found")
+
+    def test_renews_the_lease_while_a_job_runs(self):
+        job_id = self.queue.enqueue("a", "Twitter")
+
+        with (
+            patch("job_worker.execute", side_effect=lambda *args: time.sleep(0.1)),
+            patch("job_worker.copy_account_for_run"),
+            patch("job_worker.HEARTBEAT_SECONDS", 0.01),
+            patch.object(self.queue, "heartbeat", wraps=self.queue.heartbeat) as heartbeat,
+        ):
+            run_job(self.queue, self.accounts, self.queue.claim("worker"))
+
+        self.assertGreater(heartbeat.call_count, 1)
+        heartbeat.assert_called_with(job_id)
+
+    def test_defers_rate_limited_jobs(self):
+        job_id = self.queue.enqueue("a", "Deviant")
+        next_available_at = datetime(2030, 1, 1, 12, 0)
+
+        with patch("job_worker.execute", side_effect=RateLimitedError("Deviant", next_available_at)), patch("job_worker.copy_account_for_run"):
+            run_job(self.queue, self.accounts, self.queue.claim("worker"))
+
+        job = self.queue.get(job_id)
+        self.assertEqual((job.status, job.attempts, job.due_at), (PENDING, 0, next_available_at.timestamp()))
+
+    def test_a_fan_out_fails_only_when_no_platform_was_posted_to(self):
+        partial = self.queue.enqueue("a", "All")
+        nothing = self.queue.enqueue("b", "All", max_attempts=1)
+
+        with (
+            patch("job_worker.execute", side_effect=[{"Twitter": {"id": 1}, "Deviant": False}, {"Twitter": False, "Deviant": False}]),
+            patch("job_worker.copy_account_for_run"),
+        ):
+            work(self.queue, self.accounts, workers=1, drain=True)
+
+        self.assertEqual([self.queue.get(job_id).status for job_id in [partial, nothing]], [DONE, FAILED])
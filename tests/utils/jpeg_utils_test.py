@@ -0,0 +1,92 @@
+import io
+import unittest
+
+import piexif
+from PIL import Image
+
+from utils.jpeg_utils import iter_segments, iter_stripped_jpeg, strip_image_metadata, strip_jpeg_metadata, stripped_jpeg_size, write_jpeg_with_exif
+
+
+def create_jpeg(**options):
+    image = Image.new("RGB", (64, 48), color="red")
+    exif = piexif.dump({"0th": {piexif.ImageIFD.XPSubject: "a caption".encode("utf-16le")}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None})
+    output = io.BytesIO()
+    image.save(output, format="JPEG", exif=exif, **options)
+    return output.getvalue()
+
+
+def markers(data):
+    return [marker for marker, _, _ in iter_segments(data)]
+
+
+class TestJpegUtils(unittest.TestCase):
+    def test_removes_exif_and_comment_segments(self):
+        original = create_jpeg(comment=b"a comment")
+        self.assertIn(0xE1, markers(original))
+        self.assertIn(0xFE, markers(original))
+
+        stripped = strip_jpeg_metadata(original)
+
+        self.assertNotIn(0xE1, markers(stripped))
+        self.assertNotIn(0xFE, markers(stripped))
+        self.assertNotIn("exif", Image.open(io.BytesIO(stripped)).info)
+
+    def test_keeps_the_image_data_untouched(self):
+        original = create_jpeg()
+        stripped = strip_jpeg_metadata(original)
+
+        _, sos_start, _ = list(iter_segments(original))[-1]
+        self.assertTrue(stripped.endswith(original[sos_start:]))
+        self.assertEqual(Image.open(io.BytesIO(stripped)).tobytes(), Image.open(io.BytesIO(original)).tobytes())
+
+    def test_keeps_the_colour_profile(self):
+        stripped = strip_jpeg_metadata(create_jpeg(icc_profile=b"fake profile"))
+        self.assertEqual(Image.open(io.BytesIO(stripped)).info["icc_profile"], b"fake profile")
+
+    def test_rejects_malformed_jpegs(self):
+        with self.assertRaises(ValueError):
+            strip_jpeg_metadata(b"\xff\xd8\xff\xe1\xff\xff")
+
+    def test_falls_back_to_pillow_for_other_formats(self):
+        image = Image.new("RGB", (8, 8), color="blue")
+        output = io.BytesIO()
+        image.save(output, format="PNG", exif=piexif.dump({"0th": {piexif.ImageIFD.XPSubject: b"x\x00"}}))
+
+        stripped = strip_image_metadata(output.getvalue())
+
+        result = Image.open(io.BytesIO(stripped))
+        self.assertEqual(result.format, "PNG")
+        self.assertNotIn("exif", result.info)
+
+    def test_streams_the_stripped_jpeg_in_chunks(self):
+        original = create_jpeg(comment=b"a comment")
+        chunks = list(iter_stripped_jpeg(io.BytesIO(original), chunk_size=64))
+
+        self.assertTrue(all(len(chunk) <= 64 for chunk in chunks))
+        self.assertEqual(b"".join(chunks), strip_jpeg_metadata(original))
+        self.assertEqual(stripped_jpeg_size(io.BytesIO(original)), len(strip_jpeg_metadata(original)))
+
+    def test_replaces_the_exif_segment_in_place(self):
+        original = create_jpeg(comment=b"a comment")
+        exif = piexif.dump({"0th": {piexif.ImageIFD.XPSubject: "new caption".encode("utf-16le")}})
+        output = io.BytesIO()
+        write_jpeg_with_exif(io.BytesIO(original), output, exif, chunk_size=64)
+
+        self.assertEqual(markers(output.getvalue()), markers(original))
+        self.assertEqual(piexif.load(output.getvalue())["0th"][piexif.ImageIFD.XPSubject], tuple("new caption".encode("utf-16le")))
+        _, sos_start, _ = list(iter_segments(original))[-1]
+        self.assertTrue(output.getvalue().endswith(original[sos_start:]))
+
+    def test_adds_a_missing_exif_segment_after_the_jfif_header(self):
+        image = Image.new("RGB", (16, 16), color="red")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        original = buffer.getvalue()
+        self.assertNotIn(0xE1, markers(original))
+
+        output = io.BytesIO()
+        write_jpeg_with_exif(io.BytesIO(original), output, piexif.dump({"0th": {}}))
+
+        self.assertEqual(markers(output.getvalue())[:2], [0xE0, 0xE1])
+        _, sos_start, _ = list(iter_segments(original))[-1]
+        self.assertTrue(output.getvalue().endswith(original[sos_start:]))
@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Pool
+
+import piexif
+from PIL import Image
+
+from factories.factories import account as account_factory
+from utils.file_utils import replace_file_tag
+from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.metadata_backend import (
+    SIDECAR_FILENAME,
+    SidecarMetadataAdjuster,
+    get_metadata_adjuster,
+    read_sidecar_entry,
+    save_posted_metadata,
+    write_sidecar_entry,
+)
+from utils.metadata_cache import get_metadata_cache
+from utils.prepared_upload import prepare_upload
+
+
+def create_image(path):
+    exif = {"0th": {piexif.ImageIFD.XPSubject: "exif caption".encode("utf-16le"), piexif.ImageIFD.XPComment: "exif_tag".encode("utf-16le")}}
+    Image.new("RGB", (16, 16), color="red").save(path, exif=piexif.dump(exif))
+
+
+def write_entries(args):
+    directory, worker = args
+    for index in range(10):
+        write_sidecar_entry(os.path.join(directory, f"{worker}_{index}.jpg"), {"caption": f"{worker} {index}"})
+
+
+class TestSidecarMetadataAdjuster(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.tmp, "image_TWIT_Q.jpg")
+        create_image(self.image_path)
+        self.sidecar_path = os.path.join(self.tmp, SIDECAR_FILENAME)
+
+    def tearDown(self):
+        get_metadata_cache().clear()
+        shutil.rmtree(self.tmp)
+
+    def edit(self, caption="sidecar caption", content_tags="tag 1, tag2"):
+        adjuster = SidecarMetadataAdjuster(self.image_path)
+        adjuster.add_subject(caption)
+        adjuster.set_content_tags(content_tags)
+        adjuster.save()
+        return adjuster
+
+    def test_saves_to_the_sidecar_without_touching_the_image(self):
+        mtime_ns = os.stat(self.image_path).st_mtime_ns
+        self.edit()
+
+        self.assertEqual(os.stat(self.image_path).st_mtime_ns, mtime_ns)
+        with open(self.sidecar_path) as file:
+            self.assertEqual(json.load(file), {"image_TWIT_Q.jpg": {"caption": "sidecar caption", "content_tags": "tag2, tag_1"}})
+        self.assertEqual(ImageMetadataAdjuster(self.image_path).get_caption(), "exif caption")
+
+    def test_reads_missing_fields_from_the_exif(self):
+        adjuster = SidecarMetadataAdjuster(self.image_path)
+        adjuster.add_subject("sidecar caption")
+        adjuster.save()
+
+        adjuster = SidecarMetadataAdjuster(self.image_path)
+        self.assertEqual((adjuster.get_caption(), adjuster.get_content_tags()), ("sidecar caption", "exif_tag"))
+
+    def test_merges_posted_keywords(self):
+        adjuster = SidecarMetadataAdjuster(self.image_path)
+        adjuster.add_tags("TWIT")
+        adjuster.save()
+        adjuster = SidecarMetadataAdjuster(self.image_path)
+        adjuster.add_tags("DEVI")
+        adjuster.save()
+
+        self.assertEqual(read_sidecar_entry(self.image_path), {"keywords": "TWIT;DEVI"})
+
+    def test_entry_follows_a_renamed_image(self):
+        self.edit()
+
+        new_path = replace_file_tag(self.image_path, "TWIT_Q", "TWIT_P")
+
+        self.assertEqual(read_sidecar_entry(self.image_path), {})
+        self.assertEqual(SidecarMetadataAdjuster(new_path).get_caption(), "sidecar caption")
+
+    def test_flush_writes_the_exif_and_drops_the_entry(self):
+        adjuster = self.edit()
+        adjuster.add_tags("TWIT")
+        adjuster.flush()
+
+        exif = ImageMetadataAdjuster(self.image_path)
+        self.assertEqual((exif.get_caption(), exif.get_content_tags(), exif.get_keywords()), ("sidecar caption", "tag2, tag_1", "TWIT"))
+        self.assertFalse(os.path.exists(self.sidecar_path))
+
+    def test_keeps_the_edits_of_concurrent_processes(self):
+        with Pool(4) as pool:
+            pool.map(write_entries, [(self.tmp, worker) for worker in range(4)])
+
+        with open(self.sidecar_path) as file:
+            self.assertEqual(len(json.load(file)), 40)
+        self.assertEqual([name for name in os.listdir(self.tmp) if name.endswith(".tmp")], [])
+
+    def test_uploads_use_the_sidecar_fields(self):
+        self.edit()
+
+        upload = prepare_upload(self.image_path, account_factory({"metadata": {"backend": "sidecar"}}))
+
+        self.assertEqual((upload.caption, upload.content_tags), ("sidecar caption", "tag2, tag_1"))
+
+    def test_uploads_of_exif_accounts_ignore_a_leftover_sidecar(self):
+        self.edit()
+
+        upload = prepare_upload(self.image_path, account_factory())
+
+        self.assertEqual((upload.caption, upload.content_tags), ("exif caption", "exif_tag"))
+
+
+class TestMetadataBackendSelection(unittest.TestCase):
+    def test_uses_the_exif_by_default(self):
+        account = account_factory()
+
+        self.assertIs(type(get_metadata_adjuster(account, "image.jpg")), ImageMetadataAdjuster)
+
+    def test_uses_the_configured_backend(self):
+        account = account_factory({"metadata": {"backend": "sidecar"}})
+
+        self.assertIsInstance(get_metadata_adjuster(account, "image.jpg"), SidecarMetadataAdjuster)
+
+    def test_rejects_unknown_backends(self):
+        with self.assertRaises(ValueError):
+            account_factory({"metadata": {"backend": "xmp"}})
+
+    def test_flushes_posted_metadata_when_configured(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            image_path = os.path.join(tmp, "image.jpg")
+            create_image(image_path)
+            account = account_factory({"metadata": {"backend": "sidecar", "flush_on_upload": True}})
+
+            adjuster = get_metadata_adjuster(account, image_path)
+            adjuster.add_tags("TWIT")
+            save_posted_metadata(account, adjuster)
+
+            self.assertEqual(ImageMetadataAdjuster(image_path).get_keywords(), "TWIT")
+            self.assertEqual(read_sidecar_entry(image_path), {})
+            get_metadata_cache().clear()
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import piexif
+from PIL import Image
+
+from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.metadata_cache import COMMIT_BATCH_SIZE, COMMIT_INTERVAL_SECONDS, FileKey, MetadataCache, MetadataStore
+
+
+def create_test_image(path, caption):
+    exif = {"0th": {piexif.ImageIFD.XPSubject: caption.encode("utf-16le")}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None}
+    Image.new("RGB", (100, 100), color="red").save(path, exif=piexif.dump(exif))
+
+
+class TestMetadataCache(unittest.TestCase):
+    def test_evicts_the_least_recently_used_file(self):
+        cache = MetadataCache(max_entries=2)
+        cache.put(FileKey("a", 1, 1), {"0th": {}})
+        cache.put(FileKey("b", 1, 1), {"0th": {}})
+        cache.get(FileKey("a", 1, 1))
+        cache.put(FileKey("c", 1, 1), {"0th": {}})
+
+        self.assertIsNotNone(cache.get(FileKey("a", 1, 1)))
+        self.assertIsNone(cache.get(FileKey("b", 1, 1)))
+
+    def test_hands_out_copies(self):
+        cache = MetadataCache()
+        cache.put(FileKey("a", 1, 1), {"0th": {}})
+        cache.get(FileKey("a", 1, 1))["0th"]["changed"] = True
+
+        self.assertEqual(cache.get(FileKey("a", 1, 1)), {"0th": {}})
+
+
+class TestMetadataStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, "metadata.sqlite3")
+        self.now = 1_700_000_000.0
+        self.store = MetadataStore(self.db_path, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def put(self, index):
+        self.store.put(FileKey(f"/images/{index}.jpg", 1, 1), {"0th": {}}, "caption", "", "")
+
+    def stored_count(self):
+        other_process = MetadataStore(self.db_path)
+        try:
+            return len(list(other_process.iter_entries()))
+        finally:
+            other_process.close()
+
+    def test_writes_files_in_batches(self):
+        for index in range(COMMIT_BATCH_SIZE - 1):
+            self.put(index)
+
+        self.assertEqual(self.store.get(FileKey("/images/0.jpg", 1, 1)), {"0th": {}})
+        self.assertEqual(self.stored_count(), 0)
+        self.put(COMMIT_BATCH_SIZE)
+        self.assertEqual(self.stored_count(), COMMIT_BATCH_SIZE)
+
+    def test_writes_the_batch_after_an_interval_and_on_close(self):
+        self.put(0)
+        self.now += COMMIT_INTERVAL_SECONDS
+        self.put(1)
+        self.assertEqual(self.stored_count(), 2)
+
+        self.put(2)
+        self.store.close()
+        self.assertEqual(self.stored_count(), 3)
+        self.store = MetadataStore(self.db_path)
+
+
+class TestCachedMetadataAdjuster(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.image_path = os.path.join(self.tmp, "test.jpg")
+        create_test_image(self.image_path, "a caption")
+
+        self.cache = MetadataCache()
+        self.store = MetadataStore(os.path.join(self.tmp, "metadata.sqlite3"))
+        self.patches = [
+            patch("utils.image_metadata_adjuster.get_metadata_cache", return_value=self.cache),
+            patch("utils.image_metadata_adjuster.get_metadata_store", return_value=self.store),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def test_parses_a_file_once(self):
+        self.assertEqual(ImageMetadataAdjuster(self.image_path).get_caption(), "a caption")
+        with patch("PIL.Image.open", wraps=Image.open) as mock_open:
+            self.assertEqual(ImageMetadataAdjuster(self.image_path).get_caption(), "a caption")
+            self.assertEqual(ImageMetadataAdjuster(self.image_path).get_content_tags(), "")
+        mock_open.assert_not_called()
+
+    def test_a_new_process_reads_unchanged_files_from_the_store(self):
+        ImageMetadataAdjuster(self.image_path).get_caption()
+        self.cache.clear()
+
+        with patch("PIL.Image.open", wraps=Image.open) as mock_open:
+            self.assertEqual(ImageMetadataAdjuster(self.image_path).get_caption(), "a caption")
+        mock_open.assert_not_called()
+
+    def test_save_updates_the_cached_metadata(self):
+        adjuster = ImageMetadataAdjuster(self.image_path)
+        adjuster.add_subject("a new caption")
+        adjuster.add_tags("TWIT")
+        adjuster.save()
+
+        with patch("PIL.Image.open", wraps=Image.open) as mock_open:
+            reread = ImageMetadataAdjuster(self.image_path)
+            self.assertEqual((reread.get_caption(), reread.get_keywords()), ("a new caption", "TWIT"))
+        mock_open.assert_not_called()
+
+        self.cache.clear()
+        self.assertEqual(ImageMetadataAdjuster(self.image_path).get_caption(), "a new caption")
+
+    def test_rereads_files_changed_by_other_programs(self):
+        ImageMetadataAdjuster(self.image_path).get_caption()
+        create_test_image(self.image_path, "changed elsewhere")
+        stat = os.stat(self.image_path)
+        os.utime(self.image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        self.assertEqual(ImageMetadataAdjuster(self.image_path).get_caption(), "changed elsewhere")
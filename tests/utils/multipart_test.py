@@ -0,0 +1,33 @@
+import unittest
+from email.parser import BytesParser
+
+from utils.multipart import MultipartEncoder, MultipartFile
+
+
+def parse(encoder: MultipartEncoder):
+    body = b"".join(encoder)
+    message = BytesParser().parsebytes(f"Content-Type: {encoder.content_type}\r\n\r\n".encode() + body)
+    return body, [(part.get_param("name", header="content-disposition"), part.get_filename(), part.get_payload(decode=True)) for part in message.get_payload()]
+
+
+class TestMultipartEncoder(unittest.TestCase):
+    def test_encodes_fields_and_streamed_files(self):
+        chunks = [b"abc", b"def", b"g"]
+        encoder = MultipartEncoder({"title": "a title", "tags[]": ["one", "two"]}, {"file": MultipartFile("image.jpg", 7, lambda: iter(chunks))})
+
+        body, parts = parse(encoder)
+
+        self.assertEqual(len(body), len(encoder))
+        self.assertEqual(
+            parts,
+            [("title", None, b"a title"), ("tags[]", None, b"one"), ("tags[]", None, b"two"), ("file", "image.jpg", b"abcdefg")],
+        )
+
+    def test_can_be_sent_again(self):
+        encoder = MultipartEncoder({}, {"file": MultipartFile("image.jpg", 3, lambda: iter([b"abc"]))})
+        self.assertEqual(b"".join(encoder), b"".join(encoder))
+
+    def test_rejects_files_that_changed_size(self):
+        encoder = MultipartEncoder({}, {"file": MultipartFile("image.jpg", 5, lambda: iter([b"abc"]))})
+        with self.assertRaises(ValueError):
+            b"".join(encoder)
@@ -0,0 +1,53 @@
+import fnmatch
+import unittest
+
+from factories.factories import account, config, scheduler_profile
+from utils.path_matcher import PathMatcher
+
+PATHS = [
+    "/pictures/folder1/to-post/image1.jpg",
+    "/pictures/folder1/nested/to-post/image2.jpg",
+    "/pictures/folder2/to-post/nested/image8_DEVI_P.jpg",
+    "/pictures/folder2/posted.jpg",
+    "./tests/fixtures/test/test.jpg",
+    "./tests/fixtures/test/other/test.jpg",
+    "./tests/fixtures/test.jpg",
+    "image.jpg",
+]
+
+
+def fnmatch_path(path, pattern):
+    return fnmatch.fnmatch(path, f"{pattern}/*")
+
+
+class TestPathMatcher(unittest.TestCase):
+    def test_matches_like_fnmatch(self):
+        include = ["**/*post*", "./tests/fixtures/**/other"]
+        exclude = ["**/nested/*post*"]
+        sub_configs = ["./tests/fixtures/test", "./tests/fixtures/**/other", "/pictures/folder2"]
+        matcher = PathMatcher(include, exclude, sub_configs)
+
+        for path in PATHS:
+            expected_included = not any(fnmatch_path(path, pattern) for pattern in exclude) and any(fnmatch_path(path, pattern) for pattern in include)
+            expected_ids = tuple(index for index, pattern in enumerate(sub_configs) if fnmatch_path(path, pattern))
+
+            classification = matcher.classify(path)
+            self.assertEqual(classification.included, expected_included, path)
+            self.assertEqual(classification.sub_config_ids, expected_ids, path)
+
+    def test_includes_everything_without_scheduler_profiles(self):
+        matcher = PathMatcher([], [], [])
+        self.assertTrue(all(matcher.classify(path).included for path in PATHS))
+
+    def test_memoizes_per_parent_directory(self):
+        matcher = PathMatcher(["**/to-post"], [], [])
+        matcher.classify("/pictures/to-post/image1.jpg")
+        matcher.classify("/pictures/to-post/image2.jpg")
+        matcher.classify("/pictures/other/image3.jpg")
+        self.assertEqual(len(matcher._cache), 2)
+
+    def test_account_compiles_profiles_and_sub_configs(self):
+        acc = account(config({"scheduler_profiles": {"regular": scheduler_profile()}}), ["regular"])
+        self.assertEqual(acc.path_matcher.classify("/pictures/to-post/image.jpg").included, True)
+        self.assertEqual(acc.path_matcher.classify("/pictures/nested/to-post/image.jpg").included, False)
+        self.assertEqual(acc.path_matcher.classify("./tests/fixtures/test/other/test.jpg").sub_config_ids, (0, 1))
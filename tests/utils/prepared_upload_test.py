@@ -0,0 +1,42 @@
+import builtins
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from factories.factories import account
+from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.prepared_upload import prepare_upload
+
+
+class TestPreparedUpload(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "image.jpg")
+        shutil.copy("tests/fixtures/test.jpg", self.path)
+
+        adjuster = ImageMetadataAdjuster(self.path)
+        adjuster.add_subject("some caption")
+        adjuster.set_content_tags("tag1, tag2")
+        adjuster.save()
+
+    def test_reads_the_file_once(self):
+        acc = account()
+        with patch("builtins.open", wraps=builtins.open) as mock_open:
+            upload = prepare_upload(self.path, acc)
+            upload.stripped_data
+            upload.content_hash
+        mock_open.assert_called_once_with(self.path, "rb")
+
+    def test_prepares_everything_the_clients_need(self):
+        upload = prepare_upload(self.path, account())
+
+        self.assertEqual((upload.caption, upload.content_tags), ("some caption", "tag1, tag2"))
+        self.assertEqual((upload.width, upload.height), (75, 75))
+        self.assertEqual(upload.display_resolution, 0)
+        self.assertEqual(upload.filename, "image.jpg")
+        self.assertEqual(len(upload.content_hash), 64)
+        self.assertIn(b"Exif", upload.data)
+        self.assertNotIn(b"Exif", upload.stripped_data)
@@ -0,0 +1,42 @@
+import random
+import unittest
+from collections import Counter
+
+from utils.random_utils import pick_random, sample_random
+
+
+class TestRandomUtils(unittest.TestCase):
+    def setUp(self):
+        self.random_state = random.getstate()
+
+    def tearDown(self):
+        random.setstate(self.random_state)
+
+    def test_returns_none_without_items(self):
+        self.assertIsNone(pick_random(iter([])))
+
+    def test_returns_the_only_item(self):
+        self.assertEqual(pick_random(iter(["a"])), "a")
+
+    def test_is_reproducible_when_seeded(self):
+        random.seed(42)
+        first = pick_random(iter(range(1000)))
+        random.seed(42)
+        self.assertEqual(pick_random(iter(range(1000))), first)
+
+    def test_picks_uniformly(self):
+        random.seed(1)
+        counts = Counter(pick_random(iter(range(4))) for _ in range(8000))
+        for item in range(4):
+            self.assertAlmostEqual(counts[item] / 8000, 0.25, delta=0.03)
+
+    def test_samples_up_to_count_items(self):
+        self.assertEqual(sorted(sample_random(iter(range(3)), 5)), [0, 1, 2])
+        sample = sample_random(iter(range(100)), 5)
+        self.assertEqual(len(set(sample)), 5)
+
+    def test_samples_uniformly(self):
+        random.seed(1)
+        counts = Counter(item for _ in range(4000) for item in sample_random(iter(range(4)), 2))
+        for item in range(4):
+            self.assertAlmostEqual(counts[item] / 4000, 0.5, delta=0.04)
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import requests_mock
+
+from clients.http_session import close_sessions, get_session
+from factories.factories import account
+from utils.rate_limit_ledger import RateLimitedError, RateLimitLedger, get_endpoint
+
+NOW = 1_700_000_000
+TWEETS_URL = "https://api.twitter.com/2/tweets"
+EDIT_URL = "https://www.deviantart.com/api/v1/oauth2/deviation/edit/0A1B2C3D-4E5F-6789-ABCD-EF0123456789"
+
+
+class FakeResponse:
+    def __init__(self, url, status_code=200, headers={}):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+
+
+class TestRateLimitLedger(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.now = NOW
+        self.ledger = RateLimitLedger(os.path.join(directory.name, "ledger.sqlite3"), clock=lambda: self.now)
+        self.addCleanup(self.ledger.close)
+
+    def test_fails_fast_when_an_endpoint_has_no_budget_left(self):
+        headers = {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(NOW + 600)}
+        self.ledger.record_response("my_account", FakeResponse(TWEETS_URL, 429, headers))
+
+        with self.assertRaises(RateLimitedError) as context:
+            self.ledger.check_url("my_account", TWEETS_URL)
+        self.assertEqual(context.exception.next_available_at, datetime.fromtimestamp(NOW + 600))
+        self.ledger.check_url("my_account", "https://upload.twitter.com/1.1/media/upload.json")
+        self.ledger.check_url("other_account", TWEETS_URL)
+
+    def test_blocks_the_platform_after_a_429_with_retry_after(self):
+        self.ledger.record_response("my_account", FakeResponse(EDIT_URL, 429, {"Retry-After": "120"}))
+
+        self.assertEqual(self.ledger.next_available_at("my_account", "Deviant"), datetime.fromtimestamp(NOW + 120))
+        with self.assertRaises(RateLimitedError):
+            self.ledger.check_url("my_account", "https://www.deviantart.com/api/v1/oauth2/stash/publish")
+
+    def test_has_budget_again_after_the_reset(self):
+        self.ledger.record_response("my_account", FakeResponse(TWEETS_URL, 200, {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(NOW + 10)}))
+        self.now += 11
+        self.assertIsNone(self.ledger.next_available_at("my_account", "Twitter"))
+
+    def test_tracks_the_24_hour_posting_limit_per_endpoint(self):
+        headers = {"x-rate-limit-remaining": "10", "x-rate-limit-reset": str(NOW + 60), "x-user-limit-24hour-remaining": "0", "x-user-limit-24hour-reset": str(NOW + 3600)}
+        self.ledger.record_response("my_account", FakeResponse(TWEETS_URL, 429, headers))
+
+        self.assertEqual(self.ledger.next_available_at("my_account", "Twitter", get_endpoint(TWEETS_URL)), datetime.fromtimestamp(NOW + 3600))
+
+    def test_shares_the_budget_of_endpoints_with_ids(self):
+        self.assertEqual(get_endpoint(EDIT_URL), "www.deviantart.com/api/v1/oauth2/deviation/edit/{id}")
+
+    def test_sessions_check_the_ledger_before_sending(self):
+        self.addCleanup(close_sessions)
+        self.ledger.record("my_account", "Twitter", get_endpoint(TWEETS_URL), 0, NOW + 600)
+
+        with patch("clients.http_session.get_rate_limit_ledger", return_value=self.ledger), requests_mock.Mocker() as req_mock:
+            tweet_mock = req_mock.post(TWEETS_URL, json={})
+            with self.assertRaises(RateLimitedError):
+                get_session(account()).post(TWEETS_URL)
+            self.assertEqual(tweet_mock.call_count, 0)
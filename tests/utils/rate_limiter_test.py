@@ -0,0 +1,60 @@
+import unittest
+from datetime import datetime, timezone
+
+from utils.rate_limiter import TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def bucket(self, rate, capacity=1):
+        return TokenBucket(rate, capacity=capacity, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_paces_requests_at_the_rate(self):
+        bucket = self.bucket(rate=2)
+        for _ in range(5):
+            bucket.acquire()
+        self.assertAlmostEqual(self.clock.now, 2.0)
+
+    def test_allows_bursts_up_to_the_capacity(self):
+        bucket = self.bucket(rate=1, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.now, 0)
+
+    def test_honours_retry_after_and_slows_down(self):
+        bucket = self.bucket(rate=2)
+        bucket.acquire()
+        bucket.on_rate_limited(retry_after=10)
+        bucket.acquire()
+
+        self.assertEqual(bucket.rate, 1)
+        self.assertAlmostEqual(self.clock.now, 10)
+
+    def test_recovers_towards_the_configured_rate(self):
+        bucket = self.bucket(rate=2)
+        bucket.on_rate_limited()
+        for _ in range(100):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 2)
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_parses_seconds_and_http_dates(self):
+        now = lambda: datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+        self.assertEqual(parse_retry_after("30"), 30)
+        self.assertEqual(parse_retry_after("Mon, 01 Jan 2024 12:00:45 GMT", now), 45)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
@@ -0,0 +1,75 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from factories.factories import account
+from models.account import RenditionProfile
+from utils.image_metadata_adjuster import ImageMetadataAdjuster
+from utils.prepared_upload import prepare_upload
+from utils.renditions import get_rendition, get_rendition_path, needs_rendition, prepare_platform_upload, render
+from warm_renditions import warm_renditions
+
+PROFILE = RenditionProfile({"max_dimension": 1920, "quality": 85})
+
+
+class TestRenditions(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.library = os.path.join(directory.name, "library")
+        self.cache_dir = os.path.join(directory.name, "cache")
+        os.mkdir(self.library)
+        os.mkdir(self.cache_dir)
+
+    def create_image(self, name, size=(2400, 1200), format="JPEG"):
+        path = os.path.join(self.library, name)
+        Image.new("RGB", size, color="red").save(path, format=format)
+        adjuster = ImageMetadataAdjuster(path)
+        adjuster.add_subject("some caption")
+        adjuster.save()
+        return path
+
+    def test_only_renders_images_that_do_not_fit_the_profile(self):
+        self.assertTrue(needs_rendition(2400, 1200, "JPEG", 1000, PROFILE))
+        self.assertTrue(needs_rendition(800, 600, "PNG", 1000, PROFILE))
+        self.assertTrue(needs_rendition(800, 600, "JPEG", 5000, RenditionProfile({"max_bytes": 1000})))
+        self.assertFalse(needs_rendition(1920, 1080, "JPEG", 1000, PROFILE))
+
+    def test_renders_within_the_profile(self):
+        with open(self.create_image("image.jpg"), "rb") as file:
+            rendition = Image.open(io.BytesIO(render(file, RenditionProfile({"max_dimension": 1000, "progressive": True}))))
+
+        self.assertEqual(rendition.size, (1000, 500))
+        self.assertTrue(rendition.info.get("progressive"))
+        self.assertNotIn("exif", rendition.info)
+
+    def test_caches_renditions_by_source_hash_and_profile(self):
+        upload = prepare_upload(self.create_image("image_DEVI_Q.png", format="PNG"), account())
+
+        rendition = get_rendition(upload, PROFILE, self.cache_dir)
+        self.assertEqual((rendition.width, rendition.height, rendition.format), (1920, 960, "JPEG"))
+        self.assertEqual((rendition.caption, rendition.filename), ("some caption", "image_DEVI_Q.jpg"))
+        self.assertTrue(os.path.exists(get_rendition_path(upload.content_hash, PROFILE, self.cache_dir)))
+
+        with patch("utils.renditions.render") as mock_render:
+            self.assertEqual(get_rendition(upload, PROFILE, self.cache_dir).data, rendition.data)
+            mock_render.assert_not_called()
+
+    def test_uploads_originals_without_a_platform_profile(self):
+        upload = prepare_upload(self.create_image("image.jpg"), account())
+        self.assertIs(prepare_platform_upload(account(), "Deviant", upload), upload)
+
+    def test_warms_the_renditions_of_queued_images(self):
+        queued = self.create_image("image_DEVI_Q.jpg")
+        self.create_image("other_DEVI_P.jpg")
+        acc = account({"directory_path": self.library, "platforms": ["Deviant"], "deviant": {"rendition": {"max_dimension": 1920, "quality": 85}}})
+
+        self.assertEqual(warm_renditions(acc, workers=1, cache_dir=self.cache_dir), 1)
+        self.assertEqual(warm_renditions(acc, workers=1, cache_dir=self.cache_dir), 0)
+        with patch("utils.renditions.render") as mock_render:
+            get_rendition(prepare_upload(queued, acc), PROFILE, self.cache_dir)
+            mock_render.assert_not_called()